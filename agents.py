@@ -6,88 +6,62 @@ from llm.deepseek_client import DeepSeekClient
 from llm.litellm_implementations import OllamaImplementation
 from config import get_config
 import logging
+import time
 
 logger = logging.getLogger(__name__)  # Ensure logger is defined if not already
 
+# Model clients the agents can talk through
+AGENT_MODEL_CLIENTS = {"ollama": OllamaImplementation, "deepseek": DeepSeekClient}
+
+
+def agent_model_client(model: str):
+    """Model client class for a model name such as "ollama/llama3" or "deepseek/deepseek-chat"
+
+    Raises:
+        ValueError: If no agent model client can serve the model
+    """
+    provider = (model or "").lower().split("/", 1)[0]
+    provider = "deepseek" if provider.startswith("deepseek") else provider  # "deepseek-chat" has no prefix
+    if provider not in AGENT_MODEL_CLIENTS:
+        raise ValueError(f"Model '{model}' cannot be used by the book agents; "
+                         f"use an ollama/ or deepseek/ model (e.g. ollama/llama3, deepseek/deepseek-chat)")
+    return AGENT_MODEL_CLIENTS[provider]
+
+
 class BookAgents:
-    def __init__(self, agent_config: Dict, outline: Optional[List[Dict]] = None, genre_config: Optional[Dict] = None):
-        """Initialize agents with book outline context and genre configuration"""
-        self.agent_config = self._prepare_autogen_config(agent_config)
+    def __init__(self, agent_config: Dict, outline: Optional[List[Dict]] = None, genre_config: Optional[Dict] = None,
+                 llm_config: Optional[Dict] = None):
+        """Initialize agents with book outline context and genre configuration
+
+        llm_config overrides the model settings from get_config(), e.g. for a
+        book in a batch that uses a different model.
+        """
+        self.agent_config = self._prepare_autogen_config(agent_config, llm_config)
         self.outline = outline
         self.genre_config = genre_config or {}
         self.world_elements = {}  # Track described locations/elements
         self.character_developments = {}  # Track character arcs
+        self._agents: Dict[str, autogen.ConversableAgent] = {}  # Registry: each agent is built once
+        self._prompt_args = ("", 0)
+        self.construction_times: Dict[str, float] = {}
 
-    def _prepare_autogen_config(self, config: Dict) -> Dict:
+    def _prepare_autogen_config(self, config: Dict, llm_config: Optional[Dict] = None) -> Dict:
         """Prepare configuration for autogen compatibility - DIRECT PATCHING ATTEMPT"""
         if hasattr(config, 'dict'):
             config = config.dict()
-        llm_config = get_config()
-
-        config_list = []
-
-        model_lower = llm_config.get("model", "").lower()
-
-        if "ollama" in model_lower:
-            config_list.append({
-                "model": llm_config.get("model"),
-                "base_url": llm_config.get("base_url"),
-                "api_key": llm_config.get("api_key"),
-                #"model_client_cls": "OllamaImplementation", # <-- REMOVE model_client_cls from config
-                "model_kwargs": {},
-            })
-
-            # Direct patching of autogen.oai.ChatCompletion.create for Ollama
-            original_create = autogen.oai.ChatCompletion.create # Store original create method
-
-            def patched_create(*args, **kwargs): # Define patched create method
-                logger.debug("Patched create function called")
-                logger.debug(f"Patched create args: {args}")
-                logger.debug(f"Patched create kwargs: {kwargs}")
-                logger.debug(f"Type of original_create: {type(original_create)}")
-
-                if "ollama" in kwargs.get("model", "").lower(): # Check if it's an Ollama model
-                    logger.debug("Ollama model detected in patched create")
-                    ollama_client = OllamaImplementation(config=llm_config) # Instantiate Ollama client DIRECTLY
-                    logger.debug("Calling ollama_client.create from patched_create")
-                    logger.debug(f"ollama_client.create args: {args}")
-                    logger.debug(f"ollama_client.create kwargs: {kwargs}")
-                    result = ollama_client.create(*args, **kwargs) # Use Ollama client's create method
-                    logger.debug("Returned from ollama_client.create in patched_create")
-                    logger.debug(f"Result from ollama_client.create: {result}")
-                    return result
-                else:
-                    logger.debug("Non-Ollama model in patched create - falling back to original create")
-                    if 'ollama_base_url' in kwargs:
-                        logger.warning("Unexpected 'ollama_base_url' in kwargs for non-Ollama model create call - about to call original_create")
-                    logger.debug("Calling original_create from patched_create")
-                    logger.debug(f"original_create args: {args}")
-                    logger.debug(f"original_create kwargs: {kwargs}")
-
-                    logger.debug("About to call ORIGINAL openai.ChatCompletion.create directly (within patched_create)") # ADDED: Log before calling original create
-                    if 'ollama_base_url' in kwargs: # Passing kwargs but EXCLUDING 'ollama_base_url' if present - defensive
-                        kwargs_for_original = {k: v for k, v in kwargs.items() if k != 'ollama_base_url'} # Create a copy without ollama_base_url
-                        logger.debug(f"Calling ORIGINAL openai.ChatCompletion.create with kwargs (excluding ollama_base_url): {kwargs_for_original}") # ADDED: Log kwargs for original create
-                        result = original_create(*args, **kwargs_for_original) # Call original create, excluding ollama_base_url
-                    else:
-                        logger.debug(f"Calling ORIGINAL openai.ChatCompletion.create with ALL kwargs: {kwargs}") # ADDED: Log kwargs for original create
-                        result = original_create(*args, **kwargs) # Fallback to original for other models
-                    logger.debug("Returned from ORIGINAL openai.ChatCompletion.create in patched_create") # ADDED: Log after original create call
-                    logger.debug(f"Result from original_create: {result}")
-                    return result
-
-            autogen.oai.ChatCompletion.create = patched_create # <--- APPLY THE PATCH: Override create method
-            logger.debug("autogen.oai.ChatCompletion.create patched successfully in _prepare_autogen_config")
-
-
-        else:  # DeepSeek configuration (as before)
-            config_list.append({
-                "model": "deepseek-chat",
-                "api_key": llm_config.get("api_key"),
-                "base_url": llm_config.get("base_url"),
-                "model_client_cls": "DeepSeekClient",
-                "model_kwargs": {},
-            })
+        llm_config = llm_config or get_config()
+        self._llm_config = llm_config  # Reused by create_agents instead of reloading settings
+
+        model = llm_config.get("model", "")
+        model_client_cls = agent_model_client(model)
+        config_list = [{
+            # DeepSeek's API takes the bare model name, e.g. "deepseek-reasoner"
+            "model": model if model_client_cls is OllamaImplementation else model.split("/")[-1],
+            "base_url": llm_config.get("base_url"),
+            "api_key": llm_config.get("api_key"),
+            "model_client_cls": model_client_cls.__name__,  # Registered in create_agents
+            "model_kwargs": {},
+        }]
 
         return {
             **config,
@@ -140,19 +114,12 @@ class BookAgents:
             ])
         return "\n".join(context_parts)
 
-    def create_agents(self, initial_prompt, num_chapters) -> Dict:
-        """Create and return all agents needed for book generation with specialized roles"""
+    def _system_messages(self, initial_prompt, num_chapters) -> Dict[str, str]:
+        """Render every agent's system message from the current outline, world and character context"""
         outline_context = self._format_outline_context()
 
-        logger.debug("Entering BookAgents.create_agents") # ADDED: Log entry to create_agents
-        logger.debug(f"Initial prompt: {initial_prompt}") # ADDED: Log initial_prompt
-        logger.debug(f"Number of chapters: {num_chapters}") # ADDED: Log num_chapters
-        logger.debug(f"Agent config: {self.agent_config}") # ADDED: Log agent_config
-
-        # Memory Keeper: Maintains story continuity and context
-        memory_keeper = autogen.AssistantAgent(
-            name="memory_keeper",
-            system_message=f"""You are the keeper of the story's continuity and context.
+        return {
+            "memory_keeper": f"""You are the keeper of the story's continuity and context.
             Your responsibilities:
             1. Track and summarize each chapter's key events, character developments, and world details.
             2. Monitor character development and relationships for consistency.
@@ -171,17 +138,7 @@ class BookAgents:
 
             Be concise and focus on the most important information for maintaining story coherence.
             """,
-            llm_config=self.agent_config,
-        )
-        if memory_keeper is None:
-            logger.error("Failed to create memory_keeper agent.")
-            return None
-        logger.debug("Created memory_keeper agent") # ADDED: Log after creation
-
-        # Story Planner - Focuses on high-level story structure
-        story_planner = autogen.AssistantAgent(
-            name="story_planner",
-            system_message=f"""You are an expert story arc planner focused on overall narrative structure and pacing.
+            "story_planner": f"""You are an expert story arc planner focused on overall narrative structure and pacing.
 
             Your sole responsibility is creating and refining the high-level story arc and ensuring effective pacing across the book.
             When given an initial story premise and outline:
@@ -209,18 +166,7 @@ class BookAgents:
             [Provide feedback on the chapter outlines in terms of how well they fit into the planned story arc and pacing. Suggest any adjustments needed to strengthen the overall narrative]
 
             Always provide specific, detailed content - never use placeholders. Focus on actionable feedback to improve story structure and pacing.""",
-            llm_config=self.agent_config,
-        )
-        if story_planner is None:
-            logger.error("Failed to create story_planner agent.")
-            return None
-        logger.debug("Created story_planner agent") # ADDED: Log after creation
-
-
-        # Outline Creator - Creates detailed chapter outlines
-        outline_creator = autogen.AssistantAgent(
-            name="outline_creator",
-            system_message=f"""You are an expert outline creator who generates detailed chapter outlines based on story premises and story arc plans.
+            "outline_creator": f"""You are an expert outline creator who generates detailed chapter outlines based on story premises and story arc plans.
 
             Generate a detailed {num_chapters}-chapter outline following a strict format.
 
@@ -260,17 +206,7 @@ class BookAgents:
 
             START WITH 'OUTLINE:' and clearly separate each chapter. END WITH 'END OF OUTLINE'.
             """,
-            llm_config=self.agent_config,
-        )
-        if outline_creator is None:
-            logger.error("Failed to create outline_creator agent.")
-            return None
-        logger.debug("Created outline_creator agent") # ADDED: Log after creation
-
-        # Setting Builder: Creates and maintains the story setting (Renamed and enhanced World Builder)
-        setting_builder = autogen.AssistantAgent(
-            name="setting_builder",
-            system_message=f"""You are an expert in setting and world-building, responsible for creating rich, consistent, and evolving settings that enhance the story.
+            "setting_builder": f"""You are an expert in setting and world-building, responsible for creating rich, consistent, and evolving settings that enhance the story.
 
             Your role is to establish ALL settings and world elements needed for the entire story and ensure they are dynamically integrated as the story progresses.
 
@@ -305,17 +241,7 @@ class BookAgents:
 
             Ensure every setting is vividly described and contributes meaningfully to the narrative.
             """,
-            llm_config=self.agent_config,
-        )
-        if setting_builder is None:
-            logger.error("Failed to create setting_builder agent.")
-            return None
-        logger.debug("Created setting_builder agent") # ADDED: Log after creation
-
-        # Character Agent: Develops and maintains character details (New Agent)
-        character_agent = autogen.AssistantAgent(
-            name="character_agent",
-            system_message=f"""You are the character development expert, responsible for creating and maintaining consistent, engaging, and evolving characters throughout the book.
+            "character_agent": f"""You are the character development expert, responsible for creating and maintaining consistent, engaging, and evolving characters throughout the book.
 
             Your role is to define and track all key characters, ensuring depth, consistency, and compelling arcs.
 
@@ -344,17 +270,7 @@ class BookAgents:
 
             Ensure each character is richly developed and their journey is compelling and consistent.
             """,
-            llm_config=self.agent_config,
-        )
-        if character_agent is None:
-            logger.error("Failed to create character_agent agent.")
-            return None
-        logger.debug("Created character_agent agent") # ADDED: Log after creation
-
-        # Plot Agent: Focuses on plot details and pacing within chapters (New Agent)
-        plot_agent = autogen.AssistantAgent(
-            name="plot_agent",
-            system_message=f"""You are the plot detail expert, responsible for ensuring each chapter's plot is engaging, well-paced, and contributes to the overall story arc.
+            "plot_agent": f"""You are the plot detail expert, responsible for ensuring each chapter's plot is engaging, well-paced, and contributes to the overall story arc.
 
             Your role is to refine chapter outlines to maximize plot effectiveness and pacing at the chapter level.
 
@@ -380,15 +296,7 @@ class BookAgents:
 
             Provide detailed, actionable feedback to strengthen chapter plots and pacing, ensuring each chapter is a compelling part of the overall narrative.
             """,
-            llm_config=self.agent_config,
-        )
-        if plot_agent is None:
-            logger.error("Failed to create plot_agent agent.")
-            return None
-        logger.debug("Created plot_agent agent") # ADDED: Log after creation
-
-        # Writer: Generates the actual prose
-        writer_message = f"""You are an expert creative writer who brings scenes to life with vivid prose, compelling characters, and engaging plots.
+            "writer": f"""You are an expert creative writer who brings scenes to life with vivid prose, compelling characters, and engaging plots.
 
         Book Context:
         {outline_context}
@@ -413,22 +321,8 @@ class BookAgents:
 
         Mark initial drafts with 'SCENE DRAFT:' and final, revised versions with 'SCENE FINAL:'.
 
-        {self._get_genre_style_instructions()}"""
-
-        writer = autogen.AssistantAgent(
-            name="writer",
-            system_message=writer_message,
-            llm_config=self.agent_config,
-        )
-        if writer is None:
-            logger.error("Failed to create writer agent.")
-            return None
-        logger.debug("Created writer agent") # ADDED: Log after creation
-
-        # Editor: Reviews and improves content
-        editor = autogen.AssistantAgent(
-            name="editor",
-            system_message=f"""You are an expert editor ensuring quality, consistency, and adherence to the book outline and style guidelines.
+        {self._get_genre_style_instructions()}""",
+            "editor": f"""You are an expert editor ensuring quality, consistency, and adherence to the book outline and style guidelines.
 
             Book Overview:
             {outline_context}
@@ -455,12 +349,124 @@ class BookAgents:
             3. Return the full edited chapter with 'EDITED_SCENE:' - clearly mark the final edited chapter content.
 
             Reference specific outline elements, style guidelines, and previous chapter feedback in your critiques and suggestions. Do not proceed to the next chapter until the current chapter is finalized and meets all quality and length requirements. Never ask to start the next chapter, as the next step is finalizing the current chapter.""",
+        }
+
+    def create_agents(self, initial_prompt, num_chapters) -> Dict:
+        """Create and return all agents needed for book generation with specialized roles
+
+        Agents are built once per BookAgents instance. Later calls re-render
+        their system messages for the given premise and chapter count and the
+        current context, and return the same agents.
+        """
+        self._prompt_args = (initial_prompt, num_chapters)
+        if self._agents:
+            self.refresh_context()
+            return dict(self._agents)
+
+        messages = self._system_messages(initial_prompt, num_chapters)
+        self._last_mark = time.perf_counter()
+
+        logger.debug("Entering BookAgents.create_agents") # ADDED: Log entry to create_agents
+        logger.debug(f"Initial prompt: {initial_prompt}") # ADDED: Log initial_prompt
+        logger.debug(f"Number of chapters: {num_chapters}") # ADDED: Log num_chapters
+        logger.debug(f"Agent config: {self.agent_config}") # ADDED: Log agent_config
+
+        # Memory Keeper: Maintains story continuity and context
+        memory_keeper = autogen.AssistantAgent(
+            name="memory_keeper",
+            system_message=messages["memory_keeper"],
+            llm_config=self.agent_config,
+        )
+        if memory_keeper is None:
+            logger.error("Failed to create memory_keeper agent.")
+            return None
+        logger.debug("Created memory_keeper agent") # ADDED: Log after creation
+        self._mark_built("memory_keeper")
+
+        # Story Planner - Focuses on high-level story structure
+        story_planner = autogen.AssistantAgent(
+            name="story_planner",
+            system_message=messages["story_planner"],
+            llm_config=self.agent_config,
+        )
+        if story_planner is None:
+            logger.error("Failed to create story_planner agent.")
+            return None
+        logger.debug("Created story_planner agent") # ADDED: Log after creation
+        self._mark_built("story_planner")
+
+
+        # Outline Creator - Creates detailed chapter outlines
+        outline_creator = autogen.AssistantAgent(
+            name="outline_creator",
+            system_message=messages["outline_creator"],
+            llm_config=self.agent_config,
+        )
+        if outline_creator is None:
+            logger.error("Failed to create outline_creator agent.")
+            return None
+        logger.debug("Created outline_creator agent") # ADDED: Log after creation
+        self._mark_built("outline_creator")
+
+        # Setting Builder: Creates and maintains the story setting (Renamed and enhanced World Builder)
+        setting_builder = autogen.AssistantAgent(
+            name="setting_builder",
+            system_message=messages["setting_builder"],
+            llm_config=self.agent_config,
+        )
+        if setting_builder is None:
+            logger.error("Failed to create setting_builder agent.")
+            return None
+        logger.debug("Created setting_builder agent") # ADDED: Log after creation
+        self._mark_built("setting_builder")
+
+        # Character Agent: Develops and maintains character details (New Agent)
+        character_agent = autogen.AssistantAgent(
+            name="character_agent",
+            system_message=messages["character_agent"],
+            llm_config=self.agent_config,
+        )
+        if character_agent is None:
+            logger.error("Failed to create character_agent agent.")
+            return None
+        logger.debug("Created character_agent agent") # ADDED: Log after creation
+        self._mark_built("character_agent")
+
+        # Plot Agent: Focuses on plot details and pacing within chapters (New Agent)
+        plot_agent = autogen.AssistantAgent(
+            name="plot_agent",
+            system_message=messages["plot_agent"],
+            llm_config=self.agent_config,
+        )
+        if plot_agent is None:
+            logger.error("Failed to create plot_agent agent.")
+            return None
+        logger.debug("Created plot_agent agent") # ADDED: Log after creation
+        self._mark_built("plot_agent")
+
+        # Writer: Generates the actual prose
+        writer = autogen.AssistantAgent(
+            name="writer",
+            system_message=messages["writer"],
+            llm_config=self.agent_config,
+        )
+        if writer is None:
+            logger.error("Failed to create writer agent.")
+            return None
+        logger.debug("Created writer agent") # ADDED: Log after creation
+        self._mark_built("writer")
+
+        # Editor: Reviews and improves content
+        editor = autogen.AssistantAgent(
+            name="editor",
+            system_message=messages["editor"],
             llm_config=self.agent_config,
         )
         if editor is None:
             logger.error("Failed to create editor agent.")
             return None
         logger.debug("Created editor agent") # ADDED: Log after creation
+        self._mark_built("editor")
 
         # User Proxy: Manages the interaction
         user_proxy = autogen.UserProxyAgent(
@@ -473,34 +479,37 @@ class BookAgents:
             logger.error("Failed to create user_proxy agent.")
             return None
         logger.debug("Created user_proxy agent") # ADDED: Log after creation
+        self._mark_built("user_proxy")
 
-        agent_list = [memory_keeper, story_planner, outline_creator, setting_builder, character_agent, plot_agent, writer, editor, user_proxy]  # List of agents
+        # Revision agent for the final pass; shares the writer's system message
+        writer_final = autogen.AssistantAgent(
+            name="writer_final",
+            system_message=messages["writer"],
+            llm_config=self.agent_config,
+        )
+        self._mark_built("writer_final")
 
-        llm_config = get_config()  # Get config again to access model info
+        agent_list = [memory_keeper, story_planner, outline_creator, setting_builder, character_agent, plot_agent, writer, editor, writer_final, user_proxy]  # List of agents
 
-        model_lower = llm_config.get("model", "").lower()  # Get model name again
+        llm_config = self._llm_config  # Loaded once in _prepare_autogen_config
 
         # Dynamically register model client based on LLM_MODEL
-        if "ollama" in model_lower:
-            model_client_cls = OllamaImplementation  # Use Ollama client for Ollama models
-        else:
-            model_client_cls = DeepSeekClient  # Default to DeepSeek for other models (or adjust as needed)
+        model_client_cls = agent_model_client(llm_config.get("model", ""))
 
         logger.debug(f"LLM Model class to be registered: {model_client_cls}") # ADDED: Log model client class
 
         for agent in agent_list:
             if isinstance(agent, autogen.AssistantAgent):
-                model_name_to_check = llm_config.get("model", "").lower() # Get model name for check
-                if "ollama" not in model_name_to_check: # Conditionally register client - skip for ollama
-                    print(f"Registering model client for agent: {agent.name if hasattr(agent, 'name') else agent.__class__.__name__}")
-                    agent.register_model_client(model_client_cls=model_client_cls)
-                else:
-                    print(f"Skipping model client registration for Ollama agent: {agent.name if hasattr(agent, 'name') else agent.__class__.__name__} - using direct patching") # Log skip for Ollama
-                    print(f"Skipping register_model_client for {agent.name if hasattr(agent, 'name') else agent.__class__.__name__} as it is not an AssistantAgent")
+                print(f"Registering model client for agent: {agent.name if hasattr(agent, 'name') else agent.__class__.__name__}")
+                agent.register_model_client(model_client_cls=model_client_cls)
             logger.debug(f"Agent {agent.name if hasattr(agent, 'name') else agent.__class__.__name__} llm_config after registration: {agent.llm_config}") # ADDED: Log agent llm_config after registration
 
+        self._mark_built("model_client_registration")
+
+        logger.info(f"Built agents in {sum(self.construction_times.values()):.3f}s")
+
         logger.debug("Exiting BookAgents.create_agents and returning agents dict") # ADDED: Log exit of create_agents
-        return {
+        self._agents = {
             "story_planner": story_planner,
             "setting_builder": setting_builder,  # Renamed and using setting_builder now
             "character_agent": character_agent,  # Added character_agent
@@ -509,7 +518,47 @@ class BookAgents:
             "writer": writer,
             "editor": editor,
             "user_proxy": user_proxy,
-            "outline_creator": outline_creator
+            "outline_creator": outline_creator,
+            "writer_final": writer_final
+        }
+        return dict(self._agents)
+
+    def _mark_built(self, name: str) -> None:
+        """Record time spent since the previous construction step"""
+        now = time.perf_counter()
+        self.construction_times[name] = now - self._last_mark
+        self._last_mark = now
+
+    def refresh_context(self) -> int:
+        """Re-render system messages whose outline, world or character context changed
+
+        Returns:
+            int: Number of agents whose system message was updated
+        """
+        if not self._agents:
+            return 0
+        messages = self._system_messages(*self._prompt_args)
+        messages["writer_final"] = messages["writer"]
+        refreshed = 0
+        for name, message in messages.items():
+            agent = self._agents[name]
+            if agent.system_message != message:
+                agent.update_system_message(message)
+                refreshed += 1
+        logger.debug(f"Refreshed context for {refreshed} agents")
+        return refreshed
+
+    def set_outline(self, outline: List[Dict]) -> None:
+        """Attach the book outline and refresh agents that embed it"""
+        self.outline = outline
+        self.refresh_context()
+
+    def startup_metrics(self) -> Dict:
+        """Agent construction timings for startup reporting"""
+        return {
+            "agents_built": len(self._agents),
+            "construction_seconds": round(sum(self.construction_times.values()), 4),
+            "per_step_seconds": {name: round(t, 4) for name, t in self.construction_times.items()},
         }
 
     def update_world_element(self, element_name: str, description: str) -> None:
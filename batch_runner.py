@@ -0,0 +1,232 @@
+"""Headless batch generation of many books from a JSONL manifest
+
+Each manifest line describes one book:
+
+    {"prompt": "...", "genre": "fantasy", "chapters": 12, "model": "ollama/llama3", "id": "optional-id"}
+
+Books run concurrently up to a global limit. They share the process-wide
+LLM rate limiter and outline cache, each write to their own run directory
+under the output root and the batch ends with a throughput summary.
+"""
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from llm.cancellation import GenerationCancelled
+from llm.rate_limiter import shared_rate_limiter
+from run_store import RunDirectory, new_run_id
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BookJob:
+    """One book requested by the manifest"""
+    book_id: str
+    prompt: str
+    genre: Optional[str] = None
+    chapters: Optional[int] = None
+    model: Optional[str] = None
+
+
+@dataclass
+class BookResult:
+    """Outcome of generating one book"""
+    book_id: str
+    status: str  # "completed", "partial", "cancelled" or "failed"
+    output_dir: str
+    chapters_requested: int = 0
+    chapters_written: int = 0
+    words: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    """Throughput across a batch run"""
+    results: List[BookResult] = field(default_factory=list)
+    wall_seconds: float = 0.0
+    concurrency: int = 1
+    rate_limit_wait_seconds: float = 0.0
+
+    @property
+    def chapters_written(self) -> int:
+        return sum(r.chapters_written for r in self.results)
+
+    @property
+    def words(self) -> int:
+        return sum(r.words for r in self.results)
+
+    def to_dict(self) -> Dict:
+        hours = self.wall_seconds / 3600 if self.wall_seconds else 0
+        return {
+            "books": len(self.results),
+            "completed": sum(r.status == "completed" for r in self.results),
+            "partial": sum(r.status == "partial" for r in self.results),
+            "failed": sum(r.status == "failed" for r in self.results),
+            "cancelled": sum(r.status == "cancelled" for r in self.results),
+            "chapters_written": self.chapters_written,
+            "words": self.words,
+            "wall_seconds": round(self.wall_seconds, 2),
+            "concurrency": self.concurrency,
+            "books_per_hour": round(len(self.results) / hours, 2) if hours else None,
+            "chapters_per_hour": round(self.chapters_written / hours, 2) if hours else None,
+            "words_per_minute": round(self.words / (self.wall_seconds / 60), 1) if self.wall_seconds else None,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 2),
+            "results": [asdict(r) for r in self.results],
+        }
+
+    def format(self) -> str:
+        data = self.to_dict()
+        lines = [
+            "=== Batch Summary ===",
+            f"Books: {data['books']} ({data['completed']} completed, {data['partial']} partial, "
+            f"{data['cancelled']} cancelled, {data['failed']} failed)",
+            f"Chapters written: {data['chapters_written']}, words: {data['words']}",
+            f"Wall time: {data['wall_seconds']}s at concurrency {data['concurrency']}",
+            f"Throughput: {data['books_per_hour']} books/hour, {data['chapters_per_hour']} chapters/hour, "
+            f"{data['words_per_minute']} words/minute",
+            f"Time waiting on the rate limiter: {data['rate_limit_wait_seconds']}s",
+        ]
+        lines.extend(f"  {r.book_id}: {r.status} ({r.chapters_written}/{r.chapters_requested} chapters)"
+                     + (f" - {r.error}" if r.error else "") for r in self.results)
+        return "\n".join(lines)
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:40] or "book"
+
+
+def load_manifest(path: str) -> List[BookJob]:
+    """Read book jobs from a JSONL manifest
+
+    Raises:
+        ValueError: If a line is not valid JSON, lacks a prompt, repeats an id
+            or names a model the book agents cannot use
+    """
+    from agents import agent_model_client
+
+    jobs = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            if not isinstance(entry, dict) or not str(entry.get("prompt", "")).strip():
+                raise ValueError(f"{path}:{line_number}: each entry needs a non-empty 'prompt'")
+            book_id = _slug(str(entry.get("id") or f"{len(jobs) + 1:04d}-{entry['prompt']}"))
+            if book_id in seen:
+                raise ValueError(f"{path}:{line_number}: duplicate book id '{book_id}'")
+            seen.add(book_id)
+            if entry.get("model"):
+                try:
+                    agent_model_client(entry["model"])
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_number}: {e}") from e
+            chapters = entry.get("chapters")
+            jobs.append(BookJob(
+                book_id=book_id,
+                prompt=entry["prompt"].strip(),
+                genre=entry.get("genre"),
+                chapters=int(chapters) if chapters is not None else None,
+                model=entry.get("model"),
+            ))
+    return jobs
+
+
+class BatchRunner:
+    """Generate the books of a manifest with a global concurrency limit"""
+
+    def __init__(self, settings, output_root: str, concurrency: int = 2,
+                 requests_per_minute: Optional[float] = None):
+        self.settings = settings
+        self.output_root = output_root
+        self.concurrency = max(1, concurrency)
+        if requests_per_minute:
+            shared_rate_limiter.configure(requests_per_minute, burst=self.concurrency)
+        os.makedirs(self.output_root, exist_ok=True)
+
+    def generate_book(self, job: BookJob, run: RunDirectory) -> None:
+        """Run the outline and chapter pipeline for one book"""
+        from agents import BookAgents
+        from book_generator import BookGenerator
+        from main import load_genre_config
+        from outline_generator import OutlineGenerator
+
+        num_chapters = job.chapters or self.settings.generation.max_chapters
+        llm_config = self.settings.get_llm_config(job.model)
+        book_agents = BookAgents(self.settings.llm, None, load_genre_config(job.genre), llm_config=llm_config)
+        agents = book_agents.create_agents(job.prompt, num_chapters)
+
+        outline_gen = OutlineGenerator(agents, self.settings.get_outline_llm_config(job.model), on_stream_chunk=None)
+        # Drafting waits for the whole outline; see main.py for why on_chapter is not used
+        outline = outline_gen.generate_outline(job.prompt, num_chapters)
+        if not outline:
+            raise RuntimeError("Outline generation failed")
+
+        book_agents.set_outline(outline)
+        generator = BookGenerator(agents, llm_config, outline,
+                                  planning_concurrency=self.settings.generation.planning_concurrency,
+                                  draft_sections=self.settings.generation.draft_sections,
+                                  scene_beats=self.settings.generation.scene_beats,
+                                  book_agents=book_agents, run=run)
+        generator.generate_book(outline)
+
+    def run_job(self, job: BookJob) -> BookResult:
+        """Generate one book, never raising so other books continue"""
+        chapters_requested = job.chapters or self.settings.generation.max_chapters
+        run = RunDirectory.create(self.output_root, new_run_id(job.book_id), metadata={
+            "book_id": job.book_id, "prompt": job.prompt, "genre": job.genre,
+            "model": job.model, "chapters": chapters_requested})
+        result = BookResult(job.book_id, "failed", run.path, chapters_requested=chapters_requested)
+        start = time.perf_counter()
+        print(f"[batch] Starting {job.book_id}")
+        cancelled = False
+        try:
+            self.generate_book(job, run)
+        except GenerationCancelled as e:
+            cancelled = True
+            result.error = f"cancelled: {e.reason}"
+        except Exception as e:
+            logger.exception(f"Book {job.book_id} failed")
+            result.error = str(e)
+        result.seconds = round(time.perf_counter() - start, 2)
+
+        for path in run.chapter_files():
+            result.chapters_written += 1
+            with open(path, "r", encoding="utf-8") as f:
+                result.words += len(f.read().split())
+        if cancelled:
+            result.status = "cancelled"
+        elif result.chapters_written >= result.chapters_requested:
+            result.status = "completed"
+        elif result.chapters_written:
+            result.status = "partial"
+        run.finish(result.status, chapters_written=result.chapters_written, words=result.words,
+                   seconds=result.seconds, error=result.error)
+        print(f"[batch] Finished {job.book_id}: {result.status} in {result.seconds}s")
+        return result
+
+    def run(self, jobs: List[BookJob]) -> BatchSummary:
+        """Generate all books and write summary.json to the output root"""
+        summary = BatchSummary(concurrency=self.concurrency)
+        wait_before = shared_rate_limiter.total_wait
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="book") as executor:
+            summary.results = list(executor.map(self.run_job, jobs))
+        summary.wall_seconds = time.perf_counter() - start
+        summary.rate_limit_wait_seconds = shared_rate_limiter.total_wait - wait_before
+
+        with open(os.path.join(self.output_root, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary.to_dict(), f, indent=2)
+        return summary
@@ -0,0 +1,64 @@
+"""Microbenchmark config access in the agent construction path
+
+Compares a fresh Settings() per call (the previous get_settings behaviour)
+with the cached process-wide instance, both for get_config() alone and for
+building all agents with BookAgents.
+
+Usage: python benchmarks/bench_config_access.py [--repeat 200]
+"""
+import argparse
+import logging
+import os
+import sys
+import timeit
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# A model must be configured for agent construction; a placeholder key is enough offline
+os.environ.setdefault("LLM__MODEL", "deepseek/deepseek-chat")
+os.environ.setdefault("LLM__DEEPSEEK_API_KEY", "sk-benchmark")
+os.environ.setdefault("MODEL", "deepseek/deepseek-chat")
+os.environ.setdefault("DEEPSEEK_API_KEY", "sk-benchmark")
+
+import config  # noqa: E402
+from config.settings import Settings, get_settings  # noqa: E402
+
+
+def build_agents():
+    from agents import BookAgents
+    BookAgents({"temperature": 0.7}).create_agents("premise", 10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    get_settings()  # Prime the cache
+    cases = [
+        ('get_config()', config.get_config, max(args.repeat * 10, 1)),
+        ('BookAgents + create_agents', build_agents, args.repeat),
+    ]
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull  # Agent registration prints per agent
+        try:
+            results = []
+            for label, func, number in cases:
+                func()  # Warm-up, including first imports
+                cached = timeit.timeit(func, number=number) / number
+                with patch('config.get_settings', Settings), patch('config.settings.get_settings', Settings):
+                    uncached = timeit.timeit(func, number=number) / number
+                results.append((label, uncached, cached))
+        finally:
+            sys.stdout = stdout
+
+    for label, uncached, cached in results:
+        print(f"{label}")
+        print(f"  fresh Settings() : {uncached * 1e6:10.1f} us")
+        print(f"  cached settings  : {cached * 1e6:10.1f} us  ({uncached / cached:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
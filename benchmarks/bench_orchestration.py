@@ -0,0 +1,69 @@
+"""Benchmark per-chapter orchestration overhead: GroupChatManager versus LocalTurnManager
+
+Agents reply instantly with canned text, so the measured time is orchestration
+only (manager construction, message routing and bookkeeping), no LLM calls.
+
+Usage: python benchmarks/bench_orchestration.py [--chapters 20] [--rounds 3]
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import autogen  # noqa: E402
+
+from turn_manager import LocalTurnManager  # noqa: E402
+
+# A manager config like the one BookGenerator passed; the client is built but never called
+MANAGER_LLM_CONFIG = {"config_list": [{"model": "gpt-4", "api_key": "sk-benchmark"}]}
+SCENE = "SCENE FINAL: " + " ".join(["word"] * 5000)
+
+
+def build_agents():
+    """user_proxy, story_planner and writer with instant canned replies"""
+    user_proxy = autogen.ConversableAgent("user_proxy", llm_config=False, human_input_mode="NEVER")
+    agents = [user_proxy]
+    for name, text in [("story_planner", "PLAN: Three beats."), ("writer", SCENE)]:
+        agent = autogen.ConversableAgent(name, llm_config=False, human_input_mode="NEVER")
+        agent.register_reply([autogen.Agent, None], lambda self, messages=None, sender=None, config=None, text=text: (True, text))
+        agents.append(agent)
+    return agents
+
+
+def run_group_chat(agents, rounds: int) -> float:
+    start = time.perf_counter()
+    groupchat = autogen.GroupChat(agents=agents, messages=[], max_round=rounds, speaker_selection_method="round_robin")
+    manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=MANAGER_LLM_CONFIG)
+    with contextlib.redirect_stdout(io.StringIO()):  # The manager echoes turns even when silent
+        agents[0].initiate_chat(manager, message="Chapter 1: Write it.", silent=True)
+    return time.perf_counter() - start
+
+
+def run_local(agents, rounds: int) -> float:
+    start = time.perf_counter()
+    LocalTurnManager(agents, max_round=rounds).run("Chapter 1: Write it.")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    agents = build_agents()
+    for label, runner in [('GroupChatManager', run_group_chat), ('LocalTurnManager', run_local)]:
+        runner(agents, args.rounds)  # Warm-up
+        times = sorted(runner(agents, args.rounds) for _ in range(args.chapters))
+        print(f"{label:17s}: median {times[len(times) // 2] * 1000:8.2f} ms/chapter, "
+              f"total {sum(times) * 1000:8.1f} ms for {args.chapters} chapters")
+
+
+if __name__ == '__main__':
+    main()
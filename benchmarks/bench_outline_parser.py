@@ -0,0 +1,65 @@
+"""Benchmark the line-oriented outline parser against the previous regex-per-field approach
+
+Usage: python benchmarks/bench_outline_parser.py [--chapters 50] [--repeat 20]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from outline_parser import parse_outline  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'outlines', 'canonical.txt')
+
+
+def legacy_parse(outline_content: str) -> int:
+    """The five-regex-per-section parser OutlineGenerator used before outline_parser"""
+    parsed = 0
+    for section in re.split(r'\nChapter \d+:', outline_content)[1:]:
+        title = re.search(r'Title: (.+?)(?=\nKey Events:|$)', section, re.IGNORECASE)
+        events = re.search(r'Key Events:\s*\n-(.+?)\n-(.+?)\n-(.+?)(?=\nCharacter Developments:|$)', section, re.DOTALL | re.IGNORECASE)
+        character = re.search(r'Character Developments: (.+?)(?=\nSetting:|$)', section, re.DOTALL | re.IGNORECASE)
+        setting = re.search(r'Setting: (.+?)(?=\nTone:|$)', section, re.DOTALL | re.IGNORECASE)
+        tone = re.search(r'Tone: (.+?)(?=\n\n|$)', section, re.DOTALL | re.IGNORECASE)
+        if all([title, events, character, setting, tone]):
+            parsed += 1
+    return parsed
+
+
+def build_outline(num_chapters: int) -> str:
+    """Repeat the canonical fixture chapters until num_chapters are present"""
+    with open(FIXTURE, 'r', encoding='utf-8') as f:
+        body = f.read().replace('OUTLINE:', '').replace('END OF OUTLINE', '').strip()
+    sections = re.split(r'\n(?=Chapter \d+:)', body)
+    chapters = []
+    for i in range(num_chapters):
+        section = re.sub(r'^Chapter \d+:', f'Chapter {i + 1}:', sections[i % len(sections)].strip())
+        chapters.append(section)
+    return 'OUTLINE:\n\n' + '\n\n'.join(chapters) + '\n\nEND OF OUTLINE'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chapters', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    outline = build_outline(args.chapters)
+    # A near-miss outline: one space of indentation breaks the legacy "\n-" event pattern
+    indented = outline.replace('\n- ', '\n - ')
+
+    for label, text in [('canonical', outline), ('indented bullets', indented)]:
+        legacy_time = timeit.timeit(lambda: legacy_parse(text), number=args.repeat) / args.repeat
+        new_time = timeit.timeit(lambda: parse_outline(text), number=args.repeat) / args.repeat
+        legacy_ok = legacy_parse(text)
+        new_ok = sum(c.is_complete for c in parse_outline(text))
+        print(f"{label} ({args.chapters} chapters, {len(text)} chars)")
+        print(f"  legacy regex : {legacy_time * 1000:8.2f} ms  {legacy_ok}/{args.chapters} chapters parsed")
+        print(f"  line parser  : {new_time * 1000:8.2f} ms  {new_ok}/{args.chapters} chapters parsed")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,94 @@
 """Main class for generating books using AutoGen with improved iteration control and new agents - now with status updates for UI"""
 import autogen
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import json
 import os
-import time
 import re
 import logging
+from config import get_settings
+from continuity_index import ContinuityIndex
+from run_store import RunDirectory
+from scene_beats import SceneBeatWriter, format_beats, parse_beats, plan_beats, read_beats, words_per_call
+from completion_policy import DEFAULT_POLICY, CompletionPolicy
+from quality_gate import QualityGate
+from chapter_pipeline import ChapterPipeline, PipelineCancelled, PipelineError, PipelineRun, PipelineStep, StepResult
+from llm.cancellation import CancellationToken, GenerationCancelled, shutdown_token
+from llm.deadline import deadline_scope
+from llm.reasoning import split_reasoning
+from transcript_window import TranscriptWindow
+from turn_manager import LocalTurnManager
 
 logger = logging.getLogger(__name__)
 
 class BookGenerator:
-    def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict, outline: List[Dict]):
-        """Initialize with outline to maintain chapter count context"""
+    PLANNING_STEPS = ("setting", "character", "plot")
+    REVISION_STEPS = ("scene_final", "confirmation")  # Redone when a finished chapter is rejected
+    # Senders each agent sees during the simplified retry chat; the planner only needs the task
+    RETRY_VISIBILITY = {"story_planner": {"user_proxy"}}
+
+    def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict, outline: List[Dict],
+                 planning_concurrency: int = 3, book_agents=None, run: Optional[RunDirectory] = None,
+                 cancel_token: Optional[CancellationToken] = None, timeouts=None, draft_sections: int = 1,
+                 scene_beats: bool = False, completion_policy: Optional[CompletionPolicy] = None):
+        """Initialize with outline to maintain chapter count context
+
+        book_agents is the BookAgents registry the agents came from; when given,
+        world and character updates are recorded there and refreshed into the
+        agents' system messages between chapters.
+
+        run is the run directory receiving chapters, transcripts and metrics;
+        by default a new one is created under GenerationSettings.output_dir.
+
+        cancel_token (the process shutdown token by default) stops generation
+        cooperatively; the interrupted chapter is checkpointed for resume.
+
+        timeouts (TimeoutSettings, from settings by default) bounds each
+        chapter's pipeline and each step within it, so a hung request fails
+        its step and the chapter falls back to the retry path.
+
+        draft_sections above 1 splits the scene draft, editor feedback and
+        final revision into that many sections and overlaps them: the editor
+        reviews section 1 while the writer drafts section 2.
+
+        scene_beats drafts each chapter as concurrent scene beats taken from
+        the PLOT output, sized to fit one completion, and stitches them; the
+        final revision is applied passage by passage. It replaces
+        draft_sections.
+
+        completion_policy decides which transcript artifacts a chapter needs
+        (DEFAULT_POLICY: the SCENE FINAL text and the chapter header; the
+        planning tags are optional).
+        """
         self.agents = agents
+        self.book_agents = book_agents
         self.agent_config = agent_config
-        self.output_dir = "book_output"
+        self.run = run or RunDirectory.create(get_settings().generation.output_dir)
+        self.output_dir = self.run.chapters_dir
+        self.cancel_token = cancel_token or shutdown_token
+        self.timeouts = timeouts or get_settings().timeouts
+        self.generation_settings = get_settings().generation
+        self._resume_steps: Dict[int, Dict[str, str]] = {}  # Chapter -> step outputs from a checkpoint
         self.chapters_memory = []  # Store chapter summaries
         self.max_iterations = 3
+        self.max_step_retries = 2  # Pipeline reruns from completed steps before the simplified retry
         self.outline = outline
-        os.makedirs(self.output_dir, exist_ok=True)
+        self.recent_summary_count = 3  # Summaries pasted verbatim; older chapters come from retrieval
+        self.retrieval_top_k = 5
+        self.planning_concurrency = planning_concurrency  # setting, character and plot fan out after PLAN
+        self.draft_sections = draft_sections
+        self.scene_beats = scene_beats
+        self.completion_policy = completion_policy or DEFAULT_POLICY
+        self.quality_gate = (QualityGate(min_words=self.generation_settings.min_chapter_length)
+                             if self.generation_settings.quality_gate else None)
+        self.beat_writer = SceneBeatWriter(planning_concurrency, self.cancel_token,
+                                           self.generation_settings.max_continuations)
+        self.step_timings: Dict[int, Dict[str, float]] = {}
+        self._writer_final = None
+        self.continuity_index = ContinuityIndex(os.path.join(self.run.path, "continuity_index"))
 
     def _clean_chapter_content(self, content: str) -> str:
         """Clean up chapter content while preserving meaningful text"""
+        content = split_reasoning(content)[0]
         content = re.sub(r'\(Chapter \d+.*?\)', '', content)
         content = content.replace('**', '')
         content = content.replace('__', '')
@@ -36,215 +104,301 @@ class BookGenerator:
                 f.write(f"Chapter {chapter['chapter_number']}: {chapter['title']}\n")
         logger.info(f"Generated table of contents at {toc_path}")
 
-    def initiate_group_chat(self) -> autogen.GroupChat:
-        """Create a new group chat for the agents including new specialized agents"""
-        outline_context = "\n".join([
-            f"\nChapter {ch['chapter_number']}: {ch['title']}\n{ch['prompt']}"
-            for ch in sorted(self.outline, key=lambda x: x['chapter_number'])
-        ])
+    def _get_writer_final(self) -> autogen.AssistantAgent:
+        """Build the revision agent once and reuse it for every chapter"""
+        if self._writer_final is None and "writer_final" in self.agents:
+            self._writer_final = self.agents["writer_final"]
+        if self._writer_final is None:
+            self._writer_final = autogen.AssistantAgent(
+                name="writer_final",
+                system_message=self.agents["writer"].system_message,
+                llm_config=self.agent_config
+            )
+        return self._writer_final
+
+    def _chapter_steps(self, chapter_number: int, brief: str = "") -> List[PipelineStep]:
+        """The nine documented chapter steps and the artifacts each one needs
+
+        Setting, character and plot depend only on the memory update and plan,
+        so they fan out concurrently; a local merge step fans them back in
+        before the writer runs. With scene beats the draft and the final
+        revision become local steps that make several beat-sized calls.
+        """
+        def confirm(artifacts: Dict[str, str]) -> str:
+            scene = artifacts["scene_final"].split("SCENE FINAL:", 1)[-1].strip()
+            if not scene:
+                raise ValueError(f"Chapter {chapter_number} has no SCENE FINAL text")
+            return (f"CONFIRMATION:\n**Confirmation:** Chapter {chapter_number} SCENE FINAL received "
+                    f"successfully ({len(scene.split())} words).")
+
+        steps = [
+            PipelineStep("memory_update", "memory_keeper", "MEMORY UPDATE",
+                         "Review previous chapters and the current outline. Summarize the context relevant to this chapter.",
+                         depends_on=("previous_context",)),
+            PipelineStep("plan", "story_planner", "PLAN",
+                         "Provide a detailed plan for this chapter, focusing on plot progression and pacing.",
+                         depends_on=("memory_update",)),
+            PipelineStep("setting", "setting_builder", "SETTING",
+                         "Detail the setting for this chapter, vivid and consistent with the established world.",
+                         depends_on=("memory_update", "plan")),
+            PipelineStep("character", "character_agent", "CHARACTER",
+                         "Outline specific character developments and actions for key characters in this chapter.",
+                         depends_on=("memory_update", "plan")),
+            PipelineStep("plot", "plot_agent", "PLOT",
+                         "Refine the chapter plot and pacing, focusing on key events and engagement.",
+                         depends_on=("memory_update", "plan")),
+            PipelineStep("planning_brief", "user_proxy", "WRITER BRIEF",
+                         "Merge the planning outputs.",
+                         depends_on=self.PLANNING_STEPS, run=self._merge_planning),
+            PipelineStep("scene", "writer", "SCENE DRAFT",
+                         f"Write a complete scene draft for Chapter {chapter_number} incorporating all elements above. "
+                         "Meet the minimum word count.",
+                         depends_on=("memory_update", "plan", "planning_brief"), sectioned=True,
+                         min_words=self.generation_settings.min_chapter_length),
+            PipelineStep("feedback", "editor", "FEEDBACK",
+                         "Review the draft for quality, consistency, outline alignment and length. Give specific revisions.",
+                         depends_on=("scene",), sectioned=True, precheck=self._review_draft),
+            PipelineStep("scene_final", "writer_final", "SCENE FINAL",
+                         f"Revise the draft using the editor feedback into the final text of Chapter {chapter_number}.",
+                         depends_on=("scene", "feedback"), sectioned=True,
+                         min_words=self.generation_settings.min_chapter_length),
+            PipelineStep("confirmation", "user_proxy", "CONFIRMATION",
+                         "Verify chapter completion.",
+                         depends_on=("scene_final",), run=confirm),
+        ]
+        return self._beat_steps(steps, chapter_number, brief) if self.scene_beats else steps
+
+    def _beat_steps(self, steps: List[PipelineStep], chapter_number: int, brief: str) -> List[PipelineStep]:
+        """Replace the single-call draft and revision with scene-beat steps"""
+        generation = self.generation_settings
+        max_words = words_per_call(generation.max_tokens)
+        writer, writer_final = self.agents["writer"], self._get_writer_final()
+
+        def context(artifacts: Dict[str, str]) -> str:
+            return "\n\n".join([brief] + [artifacts[name] for name in ("memory_update", "plan", "planning_brief")])
+
+        def split(artifacts: Dict[str, str]) -> str:
+            return format_beats(plan_beats(parse_beats(artifacts["plot"]), generation.max_chapter_length, max_words))
+
+        def draft(artifacts: Dict[str, str]) -> str:
+            scenes = self.beat_writer.draft(writer, read_beats(artifacts["beats"]), context(artifacts))
+            return "SCENE DRAFT:\n" + "\n\n".join(self.beat_writer.smooth(writer, scenes))
+
+        def revise(artifacts: Dict[str, str]) -> str:
+            text = artifacts["scene"].split("SCENE DRAFT:", 1)[-1].strip()
+            return "SCENE FINAL:\n" + self.beat_writer.revise(writer_final, text, artifacts["feedback"],
+                                                                context(artifacts), max_words)
+
+        plan_context = ("memory_update", "plan", "planning_brief")
+        replacements = {
+            "scene": [
+                PipelineStep("beats", "user_proxy", "SCENE BEATS", "Split the plot into scene beats.",
+                             depends_on=("plot",), run=split),
+                PipelineStep("scene", "writer", "SCENE DRAFT", f"Draft Chapter {chapter_number} scene by scene.",
+                             depends_on=plan_context + ("beats",), run=draft),
+            ],
+            "scene_final": [
+                PipelineStep("scene_final", "writer_final", "SCENE FINAL",
+                             f"Revise Chapter {chapter_number} passage by passage.",
+                             depends_on=plan_context + ("scene", "feedback"), run=revise),
+            ],
+        }
+        return [new for step in steps for new in replacements.get(step.name, [step])]
 
-        messages = [{
-            "role": "system",
-            "content": f"Complete Book Outline:\n{outline_context}"
-        }]
+    def _review_draft(self, artifacts: Dict[str, str], sections: int) -> Tuple[Optional[str], str]:
+        """Quality gate before the editor: local feedback for a clearly failing draft, else measurements"""
+        if self.quality_gate is None:
+            return None, ""
+        return self.quality_gate.precheck(artifacts["scene"], sections)
 
-        writer_final = autogen.AssistantAgent(
-            name="writer_final",
-            system_message=self.agents["writer"].system_message,
-            llm_config=self.agent_config
-        )
+    def _merge_planning(self, artifacts: Dict[str, str]) -> str:
+        """Fan-in: combine the tagged setting, character and plot outputs into one brief for the writer"""
+        sections = [artifacts[name].strip() for name in self.PLANNING_STEPS if artifacts.get(name, "").strip()]
+        return "WRITER BRIEF:\n" + "\n\n".join(sections)
 
-        return autogen.GroupChat(
-            agents=[
-                self.agents["user_proxy"],
-                self.agents["memory_keeper"],
-                self.agents["story_planner"],
-                self.agents["setting_builder"],
-                self.agents["character_agent"],
-                self.agents["plot_agent"],
-                self.agents["writer"],
-                self.agents["editor"],
-                writer_final
-            ],
-            messages=messages,
-            max_round=6,
-            speaker_selection_method="round_robin"
-        )
+    def _print_step(self, step: PipelineStep, result: StepResult) -> None:
+        """Status update for the UI as each step finishes"""
+        status = "done" if result.ok else f"FAILED ({result.error})"
+        print(f"  {step.agent} [{step.tag}]: {status} in {result.latency:.1f}s")
 
     def _get_sender(self, msg: Dict) -> str:
         """Helper to get sender from message regardless of format"""
         return msg.get("sender") or msg.get("name", "")
 
-    def _verify_chapter_complete(self, messages: List[Dict]) -> bool:
-        """Verify chapter completion by analyzing entire conversation context"""
-        logger.debug("Verifying chapter completion")
-        current_chapter = None
-        has_final_content = False
-        sequence_complete = {
-            'memory_update': False,
-            'plan': False,  # Plan from Story Planner (optional)
-            'setting': False,  # Setting from Setting Builder (optional)
-            'character': False,  # Character from Character Agent (optional)
-            'plot': False,  # Plot from Plot Agent (optional)
-            'scene': False,
-            'feedback': False,
-            'scene_final': False,
-            'confirmation': False
-        }
-
-        for msg in messages:
-            content = msg.get("content", "")
-            sender = self._get_sender(msg)
-
-            if not current_chapter:
-                num_match = re.search(r"Chapter (\d+):", content)
-                if num_match:
-                    current_chapter = int(num_match.group(1))
-
-            if "MEMORY UPDATE:" in content:
-                sequence_complete['memory_update'] = True
-            if "PLAN:" in content:
-                sequence_complete['plan'] = True  # Expecting plan tag (optional)
-            if "SETTING:" in content:
-                sequence_complete['setting'] = True  # Expecting setting tag (optional)
-            if "CHARACTER:" in content:
-                sequence_complete['character'] = True  # Expecting character tag (optional)
-            if "PLOT:" in content:
-                sequence_complete['plot'] = True  # Expecting plot tag (optional)
-            if "SCENE DRAFT:" in content or "SCENE:" in content:
-                sequence_complete['scene'] = True
-            if "FEEDBACK:" in content:
-                sequence_complete['feedback'] = True
-            if "SCENE FINAL:" in content and sender in ["writer_final", "writer"]:
-                sequence_complete['scene_final'] = True
-                has_final_content = True
-            if "**Confirmation:**" in content and "successfully" in content:
-                sequence_complete['confirmation'] = True
-
-            logger.debug(f"Sequence complete: {sequence_complete}")
-            logger.debug(f"Current chapter: {current_chapter}")
-            logger.debug(f"Has final content: {has_final_content}")
-
-        return all(sequence_complete.values()) and current_chapter and has_final_content
+    def _retrieval_query(self, prompt: str) -> str:
+        """Use the chapter's key events as the retrieval query, falling back to the whole prompt"""
+        match = re.search(r"Key Events:(.*?)(?:\n\s*(?:Character Developments|Setting|Tone):|$)", prompt, re.DOTALL | re.IGNORECASE)
+        if match and match.group(1).strip():
+            return match.group(1).strip()
+        return prompt
 
     def _prepare_chapter_context(self, chapter_number: int, prompt: str) -> str:
-        """Prepare context for chapter generation"""
+        """Prepare bounded context: the most recent summaries plus passages retrieved from earlier chapters"""
         if chapter_number == 1:
             return f"Initial Chapter\nRequirements:\n{prompt}"
 
+        first_recent = max(0, len(self.chapters_memory) - self.recent_summary_count)
         context_parts = [
             "Previous Chapter Summaries:",
-            *[f"Chapter {i+1}: {summary}" for i, summary in enumerate(self.chapters_memory)],
+            *[f"Chapter {i}: {summary}" for i, summary in enumerate(self.chapters_memory[first_recent:], first_recent + 1)]
+        ]
+
+        passages = self.continuity_index.search(
+            self._retrieval_query(prompt),
+            top_k=self.retrieval_top_k,
+            before_chapter=chapter_number
+        )
+        if passages:
+            logger.debug(f"Retrieved {len(passages)} continuity passages for chapter {chapter_number}")
+            context_parts.append("\nRelevant Passages from Earlier Chapters:")
+            context_parts.extend(f"[Chapter {p['chapter_number']}] {p['text']}" for p in passages)
+
+        context_parts.extend([
             "\nCurrent Chapter Requirements:",
             prompt
-        ]
+        ])
         return "\n".join(context_parts)
 
     def generate_chapter(self, chapter_number: int, prompt: str) -> None:
-        """Generate a single chapter with completion verification, incorporating new agents in the flow - WITH STATUS UPDATES"""
+        """Generate a single chapter with completion verification, incorporating new agents in the flow - WITH STATUS UPDATES
+
+        When a step fails, or the finished chapter is rejected, the pipeline
+        runs again from the outputs that did succeed, so only the failed step
+        and the steps after it are repeated. The simplified retry is the last
+        resort.
+        """
         logger.info(f"Generating Chapter {chapter_number}")
         logger.debug(f"Chapter prompt: {prompt[:200]}...")
 
+        reusable: Dict[str, str] = {}
         try:
-            groupchat = self.initiate_group_chat()
-            manager = autogen.GroupChatManager(
-                groupchat=groupchat,
-                llm_config=self.agent_config
-            )
-
+            title = self.outline[chapter_number - 1]['title']
             context = self._prepare_chapter_context(chapter_number, prompt)
-            chapter_prompt = f"""
-            IMPORTANT: This is Chapter {chapter_number}. Focus ONLY on this chapter. Do not proceed to the next chapter until explicitly instructed.
-            IMPORTANT: Wait for confirmation after each agent's step before proceeding to the next.
-
-            Current Task: Generate Chapter {chapter_number} content only, following a detailed, step-by-step process.
-
-            Chapter Outline:
-            Title: {self.outline[chapter_number - 1]['title']}
-
-            Chapter Requirements:
-            {prompt}
-
-            Previous Context for Reference:
-            {context}
-
-            Follow this strict sequence for generating Chapter {chapter_number}:
-
-            1. Memory Keeper: Review previous chapters and current outline. Provide a MEMORY UPDATE summarizing relevant context for this chapter. (Tag: MEMORY UPDATE)
-            2. Story Planner: Based on the chapter outline and overall story arc, provide a detailed PLAN for this chapter, focusing on plot progression and pacing. (Tag: PLAN)
-            3. Setting Builder: Detail the SETTING for this chapter, ensuring it is vivid and consistent with the world-building. (Tag: SETTING)
-            4. Character Agent: Outline specific CHARACTER developments and actions for key characters within this chapter, maintaining character arcs. (Tag: CHARACTER)
-            5. Plot Agent: Refine the CHAPTER PLOT and pacing for this chapter based on the outline and overall story arc, focusing on key events and engagement. (Tag: PLOT)
-            6. Writer: Based on ALL preceding plans and outlines, write a complete SCENE DRAFT for Chapter {chapter_number}. Ensure it meets the minimum word count and incorporates all elements. (Tag: SCENE DRAFT)
-            7. Editor: Review the SCENE DRAFT for quality, consistency, outline alignment, and length. Provide FEEDBACK and suggest revisions, or approve if satisfactory. (Tag: FEEDBACK)
-            8. Writer Final: Revise the scene based on editor feedback to create the SCENE FINAL for Chapter {chapter_number}. (Tag: SCENE FINAL)
-            9. User Proxy: CONFIRMATION: Verify chapter completion, quality, and length. Proceed to the next chapter only upon explicit confirmation of successful finalization of Chapter {chapter_number}. (Tag: CONFIRMATION)
-
-            Wait for each step to be confirmed before proceeding to the next agent. Ensure each agent completes their tagged output before moving forward."""
-
-            print(f"\nGenerating Chapter {chapter_number}: {self.outline[chapter_number - 1]['title']}")  # Status update - Chapter start
-
-            print(f"  1. Memory Keeper: Preparing context...")  # Status update - Memory Keeper start
-            logger.info(f"Chapter prompt: {chapter_prompt}")  # Log the full prompt
-            self.agents["user_proxy"].initiate_chat(
-                manager,
-                message=chapter_prompt,
-                silent=True  # Silence default autogen output to avoid duplicate prints
-            )
-            print(f"  1. Memory Keeper: Context provided.")  # Status update - Memory Keeper end
-
-            # Log all messages after initiate_chat
-            logger.info(f"All messages in groupchat: {groupchat.messages}")
-
-            if not self._verify_chapter_complete(groupchat.messages):
-                logger.debug(f"Chapter {chapter_number} verification failed")
-                raise ValueError(f"Chapter {chapter_number} generation incomplete")
-
-            print(f"  2. Story Planner: Chapter plan...")  # Status update - Story Planner start (if included)
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  3. Setting Builder: Defining settings...")  # Status update - Setting Builder start (if included)
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  4. Character Agent: Character development...")  # Status update - Character Agent start (if included)
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  5. Plot Agent: Refining plot...")  # Status update - Plot Agent start (if included)
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  6. Writer: Writing scene draft...")  # Status update - Writer start
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  7. Editor: Reviewing draft...")  # Status update - Editor start
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  8. Writer Final: Revision and finalization...")  # Status update - Writer Final start
-            # No specific agent call here as it's part of the group chat flow
-
-            print(f"  9. User Proxy: Final confirmation...")  # Status update - User Proxy start
-            # No specific agent call here as it's part of the group chat flow
-
-            self._process_chapter_results(chapter_number, groupchat.messages)
-
-            # Log extracted content before saving
-            final_content = self._extract_final_scene(groupchat.messages)
-            logger.info(f"Extracted content for chapter {chapter_number}: {final_content[:500]}...")
-
-            chapter_file = os.path.join(self.output_dir, f"chapter_{chapter_number:02d}.txt")
-            if not os.path.exists(chapter_file):
-                logger.debug(f"Chapter file missing: {chapter_file}")
-                raise FileNotFoundError(f"Chapter {chapter_number} file not created")
-
-            completion_msg = f"Chapter {chapter_number} is complete. Proceed with next chapter."
-            self.agents["user_proxy"].send(completion_msg, manager, silent=True)  # Silence proxy send message
-
-            print(f"Chapter {chapter_number}: {self.outline[chapter_number - 1]['title']} - GENERATION COMPLETE")  # Status update - Chapter complete
-
+            brief = f"""Chapter {chapter_number}: {title}
+Focus ONLY on this chapter.
+
+Chapter Requirements:
+{prompt}"""
+
+            print(f"\nGenerating Chapter {chapter_number}: {title}")  # Status update - Chapter start
+            logger.info(f"Chapter brief: {brief}")
+
+            agents = {**self.agents, "writer_final": self._get_writer_final()}
+            pipeline = ChapterPipeline(agents, self._chapter_steps(chapter_number, brief),
+                                       max_workers=self.planning_concurrency, on_step=self._print_step,
+                                       cancel_token=self.cancel_token, step_timeouts=self.timeouts.agents,
+                                       sections=1 if self.scene_beats else self.draft_sections,
+                                       max_continuations=self.generation_settings.max_continuations)
+            reusable = self._resume_steps.pop(chapter_number, None) or {}
+            for attempt in range(self.max_step_retries + 1):
+                pipeline_run = None
+                try:
+                    # Each attempt gets a fresh chapter budget; a hung step must not starve its retry
+                    with deadline_scope(self.timeouts.chapter_budget, label=f"chapter {chapter_number}"):
+                        pipeline_run = pipeline.run(brief, {"previous_context": context}, completed=reusable)
+                    self._finish_chapter(chapter_number, title, pipeline_run)
+                    return
+                except (PipelineCancelled, GenerationCancelled):
+                    raise
+                except Exception as e:
+                    failed_run = e.run if isinstance(e, PipelineError) else pipeline_run
+                    if failed_run is None:
+                        raise
+                    reusable = self._reusable_steps(failed_run, getattr(e, "step", None))
+                    logger.warning(f"Chapter {chapter_number} attempt {attempt + 1} failed: {e}. "
+                                   f"Reusing {', '.join(reusable) or 'no steps'}")
+            raise RuntimeError(f"Chapter {chapter_number} failed after {self.max_step_retries + 1} attempts")
+
+        except PipelineCancelled as e:
+            self._write_checkpoint(chapter_number, e.reason, e.run)
+            raise GenerationCancelled(e.reason) from e
+        except GenerationCancelled as e:
+            self._write_checkpoint(chapter_number, e.reason)
+            raise
         except Exception as e:
             logger.error(f"Error in chapter {chapter_number}: {str(e)}")
             logger.exception("Full stack trace:")
             logger.debug(f"Chapter {chapter_number} error context: {prompt[:200]}...")
-            self._handle_chapter_generation_failure(chapter_number, prompt)
+            self._handle_chapter_generation_failure(chapter_number, prompt, reusable)
+
+    def _reusable_steps(self, pipeline_run: PipelineRun, failed_step: Optional[str] = None) -> Dict[str, str]:
+        """Outputs of a failed run worth keeping for the next attempt
+
+        A failed step left no output, so every completed step is kept. When
+        the confirmation fails, or the run finished but its chapter was
+        rejected, the final text is what failed: it and the confirmation are
+        dropped.
+        """
+        reusable = dict(pipeline_run.completed)
+        if failed_step is None or failed_step in self.REVISION_STEPS:
+            for name in self.REVISION_STEPS:
+                reusable.pop(name, None)
+        return reusable
+
+    def _finish_chapter(self, chapter_number: int, title: str, pipeline_run: PipelineRun) -> None:
+        """Record a finished run, then verify and save its chapter
+
+        Raises:
+            ValueError: If the transcript fails the completion policy
+            FileNotFoundError: If the chapter was not saved
+        """
+        report = self.completion_policy.evaluate(pipeline_run.messages, chapter_number)
+        self.step_timings[chapter_number] = pipeline_run.timings
+        self.run.write_transcript(f"chapter_{chapter_number:02d}", pipeline_run.messages)
+        reasoning = [{"role": "assistant", "name": result.sender, "content": result.reasoning}
+                     for result in pipeline_run.results.values() if result.reasoning]
+        if reasoning:  # Kept beside the transcript, never sent on to other agents
+            self.run.write_transcript(f"chapter_{chapter_number:02d}.reasoning", reasoning)
+        self.run.write_metrics(f"chapter_{chapter_number:02d}", {
+            "completion": report.to_dict(),
+            "step_timings": pipeline_run.timings, "elapsed": pipeline_run.elapsed,
+            "continuations": {name: result.continuations for name, result in pipeline_run.results.items()
+                              if result.continuations},
+            "reused_steps": [name for name, result in pipeline_run.results.items() if result.resumed],
+            "prechecked_steps": [name for name, result in pipeline_run.results.items() if result.prechecked],
+            "reasoning_chars": {name: len(result.reasoning) for name, result in pipeline_run.results.items()
+                                if result.reasoning},
+            "concurrency_savings": pipeline_run.concurrency_savings()})
+        logger.info(f"Chapter {chapter_number} step timings: "
+                    + ", ".join(f"{name}={latency:.2f}s" for name, latency in pipeline_run.timings.items())
+                    + f" (total {pipeline_run.elapsed:.2f}s, {pipeline_run.concurrency_savings():.2f}s saved by overlapping steps)")
+
+        logger.info(f"Chapter {chapter_number} completion check: {report.summary()}")
+        if not report.passed:
+            raise ValueError(f"Chapter {chapter_number} generation incomplete: {report.summary()}")
+
+        self._process_chapter_results(chapter_number, pipeline_run.messages)
+
+        # Log extracted content before saving
+        final_content = self._extract_final_scene(pipeline_run.messages)
+        logger.info(f"Extracted content for chapter {chapter_number}: {final_content[:500]}...")
+
+        chapter_file = os.path.join(self.output_dir, f"chapter_{chapter_number:02d}.txt")
+        if not os.path.exists(chapter_file):
+            logger.debug(f"Chapter file missing: {chapter_file}")
+            raise FileNotFoundError(f"Chapter {chapter_number} file not created")
+
+        print(f"Chapter {chapter_number}: {title} - GENERATION COMPLETE")  # Status update - Chapter complete
+
+    def _write_checkpoint(self, chapter_number: int, reason: str, pipeline_run: Optional[PipelineRun] = None) -> None:
+        """Flush the interrupted chapter's transcript and step ledger and record where to resume"""
+        completed, partial = {}, {}
+        if pipeline_run is not None:
+            completed, partial = pipeline_run.completed, pipeline_run.partial
+            name = f"chapter_{chapter_number:02d}.partial"
+            messages = pipeline_run.messages + [
+                {"role": "assistant", "name": pipeline_run.results[step].sender, "content": text, "partial": True}
+                for step, text in partial.items()]
+            self.run.write_transcript(name, messages)
+            self.run.write_metrics(name, {
+                "elapsed": pipeline_run.elapsed,
+                "steps": {step: {"latency": result.latency, "bytes_sent": result.bytes_sent,
+                                 "status": "resumed" if result.resumed else "cancelled" if result.cancelled
+                                 else "timed_out" if result.timed_out else "done" if result.ok else "failed"}
+                          for step, result in pipeline_run.results.items()}})
+        self.run.write_checkpoint({"chapter_number": chapter_number, "reason": reason,
+                                   "completed_steps": completed, "partial_steps": partial})
+        logger.warning(f"Checkpointed chapter {chapter_number} with {len(completed)} completed step(s)")
 
     def _extract_final_scene(self, messages: List[Dict]) -> Optional[str]:
         """Extract chapter content with improved content detection"""
@@ -284,36 +438,34 @@ class BookGenerator:
 
         return None
 
-    def _handle_chapter_generation_failure(self, chapter_number: int, prompt: str) -> None:
-        """Handle failed chapter generation with simplified retry"""
+    def _handle_chapter_generation_failure(self, chapter_number: int, prompt: str,
+                                           reusable: Optional[Dict[str, str]] = None) -> None:
+        """Handle failed chapter generation with simplified retry
+
+        Planning outputs that succeeded earlier (reusable) are passed to the
+        retry instead of being produced again.
+
+        Raises:
+            ValueError: If the retry transcript fails the completion policy
+        """
         logger.warning(f"Attempting simplified retry for Chapter {chapter_number}")
 
         try:
-            retry_groupchat = autogen.GroupChat(
-                agents=[
-                    self.agents["user_proxy"],
-                    self.agents["story_planner"],
-                    self.agents["writer"]
-                ],
-                messages=[],
-                max_round=3
-            )
-
-            manager = autogen.GroupChatManager(
-                groupchat=retry_groupchat,
-                llm_config=self.agent_config
-            )
+            retry_agents = [
+                self.agents["user_proxy"],
+                self.agents["story_planner"],
+                self.agents["writer"]
+            ]
 
-            # Exclude ollama_base_url from retry config to avoid TypeError - Hypothesis 1 Fix
-            retry_llm_config = {k: v for k, v in self.agent_config.items() if k != 'ollama_base_url'}
+            notes = "\n\n".join(reusable[name] for name in ("memory_update", "plan", "planning_brief")
+                                 if (reusable or {}).get(name))
+            if notes:
+                notes = f"\nEarlier planning for this chapter (reuse it rather than starting over):\n{notes}\n"
 
             retry_prompt = f"""Emergency chapter generation for Chapter {chapter_number}.
 
 {prompt}
-
-Retry LLM Config (no ollama_base_url):
-{retry_llm_config}
-
+{notes}
 Please generate this chapter in two steps:
 1. Story Planner: Create a basic outline (tag: PLAN)
 2. Writer: Write the complete chapter (tag: SCENE FINAL)
@@ -321,15 +473,21 @@ Please generate this chapter in two steps:
 Keep it simple and direct."""
 
             logger.debug(f"Retry Prompt for Chapter {chapter_number}: {retry_prompt}") # ADDED: Log retry_prompt
-            logger.debug(f"Retry LLM Config for Chapter {chapter_number}: {retry_llm_config}") # ADDED: Log retry_llm_config
 
-            self.agents["user_proxy"].initiate_chat(
-                manager,
-                llm_config=retry_llm_config, # Use modified config WITHOUT ollama_base_url - Hypothesis 1 Fix
-                message=retry_prompt
-            )
-
-            self._process_chapter_results(chapter_number, retry_groupchat.messages)
+            # Round-robin turns are driven locally; no LLM-backed GroupChatManager is needed
+            window = TranscriptWindow(self.RETRY_VISIBILITY)
+            turn_manager = LocalTurnManager(retry_agents, max_round=3, window=window)
+            retry_budget = self.timeouts.for_agent("story_planner") + self.timeouts.for_agent("writer")
+            with deadline_scope(retry_budget, label=f"chapter {chapter_number} retry"):
+                messages = turn_manager.run(retry_prompt)
+            self.run.write_transcript(f"chapter_{chapter_number:02d}_retry", messages)
+            logger.info(f"Retry transcript for Chapter {chapter_number}:\n{window.report()}")
+            report = self.completion_policy.evaluate(messages, chapter_number)
+            logger.info(f"Chapter {chapter_number} retry completion check: {report.summary()}")
+            if not report.passed:
+                raise ValueError(f"Chapter {chapter_number} generation incomplete: {report.summary()}")
+
+            self._process_chapter_results(chapter_number, messages)
 
         except Exception as e:
             logger.error(f"Error in retry attempt for Chapter {chapter_number}: {str(e)}")
@@ -337,8 +495,14 @@ Keep it simple and direct."""
             raise
 
     def _process_chapter_results(self, chapter_number: int, messages: List[Dict]) -> None:
-        """Process and save chapter results, updating memory - now also extracts character/world updates"""
+        """Save the chapter, then update memory - now also extracts character/world updates
+
+        Memory, world and character updates are applied only after the chapter
+        was saved, so a rejected chapter leaves nothing behind for its retry.
+        """
         try:
+            self._save_chapter(chapter_number, messages)
+
             memory_updates = []
             world_updates = []  # Capture world updates
             character_updates = []  # Capture character updates
@@ -377,7 +541,8 @@ Keep it simple and direct."""
                     if world_name_match and desc_match:
                         world_name = world_name_match.group(1).strip()
                         description = desc_match.group(1).strip()
-                        self.agents["setting_builder"].update_world_element(world_name, description)  # Use setting_builder to update
+                        if self.book_agents is not None:
+                            self.book_agents.update_world_element(world_name, description)
                         logger.info(f"Updated world element '{world_name}': {description[:50]}...")
 
             # Process character updates
@@ -388,10 +553,12 @@ Keep it simple and direct."""
                     if char_name_match and dev_match:
                         char_name = char_name_match.group(1).strip()
                         development = dev_match.group(1).strip()
-                        self.agents["character_agent"].update_character_development(char_name, development)  # Use character_agent to update
+                        if self.book_agents is not None:
+                            self.book_agents.update_character_development(char_name, development)
                         logger.info(f"Updated character '{char_name}' development: {development[:50]}...")
 
-            self._save_chapter(chapter_number, messages)
+            if self.book_agents is not None and (world_updates or character_updates):
+                self.book_agents.refresh_context()
 
         except Exception as e:
             logger.error(f"Error processing chapter results: {str(e)}")
@@ -463,20 +630,46 @@ Keep it simple and direct."""
 
             logger.info(f"Saved chapter to: {filename}")
 
+            self.continuity_index.add_chapter(chapter_number, final_content)
+
         except Exception as e:
             logger.error(f"Error saving chapter: {str(e)}")
             raise
 
-    def generate_book(self, outline: List[Dict]) -> None:
-        """Generate the book with strict chapter sequencing and verification"""
+    def generate_book(self, outline: List[Dict], resume: bool = False) -> None:
+        """Generate the book with strict chapter sequencing and verification
+
+        Args:
+            outline: Chapters to generate
+            resume: Skip chapters already saved in the run and reuse the completed
+                steps recorded in its checkpoint
+
+        Raises:
+            GenerationCancelled: If cancellation was requested; a checkpoint has been written
+        """
         logger.info("Starting book generation")
         logger.info(f"Total chapters: {len(outline)}")
+        checkpoint = self.run.read_checkpoint() if resume else None
+        if checkpoint:
+            self._resume_steps[checkpoint["chapter_number"]] = checkpoint.get("completed_steps", {})
+            logger.info(f"Resuming chapter {checkpoint['chapter_number']} with "
+                        f"{len(self._resume_steps[checkpoint['chapter_number']])} completed step(s)")
 
         sorted_outline = sorted(outline, key=lambda x: x["chapter_number"])
         self._generate_table_of_contents()
+        with open(os.path.join(self.output_dir, "outline.json"), "w", encoding="utf-8") as f:
+            json.dump(sorted_outline, f, indent=2)
+        self.run.update_manifest(chapters_planned=len(sorted_outline))
 
         for chapter in sorted_outline:
             chapter_number = chapter["chapter_number"]
+            if self.cancel_token.cancelled:
+                self._write_checkpoint(chapter_number, self.cancel_token.reason)
+                raise GenerationCancelled(self.cancel_token.reason)
+
+            if resume and os.path.exists(self.run.chapter_path(chapter_number)):
+                logger.info(f"Chapter {chapter_number} already saved; skipping")
+                continue
 
             if chapter_number > 1:
                 prev_file = os.path.join(self.output_dir, f"chapter_{chapter_number-1:02d}.txt")
@@ -505,7 +698,11 @@ Keep it simple and direct."""
                     break
 
             logger.info(f"Chapter {chapter_number} complete")
-            time.sleep(5)
+            self.run.update_manifest(chapters_completed=chapter_number)
+            if chapter is not sorted_outline[-1]:
+                self.cancel_token.wait(5)  # Pause between chapters; wakes at once on cancellation
+        else:
+            self.run.clear_checkpoint()  # Only once every outlined chapter is saved; a stop keeps it for resume
 
     def _verify_chapter_content(self, messages: List[Dict], chapter_number: int) -> bool:
         """Verify chapter content is valid"""
@@ -0,0 +1,417 @@
+"""Deterministic step executor for chapter generation
+
+Each step names the artifacts it depends on and only those artifacts are sent
+to its agent. Steps whose dependencies are satisfied together run as a wave;
+waves with more than one step run concurrently. Cancellation is checked
+before every wave; a cancelled run keeps completed steps and partial text so
+it can be resumed. Each step runs under its agent's deadline, nested inside
+whatever deadline scope the caller set for the chapter.
+
+Steps marked sectioned form a chain (each depends on the one before) that can
+run section by section: while the first step writes section 2, the next step
+already works on section 1. With sections=1 they run as ordinary steps.
+
+A step's precheck looks at its dependencies before the agent is called: it
+may answer for the agent (saving the call) or add a note to its message.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from continuation import continue_reply
+from llm.cancellation import CancellationToken, GenerationCancelled, shutdown_token
+from llm.deadline import DeadlineExceeded, current_budget, deadline_scope
+from llm.finish_reason import clear_finish_reason
+from llm.reasoning import clear_reasoning, last_reasoning, record_reasoning, split_reasoning
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(RuntimeError):
+    """Raised when a pipeline step fails or the step graph is invalid
+
+    Attributes:
+        run: The run so far, when a run was under way; its completed steps can be reused
+        step: Name of the step that failed, if one did
+    """
+
+    def __init__(self, message: str, run: Optional["PipelineRun"] = None, step: Optional[str] = None):
+        super().__init__(message)
+        self.run = run
+        self.step = step
+
+
+class PipelineCancelled(PipelineError):
+    """Raised when cancellation stops a run; run holds the completed and partial steps"""
+
+    def __init__(self, message: str, run: "PipelineRun", reason: str = "cancelled"):
+        super().__init__(message, run)
+        self.reason = reason
+
+
+@dataclass
+class PipelineStep:
+    """One tagged step of the chapter pipeline"""
+    name: str
+    agent: str
+    tag: str
+    instruction: str
+    depends_on: Tuple[str, ...] = ()
+    run: Optional[Callable[[Dict[str, str]], str]] = None  # Local step; no agent call
+    sectioned: bool = False  # Part of the chain that overlaps section by section
+    min_words: int = 0  # Shorter replies are continued, as are replies cut off at the token limit
+    # (dependency artifacts, sections) -> (reply that replaces the agent call or None, note for the agent)
+    precheck: Optional[Callable[[Dict[str, str], int], Tuple[Optional[str], str]]] = None
+
+
+@dataclass
+class StepResult:
+    """Output and timing of a single step"""
+    name: str
+    sender: str
+    content: str = ""
+    latency: float = 0.0
+    bytes_sent: int = 0
+    error: Optional[str] = None
+    cancelled: bool = False
+    timed_out: bool = False
+    continuations: int = 0  # Calls made to extend a truncated or short reply
+    resumed: bool = False  # Content came from a checkpoint rather than the agent
+    prechecked: bool = False  # Content (for a sectioned step, some of it) came from the precheck, not the agent
+    reasoning: str = ""  # Reasoning trace the model produced before its answer; kept out of the transcript
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class PipelineRun:
+    """Results of a complete pipeline run"""
+    results: Dict[str, StepResult] = field(default_factory=dict)
+    messages: List[Dict] = field(default_factory=list)
+    waves: List[Tuple[Tuple[str, ...], float]] = field(default_factory=list)  # (step names, wall time)
+    elapsed: float = 0.0
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """Per-step latency in seconds"""
+        return {name: result.latency for name, result in self.results.items()}
+
+    @property
+    def completed(self) -> Dict[str, str]:
+        """Content of every step that finished"""
+        return {name: result.content for name, result in self.results.items() if result.ok}
+
+    @property
+    def partial(self) -> Dict[str, str]:
+        """Text received from steps interrupted by cancellation"""
+        return {name: result.content for name, result in self.results.items() if result.cancelled}
+
+    def concurrency_savings(self) -> float:
+        """Seconds saved by running waves concurrently instead of step by step"""
+        return sum(
+            sum(self.results[name].latency for name in names) - wall
+            for names, wall in self.waves if len(names) > 1
+        )
+
+
+class ChapterPipeline:
+    """Run a fixed graph of agent steps, passing each step only its dependencies"""
+
+    def __init__(self, agents: Dict[str, Any], steps: List[PipelineStep], max_workers: int = 3,
+                 on_step: Optional[Callable[[PipelineStep, StepResult], None]] = None,
+                 cancel_token: Optional[CancellationToken] = None,
+                 step_timeouts: Optional[Dict[str, float]] = None, sections: int = 1,
+                 max_continuations: int = 3):
+        self.agents = agents
+        self.steps = steps
+        self.max_workers = max_workers
+        self.on_step = on_step
+        self.cancel_token = cancel_token or shutdown_token
+        self.step_timeouts = step_timeouts or {}  # Agent name -> total seconds per step
+        self.sections = sections  # Sections the sectioned chain is split into; 1 runs it step by step
+        self.max_continuations = max_continuations
+
+    def waves(self, external: Tuple[str, ...] = ()) -> List[List[PipelineStep]]:
+        """Group steps into waves whose dependencies are all produced by earlier waves
+
+        Args:
+            external: Artifact names supplied by the caller rather than a step
+
+        Returns:
+            List[List[PipelineStep]]: Waves in execution order, steps in declaration order
+        """
+        names = [step.name for step in self.steps]
+        if len(set(names)) != len(names):
+            raise PipelineError("Duplicate step names in pipeline")
+
+        available = set(external)
+        remaining = list(self.steps)
+        waves = []
+        while remaining:
+            wave = [step for step in remaining if all(dep in available for dep in step.depends_on)]
+            if not wave:
+                unresolved = {step.name: [d for d in step.depends_on if d not in available] for step in remaining}
+                raise PipelineError(f"Unresolvable step dependencies: {unresolved}")
+            waves.append(wave)
+            available.update(step.name for step in wave)
+            remaining = [step for step in remaining if step not in wave]
+        return waves
+
+    def build_message(self, step: PipelineStep, brief: str, artifacts: Dict[str, str], note: str = "") -> str:
+        """Compose the message for a step from the brief, its dependency artifacts and a precheck note"""
+        parts = [brief]
+        for dep in step.depends_on:
+            parts.append(f"\n--- {dep.replace('_', ' ').upper()} ---\n{artifacts[dep]}")
+        if note:
+            parts.append(note)
+        parts.append(f"\nYour task ({step.tag}): {step.instruction}\nBegin your response with '{step.tag}:'.")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _precheck(step: PipelineStep, artifacts: Dict[str, str], sections: int = 1) -> Tuple[Optional[str], str]:
+        if step.precheck is None:
+            return None, ""
+        return step.precheck({dep: artifacts[dep] for dep in step.depends_on}, sections)
+
+    def _call_agent(self, step: PipelineStep, message: str) -> str:
+        """Ask the step's agent for a single reply
+
+        A reasoning trace left in the reply (by a client that does not filter
+        it) is removed and recorded like one the client filtered.
+        """
+        agent = self.agents[step.agent]
+        clear_finish_reason()
+        clear_reasoning()
+        reply = agent.generate_reply(messages=[{"role": "user", "content": message}])
+        if isinstance(reply, dict):
+            reply = reply.get("content")
+        reply, reasoning = split_reasoning(str(reply or ""))
+        if reasoning:
+            record_reasoning("\n\n".join(filter(None, [last_reasoning(), reasoning])))
+        if not reply:
+            raise PipelineError(f"Agent {step.agent} returned an empty reply for step {step.name}")
+        # The executor knows which step produced the text, so a missing tag is restored here
+        if f"{step.tag}:" not in reply:
+            reply = f"{step.tag}:\n{reply}"
+        return reply
+
+    def _continue(self, step: PipelineStep, brief: str, reply: str, min_words: int) -> Tuple[str, int]:
+        """Extend a reply cut off at the token limit or shorter than min_words"""
+        if not self.max_continuations:
+            return reply, 0
+        return continue_reply(self.agents[step.agent], brief, step.tag, reply, min_words, self.max_continuations)
+
+    def _run_step(self, step: PipelineStep, brief: str, artifacts: Dict[str, str]) -> StepResult:
+        """Execute one step, capturing its latency and any error"""
+        result = StepResult(name=step.name, sender=step.agent)
+        start = time.perf_counter()
+        try:
+            with deadline_scope(self.step_timeouts.get(step.agent), label=step.name):
+                if step.run is not None:
+                    result.content = step.run({dep: artifacts[dep] for dep in step.depends_on})
+                else:
+                    reply, note = self._precheck(step, artifacts)
+                    if reply is not None:
+                        result.content, result.prechecked = reply, True
+                    else:
+                        message = self.build_message(step, brief, artifacts, note)
+                        result.bytes_sent = len(message.encode("utf-8"))
+                        result.content = self._call_agent(step, message)
+                        result.reasoning = last_reasoning() or ""
+                        result.content, result.continuations = self._continue(step, brief, result.content,
+                                                                              step.min_words)
+        except DeadlineExceeded as e:
+            logger.error(f"Pipeline step {step.name} timed out with {len(e.partial)} characters received")
+            result.error = str(e)
+            result.content = e.partial
+            result.timed_out = True
+        except GenerationCancelled as e:
+            logger.warning(f"Pipeline step {step.name} cancelled with {len(e.partial)} characters received")
+            result.error = f"cancelled: {e.reason}"
+            result.content = e.partial
+            result.cancelled = True
+        except Exception as e:
+            logger.error(f"Pipeline step {step.name} failed: {e}")
+            result.error = str(e)
+        result.latency = time.perf_counter() - start
+        logger.info(f"Pipeline step {step.name} ({step.agent}) finished in {result.latency:.2f}s, "
+                    f"sent {result.bytes_sent} bytes")
+        if self.on_step:
+            self.on_step(step, result)
+        return result
+
+    def sectioned_chain(self, completed: Tuple[str, ...] = ()) -> List[PipelineStep]:
+        """The sectioned steps to overlap, or an empty list when they run step by step
+
+        A chain that was partly checkpointed resumes step by step, since the
+        saved outputs are no longer split into sections.
+        """
+        chain = [step for step in self.steps if step.sectioned]
+        if self.sections <= 1 or not chain or any(step.name in completed for step in chain):
+            return []
+        for previous, step in zip(chain, chain[1:]):
+            if previous.name not in step.depends_on:
+                raise PipelineError(f"Sectioned step {step.name} must depend on {previous.name}")
+        return chain
+
+    @staticmethod
+    def _strip_tag(text: str, tag: str) -> str:
+        return text.split(f"{tag}:", 1)[-1].strip()
+
+    def _run_sectioned(self, chain: List[PipelineStep], brief: str, artifacts: Dict[str, str]) -> List[StepResult]:
+        """Run a chain of steps as a pipeline over sections
+
+        Each step has its own thread and handles sections in order. A step
+        starts section i once the previous step has finished section i, so
+        all steps are busy at once after the first few sections. A step's
+        latency is the time spent in agent calls, not waiting.
+        """
+        names = [step.name for step in chain]
+        missing = sorted({dep for step in chain for dep in step.depends_on
+                          if dep not in artifacts and dep not in names})
+        if missing:
+            raise PipelineError(f"Sectioned steps {names} start before {missing} are available")
+        outputs: Dict[str, List[str]] = {name: [] for name in names}
+        ready = {name: [threading.Event() for _ in range(self.sections)] for name in names}
+        stopped = threading.Event()
+        results = {step.name: StepResult(name=step.name, sender=step.agent) for step in chain}
+
+        def stage(index: int, step: PipelineStep) -> StepResult:
+            result = results[step.name]
+            upstream = names[:index]
+            with deadline_scope(self.step_timeouts.get(step.agent), label=step.name):
+                for section in range(self.sections):
+                    if upstream:
+                        while not ready[upstream[-1]][section].wait(0.05):
+                            if stopped.is_set():
+                                break
+                    if stopped.is_set():
+                        result.content = "\n\n".join(outputs[step.name])
+                        result.cancelled = self.cancel_token.cancelled
+                        result.error = (f"cancelled: {self.cancel_token.reason}" if result.cancelled
+                                        else "stopped after an earlier sectioned step failed")
+                        break
+                    section_artifacts = {**artifacts, **{name: outputs[name][section] for name in upstream}}
+                    reply, note = self._precheck(step, section_artifacts, self.sections)
+                    if reply is not None:
+                        result.prechecked = True
+                        outputs[step.name].append(self._strip_tag(reply, step.tag))
+                        ready[step.name][section].set()
+                        continue
+                    message = self.build_message(step, brief, section_artifacts, note)
+                    if outputs[step.name]:
+                        message += f"\n--- YOUR {step.tag} SO FAR ---\n" + "\n\n".join(outputs[step.name])
+                    message += (f"\nThis is section {section + 1} of {self.sections}: work only on this part, "
+                                f"continuing from your previous sections without repeating them. "
+                                f"Aim for about 1/{self.sections} of the full length.")
+                    result.bytes_sent += len(message.encode("utf-8"))
+                    call_start = time.perf_counter()
+                    try:
+                        self.cancel_token.raise_if_cancelled()
+                        reply = self._call_agent(step, message)
+                        result.reasoning = "\n\n".join(filter(None, [result.reasoning, last_reasoning()]))
+                        reply, continuations = self._continue(step, brief, reply,
+                                                              step.min_words // self.sections)
+                        result.continuations += continuations
+                    except (DeadlineExceeded, GenerationCancelled) as e:
+                        result.content = "\n\n".join(outputs[step.name] + [e.partial])
+                        result.timed_out = isinstance(e, DeadlineExceeded)
+                        result.cancelled = not result.timed_out
+                        result.error = str(e) if result.timed_out else f"cancelled: {e.reason}"
+                    except Exception as e:
+                        result.error = str(e)
+                    result.latency += time.perf_counter() - call_start
+                    if result.error:
+                        logger.error(f"Pipeline step {step.name} stopped at section {section + 1}: {result.error}")
+                        stopped.set()
+                        break
+                    outputs[step.name].append(self._strip_tag(reply, step.tag))
+                    ready[step.name][section].set()
+                else:
+                    result.content = f"{step.tag}:\n" + "\n\n".join(outputs[step.name])
+            logger.info(f"Pipeline step {step.name} ({step.agent}) finished {len(outputs[step.name])} of "
+                        f"{self.sections} sections in {result.latency:.2f}s, sent {result.bytes_sent} bytes")
+            if self.on_step:
+                self.on_step(step, result)
+            return result
+
+        contexts = [contextvars.copy_context() for _ in chain]
+        with ThreadPoolExecutor(max_workers=len(chain)) as executor:
+            return list(executor.map(lambda ctx, index, step: ctx.run(stage, index, step),
+                                     contexts, range(len(chain)), chain))
+
+    def run(self, brief: str, context: Optional[Dict[str, str]] = None,
+            completed: Optional[Dict[str, str]] = None) -> PipelineRun:
+        """Run all steps
+
+        Args:
+            brief: Chapter brief sent to every step
+            context: External artifacts steps may depend on (e.g. previous chapter context)
+            completed: Step outputs from a checkpoint; those steps are not run again
+
+        Returns:
+            PipelineRun: Step results, a transcript in group-chat message format and timings
+
+        Raises:
+            PipelineCancelled: If cancellation is requested before or during a wave
+            PipelineError: If any step fails or the enclosing deadline passes
+        """
+        artifacts: Dict[str, str] = dict(context or {})
+        completed = completed or {}
+        run = PipelineRun(messages=[{"role": "user", "name": "user_proxy", "content": brief}])
+        chain = self.sectioned_chain(tuple(completed))
+        start = time.perf_counter()
+
+        for wave in self.waves(tuple(artifacts)):
+            for step in [step for step in wave if step.name in completed]:
+                run.results[step.name] = StepResult(step.name, step.agent, completed[step.name], resumed=True)
+                artifacts[step.name] = completed[step.name]
+                run.messages.append({"role": "assistant", "name": step.agent, "content": completed[step.name]})
+            wave = [step for step in wave if step.name not in completed and step.name not in run.results]
+            if not wave:
+                continue
+            if self.cancel_token.cancelled:
+                run.elapsed = time.perf_counter() - start
+                raise PipelineCancelled(f"Cancelled before step {wave[0].name}", run, self.cancel_token.reason)
+            if current_budget().expired:
+                run.elapsed = time.perf_counter() - start
+                raise PipelineError(f"Deadline exceeded before step {wave[0].name}", run, wave[0].name)
+            wave_start = time.perf_counter()
+            if chain and wave == chain[:1]:
+                # The later chain steps run alongside the first; their own waves are skipped
+                wave = chain
+                results = self._run_sectioned(chain, brief, artifacts)
+            elif len(wave) == 1:
+                results = [self._run_step(wave[0], brief, artifacts)]
+            else:
+                # Worker threads start with an empty context; give each step a copy so the
+                # caller's deadline scope still applies
+                contexts = [contextvars.copy_context() for _ in wave]
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(wave))) as executor:
+                    results = list(executor.map(
+                        lambda ctx, s: ctx.run(self._run_step, s, brief, artifacts), contexts, wave))
+            run.waves.append((tuple(step.name for step in wave), time.perf_counter() - wave_start))
+
+            for step, result in zip(wave, results):
+                run.results[step.name] = result
+            cancelled = [result for result in results if result.cancelled]
+            if cancelled:
+                run.elapsed = time.perf_counter() - start
+                raise PipelineCancelled(f"Cancelled during step {cancelled[0].name}", run,
+                                        self.cancel_token.reason or "cancelled")
+
+            for step, result in zip(wave, results):
+                if not result.ok:
+                    run.elapsed = time.perf_counter() - start
+                    raise PipelineError(f"Step {step.name} failed: {result.error}", run, step.name)
+                artifacts[step.name] = result.content
+                run.messages.append({"role": "assistant", "name": step.agent, "content": result.content})
+
+        run.elapsed = time.perf_counter() - start
+        return run
@@ -0,0 +1,117 @@
+"""Declarative chapter completion checks evaluated on the parsed transcript
+
+A policy lists the tagged artifacts a chapter transcript may contain and
+marks which are required. Optional artifacts are reported but never fail a
+chapter. The report says exactly why a chapter failed, so avoidable retries
+show up in the logs and metrics.
+"""
+import logging
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ArtifactRule:
+    """A tagged artifact in the transcript"""
+    name: str
+    tags: Tuple[str, ...]  # Any of these marks the artifact, e.g. ("SCENE DRAFT:", "SCENE:")
+    required: bool = False
+    senders: Tuple[str, ...] = ()  # Only count messages from these senders; empty for any
+
+
+@dataclass
+class CompletionReport:
+    """Outcome of evaluating a transcript against a policy"""
+    chapter_number: Optional[int]
+    found: Dict[str, bool] = field(default_factory=dict)
+    missing_required: List[str] = field(default_factory=list)
+    missing_optional: List[str] = field(default_factory=list)
+    final_words: int = 0
+    problems: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.problems
+
+    def summary(self) -> str:
+        if self.passed:
+            skipped = f"; optional not found: {', '.join(self.missing_optional)}" if self.missing_optional else ""
+            return f"complete ({self.final_words} words{skipped})"
+        return "; ".join(self.problems)
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "passed": self.passed}
+
+
+@dataclass(frozen=True)
+class CompletionPolicy:
+    """What a chapter transcript must contain to be accepted"""
+    artifacts: Tuple[ArtifactRule, ...]
+    final_artifact: str = "scene_final"  # Its text is the chapter; min_words applies to it
+    min_words: int = 100
+    require_chapter_header: bool = True
+
+    def _rule(self, name: str) -> ArtifactRule:
+        return next(rule for rule in self.artifacts if rule.name == name)
+
+    @staticmethod
+    def _sender(message: Dict) -> str:
+        return message.get("sender") or message.get("name", "")
+
+    def _matches(self, rule: ArtifactRule, message: Dict) -> bool:
+        if rule.senders and self._sender(message) not in rule.senders:
+            return False
+        return any(tag in message.get("content", "") for tag in rule.tags)
+
+    def final_text(self, messages: List[Dict]) -> str:
+        """Text after the final artifact's tag in its last message"""
+        rule = self._rule(self.final_artifact)
+        for message in reversed(messages):
+            if self._matches(rule, message):
+                content = message.get("content", "")
+                tag = next(tag for tag in rule.tags if tag in content)
+                return content.split(tag, 1)[1].strip()
+        return ""
+
+    def evaluate(self, messages: List[Dict], chapter_number: Optional[int] = None) -> CompletionReport:
+        """Check a transcript against the policy
+
+        Args:
+            messages: Transcript in group-chat message format
+            chapter_number: Expected chapter; when given, the header must name it
+        """
+        header = next((int(m.group(1)) for m in (re.search(r"Chapter (\d+):", msg.get("content", ""))
+                                                   for msg in messages) if m), None)
+        report = CompletionReport(chapter_number if chapter_number is not None else header)
+        for rule in self.artifacts:
+            report.found[rule.name] = any(self._matches(rule, message) for message in messages)
+            if not report.found[rule.name]:
+                (report.missing_required if rule.required else report.missing_optional).append(rule.name)
+
+        if self.require_chapter_header and header is None:
+            report.problems.append("no 'Chapter N:' header in the transcript")
+        elif chapter_number is not None and header is not None and header != chapter_number:
+            report.problems.append(f"header names chapter {header}, expected {chapter_number}")
+        if report.missing_required:
+            report.problems.append(f"missing required {', '.join(report.missing_required)}")
+        report.final_words = len(self.final_text(messages).split())
+        if report.found.get(self.final_artifact) and report.final_words < self.min_words:
+            report.problems.append(f"{self.final_artifact} has {report.final_words} words, "
+                                   f"fewer than {self.min_words}")
+        return report
+
+
+DEFAULT_POLICY = CompletionPolicy(artifacts=(
+    ArtifactRule("memory_update", ("MEMORY UPDATE:",)),
+    ArtifactRule("plan", ("PLAN:",)),
+    ArtifactRule("setting", ("SETTING:",)),
+    ArtifactRule("character", ("CHARACTER:",)),
+    ArtifactRule("plot", ("PLOT:",)),
+    ArtifactRule("scene", ("SCENE DRAFT:", "SCENE:")),
+    ArtifactRule("feedback", ("FEEDBACK:",)),
+    ArtifactRule("scene_final", ("SCENE FINAL:",), required=True, senders=("writer_final", "writer")),
+    ArtifactRule("confirmation", ("**Confirmation:**",)),
+))
@@ -7,7 +7,7 @@ Provides centralized configuration management with:
 """
 
 from typing import Dict, Any
-from .settings import Settings, get_settings
+from .settings import Settings, get_settings, reload_settings
 
 def get_config() -> Dict[str, Any]:
     """Get the complete configuration including model settings
@@ -26,5 +26,6 @@ def get_config() -> Dict[str, Any]:
 __all__ = [
     'Settings',
     'get_settings',
+    'reload_settings',
     'get_config'
 ]
@@ -6,7 +6,7 @@ Provides environment detection and configuration presets
 import os
 from enum import Enum
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 class Environment(str, Enum):
     """Available environment types"""
@@ -17,6 +17,8 @@ class Environment(str, Enum):
 
 class EnvironmentSettings(BaseModel):
     """Environment-specific settings"""
+    model_config = ConfigDict(frozen=True)
+
     name: Environment
     debug: bool
     log_level: str
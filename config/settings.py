@@ -1,5 +1,36 @@
-from dotenv import load_dotenv
-load_dotenv()  # Load environment variables from .env file
+import logging
+import os
+import threading
+from typing import Dict
+from dotenv import dotenv_values, find_dotenv
+
+# Variables exported from .env, with the value exported; the rest of os.environ is the real environment
+_DOTENV_EXPORTED: Dict[str, str] = {}
+
+
+def _export_dotenv(path: str) -> None:
+    """Export .env values without replacing variables set in the real environment
+
+    On reload, values exported from .env earlier are updated or removed, unless
+    something has set the variable since. An explicit variable, e.g. LLM__MODEL
+    set for one queued job, always wins over .env.
+    """
+    values = {key: value for key, value in (dotenv_values(path) if path and os.path.exists(path) else {}).items()
+              if value is not None}
+    for key in [key for key in _DOTENV_EXPORTED if key not in values]:
+        if os.environ.get(key) == _DOTENV_EXPORTED.pop(key):
+            del os.environ[key]
+    for key, value in values.items():
+        exported = _DOTENV_EXPORTED.get(key)
+        if key not in os.environ or (exported is not None and os.environ[key] == exported):
+            os.environ[key] = value
+            _DOTENV_EXPORTED[key] = value
+        else:
+            _DOTENV_EXPORTED.pop(key, None)
+
+
+_DOTENV_PATH = find_dotenv()
+_export_dotenv(_DOTENV_PATH)  # Load environment variables from .env file
 
 from pydantic_settings import BaseSettings
 from pydantic import (
@@ -12,10 +43,12 @@ from pydantic import (
     field_serializer
 )
 from pydantic_settings import SettingsConfigDict
-from typing import Literal, Optional, Union
+from typing import Literal, Optional, Tuple, Union
 import re
 from .environments import EnvironmentSettings, detect_environment, get_environment_settings
 
+logger = logging.getLogger(__name__)
+
 class LLMSettings(BaseSettings):
     """Configuration for LLM providers and models"""
 
@@ -100,6 +133,7 @@ class LLMSettings(BaseSettings):
     )
 
     model_config = SettingsConfigDict(
+        frozen=True,
         env_file=".env",
         env_file_encoding="utf-8",
         extra="ignore"
@@ -140,7 +174,7 @@ class GenerationSettings(BaseSettings):
 
     output_dir: str = Field(
         default="./book_output", # Corrected default output directory
-        description="Directory for generated books"
+        description="Root directory for generated books; each run gets its own runs/YYYY/MM/DD/<run_id>/ directory"
     )
 
     max_tokens: int = Field(
@@ -178,11 +212,149 @@ class GenerationSettings(BaseSettings):
         le=20000
     )
 
+    planning_concurrency: int = Field(
+        default=3,
+        description="Planning agents (setting, character, plot) run concurrently per chapter",
+        ge=1,
+        le=3
+    )
+
+    draft_sections: int = Field(
+        default=1,
+        description="Sections the scene draft is split into so editor feedback and revision overlap drafting (1 disables)",
+        ge=1,
+        le=8
+    )
+
+    max_continuations: int = Field(
+        default=3,
+        description="Continuation calls allowed per reply cut off at the token limit or under min_chapter_length (0 disables)",
+        ge=0,
+        le=10
+    )
+
+    scene_beats: bool = Field(
+        default=False,
+        description="Draft chapters as concurrent scene beats from the PLOT output, each within one completion's token limit"
+    )
+
+    quality_gate: bool = Field(
+        default=True,
+        description="Measure drafts locally before the editor; clearly failing drafts get automatic feedback instead of an editor call"
+    )
+
+    requests_per_minute: Optional[float] = Field(
+        default=None,
+        description="LLM requests per minute allowed for this process (unset for no limit)",
+        ge=0
+    )
+
+    shutdown_grace_seconds: float = Field(
+        default=30.0,
+        description="Seconds a stop signal allows for checkpointing before the process exits",
+        ge=1,
+        le=600
+    )
+
     model_config = SettingsConfigDict(
+        frozen=True,
         env_prefix="GEN_",
         extra="ignore"
     )
 
+class OutlineSettings(BaseSettings):
+    """Configuration for outline generation, tuned separately from prose generation"""
+
+    model: Optional[str] = Field(
+        default=None,
+        description="LLM model for outline generation (defaults to the main LLM model)"
+    )
+
+    base_url: Optional[str] = Field(
+        default=None,
+        description="Base URL for the outline model (defaults to the main LLM base URL)"
+    )
+
+    timeout: int = Field(
+        default=120,
+        description="Timeout in seconds for each outline completion",
+        ge=5,
+        le=1800
+    )
+
+    max_tokens: int = Field(
+        default=8192,
+        description="Maximum tokens per outline completion",
+        ge=512,
+        le=32768
+    )
+
+    temperature: float = Field(
+        default=0.7,
+        description="Sampling temperature for outline generation",
+        ge=0.0,
+        le=1.0
+    )
+
+    cache_enabled: bool = Field(
+        default=True,
+        description="Reuse outline completions for identical prompts within a process"
+    )
+
+    model_config = SettingsConfigDict(
+        frozen=True,
+        env_prefix="OUTLINE_",
+        extra="ignore"
+    )
+
+class TimeoutSettings(BaseSettings):
+    """Deadlines for LLM calls, from the chapter budget down to each request"""
+
+    stream_idle: float = Field(
+        default=60.0,
+        description="Longest wait in seconds for the next streamed chunk before a request is abandoned",
+        ge=5,
+        le=600
+    )
+
+    request_total: float = Field(
+        default=300.0,
+        description="Total seconds a single LLM call may take when no agent timeout applies",
+        ge=5,
+        le=3600
+    )
+
+    chapter_budget: float = Field(
+        default=2400.0,
+        description="Total seconds all pipeline steps of one chapter may take",
+        ge=60,
+        le=14400
+    )
+
+    agents: Dict[str, float] = Field(
+        default_factory=lambda: {
+            "memory_keeper": 120.0,
+            "story_planner": 240.0,
+            "setting_builder": 240.0,
+            "character_agent": 240.0,
+            "plot_agent": 240.0,
+            "writer": 900.0,
+            "editor": 360.0,
+            "writer_final": 900.0,
+        },
+        description="Total seconds per pipeline step by agent name, as JSON (e.g. TIMEOUT_AGENTS='{\"writer\": 1200}')"
+    )
+
+    model_config = SettingsConfigDict(
+        frozen=True,
+        env_prefix="TIMEOUT_",
+        extra="ignore"
+    )
+
+    def for_agent(self, agent: str) -> float:
+        """Total seconds a step run by agent may take"""
+        return self.agents.get(agent, self.request_total)
+
 class LoggingSettings(BaseSettings):
     """Configuration for application logging"""
 
@@ -202,6 +374,7 @@ class LoggingSettings(BaseSettings):
     )
 
     model_config = SettingsConfigDict(
+        frozen=True,
         env_prefix="LOG_",
         extra="ignore"
     )
@@ -212,16 +385,21 @@ class Settings(BaseSettings):
     Attributes:
         llm: Configuration for LLM providers and models
         generation: Configuration for book generation parameters
+        outline: Configuration for outline generation
+        timeouts: Deadlines for LLM calls and chapter steps
         environment: Environment-specific settings
         logging: Configuration for application logging
     """
 
     llm: LLMSettings = Field(default_factory=LLMSettings)
     generation: GenerationSettings = Field(default_factory=GenerationSettings)
+    outline: OutlineSettings = Field(default_factory=OutlineSettings)
+    timeouts: TimeoutSettings = Field(default_factory=TimeoutSettings)
     environment: EnvironmentSettings = Field(default_factory=lambda: get_environment_settings())
     logging: LoggingSettings = Field(default_factory=LoggingSettings) # Added LoggingSettings
 
     model_config = SettingsConfigDict(
+        frozen=True,
         env_nested_delimiter="__",
         extra="ignore"
     )
@@ -259,41 +437,123 @@ class Settings(BaseSettings):
 
         return values
 
-    def get_llm_config(self) -> dict:
+    def get_llm_config(self, model: Optional[str] = None) -> dict:
         """Get LLM configuration in dictionary format
 
+        Args:
+            model: Model to configure instead of LLM_MODEL (e.g. per book in a batch)
+
         Returns:
             dict: Configuration dictionary with model and API key
         """
+        return self._llm_config_for(model or self.llm.model)
+
+    def _llm_config_for(self, model: str) -> dict:
+        """Build the model, API key and base URL configuration for a model name"""
         config = {
-            "model": self.llm.model,
+            "model": model,
             "api_key": None,
             "base_url": None
         }
 
-        if "openai" in self.llm.model and self.llm.openai_api_key:
+        if "openai" in model and self.llm.openai_api_key:
             config["api_key"] = self.llm.openai_api_key.get_secret_value()
-        elif "deepseek" in self.llm.model and self.llm.deepseek_api_key:
+        elif "deepseek" in model and self.llm.deepseek_api_key:
             config["api_key"] = self.llm.deepseek_api_key.get_secret_value()
             if self.llm.deepseek_base_url:
                 config["base_url"] = str(self.llm.deepseek_base_url)
-        elif "gemini" in self.llm.model and self.llm.gemini_api_key:
+        elif "gemini" in model and self.llm.gemini_api_key:
             config["api_key"] = self.llm.gemini_api_key.get_secret_value()
-        elif "groq" in self.llm.model and self.llm.groq_api_key:
+        elif "groq" in model and self.llm.groq_api_key:
             config["api_key"] = self.llm.groq_api_key.get_secret_value()
-        elif "mistral" in self.llm.model and self.llm.mistral_nemo_base_url:
+        elif "mistral" in model and self.llm.mistral_nemo_base_url:
             config["base_url"] = str(self.llm.mistral_nemo_base_url)
-        elif "ollama" in self.llm.model and self.llm.ollama_base_url: # Added Ollama base_url config
+        elif "ollama" in model and self.llm.ollama_base_url: # Added Ollama base_url config
              config["base_url"] = str(self.llm.ollama_base_url)
 
 
         return config
 
+    def get_outline_llm_config(self, model: Optional[str] = None) -> dict:
+        """Get the LLM configuration for outline generation
+
+        Falls back to the main LLM configuration (or the given model) for
+        anything the outline settings leave unset.
+
+        Returns:
+            dict: Configuration dictionary for LLMFactory.create_llm
+        """
+        config = self._llm_config_for(self.outline.model or model or self.llm.model)
+        if self.outline.base_url:
+            config["base_url"] = self.outline.base_url
+        if config["model"] and "ollama" in config["model"]:
+            config["ollama_base_url"] = config["base_url"] or self.llm.ollama_base_url
+        config.update({
+            "timeout": self.outline.timeout,
+            "max_tokens": self.outline.max_tokens,
+            "temperature": self.outline.temperature,
+            "cache_enabled": self.outline.cache_enabled
+        })
+        return config
+
+
+_settings_lock = threading.Lock()
+_cached_settings: Optional[Settings] = None
+_cached_env_mtimes: Optional[Tuple[Optional[float], ...]] = None
+
+
+def _env_file_mtimes() -> Tuple[Optional[float], ...]:
+    """Modification times of the .env files settings are read from (None if absent)"""
+    paths = [os.path.abspath(".env")]
+    if _DOTENV_PATH and os.path.abspath(_DOTENV_PATH) != paths[0]:
+        paths.append(_DOTENV_PATH)
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def _load_settings(mtimes: Tuple[Optional[float], ...], reread_env: bool) -> Settings:
+    """Parse .env and validate a new Settings instance (caller holds the lock)"""
+    global _cached_settings, _cached_env_mtimes
+    if reread_env:
+        _export_dotenv(_DOTENV_PATH or os.path.abspath(".env"))
+    _cached_settings = Settings()
+    _cached_env_mtimes = mtimes
+    return _cached_settings
+
 
 def get_settings() -> Settings:
-    """Factory function to get settings instance
+    """Get the process-wide settings instance
+
+    Settings are loaded and validated once and are immutable. A changed
+    .env modification time triggers a reload on the next call.
 
     Returns:
         Settings: Configured settings instance
     """
-    return Settings()
\ No newline at end of file
+    mtimes = _env_file_mtimes()
+    settings = _cached_settings
+    if settings is not None and mtimes == _cached_env_mtimes:
+        return settings
+
+    with _settings_lock:
+        if _cached_settings is None:
+            return _load_settings(mtimes, reread_env=False)
+        if mtimes != _cached_env_mtimes:
+            logger.info(".env changed on disk; reloading settings")
+            return _load_settings(mtimes, reread_env=True)
+        return _cached_settings
+
+
+def reload_settings() -> Settings:
+    """Discard the cached settings and load them again from the environment and .env
+
+    Returns:
+        Settings: The newly loaded settings instance
+    """
+    with _settings_lock:
+        return _load_settings(_env_file_mtimes(), reread_env=True)
@@ -0,0 +1,91 @@
+"""Length-driven continuation of truncated or short replies
+
+When a reply stops because it hit the token limit, or is shorter than
+required, the agent is asked to continue from the tail of what it wrote and
+the new text is appended. Nothing already written is regenerated or thrown
+away.
+"""
+import logging
+from typing import Any, Optional, Tuple
+
+from llm.cancellation import GenerationCancelled
+from llm.deadline import DeadlineExceeded
+from llm.finish_reason import clear_finish_reason, last_finish_reason
+from llm.reasoning import split_reasoning
+
+logger = logging.getLogger(__name__)
+
+TAIL_WORDS = 250
+MAX_OVERLAP_CHARS = 400
+
+
+def body_words(text: str, tag: str) -> int:
+    """Words in a reply, not counting its tag"""
+    return len(text.split(f"{tag}:", 1)[-1].split())
+
+
+def needs_continuation(text: str, tag: str, finish_reason: Optional[str], min_words: int = 0) -> bool:
+    return finish_reason == "length" or body_words(text, tag) < min_words
+
+
+def continuation_message(brief: str, tag: str, text: str, min_words: int = 0, tail_words: int = TAIL_WORDS) -> str:
+    """A compact request to continue: the brief and the last tail_words of the text so far"""
+    words = text.split(f"{tag}:", 1)[-1].split()
+    tail = " ".join(words[-tail_words:])
+    remaining = f" Write at least {min_words - len(words)} more words." if min_words > len(words) else ""
+    return (f"{brief}\n\n--- END OF YOUR {tag} SO FAR ---\n...{tail}\n\n"
+            f"Your {tag} was cut off. Continue it from exactly where it stops.{remaining} "
+            f"Do not repeat, summarize or restart; write only the new text, with no tag.")
+
+
+def append_continuation(text: str, addition: str, tag: str) -> str:
+    """Join a continuation onto text, dropping a repeated tag or a restated tail"""
+    addition = addition.strip()
+    if addition.startswith(f"{tag}:"):
+        addition = addition[len(tag) + 1:].lstrip()
+    for size in range(min(len(text), len(addition), MAX_OVERLAP_CHARS), 20, -1):
+        if text.endswith(addition[:size]):
+            addition = addition[size:].lstrip()
+            break
+    if not addition:
+        return text
+    if text.endswith(("\n", " ")) or addition[0] in ",.;:!?)'\"":
+        return text + addition
+    # A reply cut off mid-paragraph usually resumes mid-sentence; one ending a sentence gets a new paragraph
+    return text + ("\n\n" if text.rstrip()[-1:] in ".!?\"'" else " ") + addition
+
+
+def continue_reply(agent: Any, brief: str, tag: str, text: str, min_words: int = 0,
+                   max_continuations: int = 3) -> Tuple[str, int]:
+    """Ask agent to continue text while it was truncated or stays under min_words
+
+    Call right after the agent's first reply, in the same thread, so the
+    finish reason recorded by the client is the one for that reply.
+
+    Returns:
+        Tuple of the extended text and the number of continuation calls made
+
+    Raises:
+        GenerationCancelled, DeadlineExceeded: With partial holding the text so far
+    """
+    finish_reason = last_finish_reason()
+    calls = 0
+    while calls < max_continuations and needs_continuation(text, tag, finish_reason, min_words):
+        logger.info(f"{tag} continuation {calls + 1}: {body_words(text, tag)} words so far, "
+                    f"finish reason {finish_reason}")
+        clear_finish_reason()
+        try:
+            reply = agent.generate_reply(messages=[{"role": "user", "content":
+                                                    continuation_message(brief, tag, text, min_words)}])
+        except (GenerationCancelled, DeadlineExceeded) as e:
+            e.partial = append_continuation(text, e.partial, tag)  # Keep what was already written
+            raise
+        if isinstance(reply, dict):
+            reply = reply.get("content")
+        calls += 1
+        extended = append_continuation(text, split_reasoning(str(reply or ""))[0], tag)
+        if extended == text:
+            logger.warning(f"{tag} continuation added no text; keeping {body_words(text, tag)} words")
+            break
+        text, finish_reason = extended, last_finish_reason()
+    return text, calls
@@ -0,0 +1,224 @@
+"""Local, CPU-only retrieval index over saved chapters for bounded continuity context"""
+import json
+import logging
+import math
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class HashingVectorizer:
+    """Stateless feature-hashing vectorizer
+
+    Needs no vocabulary or model download, so vectors stay comparable across
+    processes and runs. Uses crc32 rather than hash() because Python's string
+    hashing is salted per process.
+    """
+
+    def __init__(self, n_features: int = 2 ** 14, ngram_range: Tuple[int, int] = (1, 2)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> List[str]:
+        """Split text into lowercase word n-grams"""
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        features = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            features.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return features
+
+    def transform_sparse(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Embed one text as the columns and values of its non-zero, L2-normalised entries"""
+        hashes = np.fromiter(
+            (zlib.crc32(feature.encode("utf-8")) for feature in self._features(text)),
+            dtype=np.uint32
+        )
+        columns = (hashes % self.n_features).astype(np.int32)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        columns, inverse = np.unique(columns, return_inverse=True)
+        counts = np.bincount(inverse, weights=signs, minlength=columns.size).astype(np.float32)
+        nonzero = counts != 0
+        columns, counts = columns[nonzero], counts[nonzero]
+
+        # Sublinear term frequency keeps repeated names from dominating a chunk
+        values = np.sign(counts) * np.log1p(np.abs(counts))
+        norm = np.linalg.norm(values)
+        return columns, (values / norm if norm else values).astype(np.float32)
+
+    def transform(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into L2-normalised float32 rows"""
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            columns, values = self.transform_sparse(text)
+            matrix[row, columns] = values
+        return matrix
+
+
+class ContinuityIndex:
+    """On-disk index of chapter passages searchable by similarity
+
+    Passage vectors are sparse: only their non-zero entries are kept, a few
+    hundred per passage. Each chapter has its own files inside ``index_dir``,
+    so indexing a chapter never rewrites the others:
+    - ``chapter_NN.npz``: ``cols`` and ``values`` of every passage's non-zero
+      entries, with ``offsets`` marking where each passage starts
+    - ``chapter_NN.jsonl``: the text of each passage, in the same order
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        vectorizer: Optional[HashingVectorizer] = None,
+        chunk_words: int = 180,
+        chunk_overlap: int = 40
+    ):
+        if chunk_overlap >= chunk_words:
+            raise ValueError("chunk_overlap must be smaller than chunk_words")
+        self.index_dir = index_dir
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.chunk_words = chunk_words
+        self.chunk_overlap = chunk_overlap
+        self._chapters: Dict[int, Dict] = {}  # Chapter number -> chunks, offsets, cols, values
+        self._load()
+
+    def __len__(self) -> int:
+        return sum(len(chapter["chunks"]) for chapter in self._chapters.values())
+
+    @property
+    def chunks(self) -> List[Dict]:
+        """Indexed passages in chapter order"""
+        return [chunk for number in sorted(self._chapters) for chunk in self._chapters[number]["chunks"]]
+
+    def _paths(self, chapter_number: int) -> Tuple[str, str]:
+        base = os.path.join(self.index_dir, f"chapter_{chapter_number:02d}")
+        return base + ".npz", base + ".jsonl"
+
+    def _load(self) -> None:
+        """Load previously persisted chapters, if any"""
+        if not os.path.isdir(self.index_dir):
+            return
+        for name in sorted(os.listdir(self.index_dir)):
+            match = re.fullmatch(r"chapter_(\d+)\.npz", name)
+            if not match:
+                continue
+            chapter_number = int(match.group(1))
+            vectors_path, chunks_path = self._paths(chapter_number)
+            if not os.path.exists(chunks_path):
+                continue
+            with np.load(vectors_path) as vectors:
+                offsets, cols, values = vectors["offsets"], vectors["cols"], vectors["values"]
+            with open(chunks_path, "r", encoding="utf-8") as f:
+                texts = [json.loads(line) for line in f if line.strip()]
+            if offsets.size != len(texts) + 1 or offsets[-1] != cols.size or cols.size != values.size:
+                logger.warning(f"Ignoring continuity index for chapter {chapter_number} in {self.index_dir}: "
+                               f"vectors do not match {len(texts)} passages")
+                continue
+            if cols.size and cols.max() >= self.vectorizer.n_features:
+                logger.warning(f"Ignoring continuity index for chapter {chapter_number}: built with more features")
+                continue
+            self._chapters[chapter_number] = {
+                "chunks": [{"chapter_number": chapter_number, "text": text} for text in texts],
+                "offsets": offsets, "cols": cols, "values": values}
+        if self._chapters:
+            logger.info(f"Loaded continuity index with {len(self)} passages from {self.index_dir}")
+
+    def _persist(self, chapter_number: int) -> None:
+        """Write one chapter's vectors and passages atomically"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        vectors_path, chunks_path = self._paths(chapter_number)
+        chapter = self._chapters[chapter_number]
+
+        with open(vectors_path + ".tmp", "wb") as f:
+            np.savez(f, offsets=chapter["offsets"], cols=chapter["cols"], values=chapter["values"])
+        with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+            for chunk in chapter["chunks"]:
+                f.write(json.dumps(chunk["text"]) + "\n")
+
+        os.replace(chunks_path + ".tmp", chunks_path)
+        os.replace(vectors_path + ".tmp", vectors_path)
+
+    def chunk_text(self, text: str) -> List[str]:
+        """Split text into overlapping word windows, preferring paragraph boundaries"""
+        paragraphs = [p.split() for p in re.split(r"\n\s*\n|\n", text) if p.strip()]
+        chunks = []
+        current: List[str] = []
+        for words in paragraphs:
+            if current and len(current) + len(words) > self.chunk_words:
+                chunks.append(" ".join(current))
+                current = current[-self.chunk_overlap:] if self.chunk_overlap else []
+            current.extend(words)
+            # A single long paragraph is split on word windows
+            while len(current) > self.chunk_words:
+                chunks.append(" ".join(current[:self.chunk_words]))
+                current = current[self.chunk_words - self.chunk_overlap:]
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+    def add_chapter(self, chapter_number: int, text: str) -> int:
+        """Index a saved chapter, replacing any passages from an earlier version of it
+
+        Returns:
+            int: Number of passages indexed for the chapter
+        """
+        passages = self.chunk_text(text)
+        rows = [self.vectorizer.transform_sparse(passage) for passage in passages]
+        lengths = [cols.size for cols, _ in rows]
+        self._chapters[chapter_number] = {
+            "chunks": [{"chapter_number": chapter_number, "text": p} for p in passages],
+            "offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64),
+            "cols": np.concatenate([cols for cols, _ in rows]).astype(np.int32) if rows else np.zeros(0, np.int32),
+            "values": np.concatenate([values for _, values in rows]).astype(np.float32) if rows else np.zeros(0, np.float32),
+        }
+
+        self._persist(chapter_number)
+        logger.info(f"Indexed {len(passages)} passages for chapter {chapter_number}")
+        return len(passages)
+
+    def search(self, query: str, top_k: int = 5, before_chapter: Optional[int] = None) -> List[Dict]:
+        """Return the top_k passages most similar to the query
+
+        Args:
+            query: Free text, typically the current chapter's key events
+            top_k: Maximum number of passages to return
+            before_chapter: Only consider passages from chapters before this one
+
+        Returns:
+            List[Dict]: Passages with chapter_number, text and score, best first
+        """
+        if not self._chapters or top_k <= 0 or not query.strip():
+            return []
+
+        numbers = [n for n in sorted(self._chapters) if before_chapter is None or n < before_chapter]
+        candidates = [chunk for n in numbers for chunk in self._chapters[n]["chunks"]]
+        if not candidates:
+            return []
+
+        query_vector = self.vectorizer.transform([query])[0]
+        scores = np.concatenate([self._scores(self._chapters[n], query_vector) for n in numbers])
+
+        k = min(top_k, scores.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {**candidates[i], "score": float(scores[i])}
+            for i in best
+            if scores[i] > 0 and not math.isnan(scores[i])
+        ]
+
+    @staticmethod
+    def _scores(chapter: Dict, query_vector: np.ndarray) -> np.ndarray:
+        """Dot product of the query with each of a chapter's sparse passage vectors"""
+        count = len(chapter["chunks"])
+        rows = np.repeat(np.arange(count), np.diff(chapter["offsets"]))
+        return np.bincount(rows, weights=chapter["values"] * query_vector[chapter["cols"]],
+                           minlength=count).astype(np.float32)
@@ -0,0 +1,483 @@
+"""Local job queue and worker pool for book generation
+
+Generation jobs are stored in a SQLite database. One worker service per queue
+runs at most a fixed number of main.py processes at a time, highest priority
+first, and splits the requests-per-minute budget between them. Clients such
+as the Streamlit app and the CLI below only submit, inspect and cancel jobs.
+
+Usage:
+    python job_queue.py serve --workers 2 --rpm 60
+    python job_queue.py submit --genre fantasy --prompt "..." --priority 5
+    python job_queue.py status [JOB_ID]
+    python job_queue.py cancel JOB_ID
+"""
+import argparse
+import logging
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional
+
+from run_store import new_run_id
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+TERMINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL UNIQUE,
+    prompt TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    model TEXT,
+    chapters INTEGER,
+    custom_outline TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER,
+    returncode INTEGER,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS service (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Job:
+    """One queued book generation"""
+    id: int
+    run_id: str
+    prompt: str
+    genre: str
+    model: Optional[str]
+    chapters: Optional[int]
+    custom_outline: Optional[str]
+    priority: int
+    status: str
+    cancel_requested: int
+    pid: Optional[int]
+    returncode: Optional[int]
+    error: Optional[str]
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(**{f.name: row[f.name] for f in fields(cls)})
+
+
+def default_queue_path() -> str:
+    """Queue database next to the run catalog in GenerationSettings.output_dir"""
+    from config import get_settings
+    return os.path.join(get_settings().generation.output_dir, "jobs.sqlite3")
+
+
+class JobQueue:
+    """SQLite-backed job store shared by clients and the worker service"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit; multi-statement updates use explicit BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, prompt: str, genre: str, model: Optional[str] = None, chapters: Optional[int] = None,
+               custom_outline: Optional[str] = None, priority: int = 0) -> Job:
+        """Queue a book; higher priority jobs start first"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (run_id, prompt, genre, model, chapters, custom_outline, priority, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (new_run_id(), prompt, genre, model, chapters, custom_outline, priority, time.time()))
+            job_id = cursor.lastrowid
+        logger.info(f"Queued job {job_id} (priority {priority})")
+        return self.get(job_id)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Job]:
+        """Most recent jobs first"""
+        query, params = "SELECT * FROM jobs", ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return {row["status"]: row["n"] for row in
+                    conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+    def claim_next(self) -> Optional[Job]:
+        """Atomically move the highest priority queued job to running"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1",
+                               (QUEUED,)).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+            conn.execute("COMMIT")
+        return self.get(row["id"]) if row else None
+
+    def set_pid(self, job_id: int, pid: int) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET pid = ? WHERE id = ?", (pid, job_id))
+
+    def finish(self, job_id: int, status: str, returncode: Optional[int] = None, error: Optional[str] = None) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, returncode = ?, error = ?, finished = ? WHERE id = ?",
+                         (status, returncode, error, time.time(), job_id))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued job now, or ask the worker to stop a running one
+
+        Returns:
+            bool: False if the job does not exist or already finished
+        """
+        with self._connect() as conn:
+            queued = conn.execute("UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?",
+                                  (CANCELLED, time.time(), job_id, QUEUED)).rowcount
+            running = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                                   (job_id, RUNNING)).rowcount
+        return bool(queued or running)
+
+    def cancel_requested(self, job_id: int) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def running_pids(self) -> Dict[int, int]:
+        """Recorded pid of each job marked running, by job id"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, pid FROM jobs WHERE status = ? AND pid IS NOT NULL", (RUNNING,)).fetchall()
+        return {row["id"]: row["pid"] for row in rows}
+
+    def fail_interrupted(self) -> int:
+        """Mark jobs left running by a service that died as failed"""
+        with self._connect() as conn:
+            return conn.execute("UPDATE jobs SET status = ?, error = ?, finished = ? WHERE status = ?",
+                                (FAILED, "Worker service stopped while the job was running", time.time(),
+                                 RUNNING)).rowcount
+
+    def claim_service(self, pid: int, stale_after: float = 15.0) -> bool:
+        """Register pid as the queue's only worker service, refreshing its heartbeat
+
+        Returns:
+            bool: False if another live service holds the queue
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT pid, heartbeat FROM service WHERE id = 1").fetchone()
+            now = time.time()
+            if row and row["pid"] != pid and now - row["heartbeat"] < stale_after:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO service (id, pid, heartbeat) VALUES (1, ?, ?)", (pid, now))
+            conn.execute("COMMIT")
+            return True
+
+    def release_service(self, pid: int) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM service WHERE id = 1 AND pid = ?", (pid,))
+
+    def service_alive(self, stale_after: float = 15.0) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT heartbeat FROM service WHERE id = 1").fetchone()
+        return bool(row and time.time() - row["heartbeat"] < stale_after)
+
+
+class WorkerPool:
+    """Run queued jobs as main.py processes, at most `workers` at a time"""
+
+    def __init__(self, queue: JobQueue, workers: int = 2, requests_per_minute: Optional[float] = None,
+                 poll_interval: float = 1.0, command: Optional[List[str]] = None, stop_grace: float = 45.0):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.requests_per_minute = requests_per_minute
+        self.poll_interval = poll_interval
+        self.stop_grace = stop_grace  # Longer than main.py's shutdown grace so checkpoints get written
+        self.command = command or [sys.executable, MAIN_SCRIPT]
+        self.log_dir = os.path.join(os.path.dirname(os.path.abspath(queue.path)), "job_logs")
+        self._running: Dict[int, subprocess.Popen] = {}
+        self._logs: Dict[int, object] = {}
+        self._stopping: Dict[int, float] = {}  # Job id -> when SIGTERM was sent
+
+    def _launch(self, job: Job) -> None:
+        argv = [*self.command, "--prompt", job.prompt, "--run-id", job.run_id]
+        env = {**os.environ, "BOOK_GENRE": job.genre}
+        if job.model:
+            env["LLM__MODEL"] = job.model
+        if job.chapters:
+            env["GEN_MAX_CHAPTERS"] = str(job.chapters)
+        if job.custom_outline:
+            env["CUSTOM_OUTLINE"] = job.custom_outline
+        else:
+            env.pop("CUSTOM_OUTLINE", None)
+        if self.requests_per_minute:
+            # Each process has its own limiter, so the budget is split evenly across slots
+            env["GEN_REQUESTS_PER_MINUTE"] = str(self.requests_per_minute / self.workers)
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        log = open(os.path.join(self.log_dir, f"job_{job.id}.log"), "w", encoding="utf-8")
+        try:
+            process = subprocess.Popen(argv, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                       stdin=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            log.close()
+            self.queue.finish(job.id, FAILED, error=f"Could not start worker process: {e}")
+            return
+        self.queue.set_pid(job.id, process.pid)
+        self._running[job.id] = process
+        self._logs[job.id] = log
+        print(f"[queue] Started job {job.id} (run {job.run_id}, pid {process.pid})")
+
+    def _signal(self, process: subprocess.Popen, sig: int) -> None:
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _request_stop(self, job_id: int, process: subprocess.Popen) -> None:
+        """Ask main.py to checkpoint and exit; SIGKILL only once the grace period has passed"""
+        requested = self._stopping.get(job_id)
+        if requested is None:
+            self._signal(process, signal.SIGTERM)
+            self._stopping[job_id] = time.monotonic()
+        elif time.monotonic() - requested > self.stop_grace:
+            logger.warning(f"Job {job_id} ignored SIGTERM for {self.stop_grace}s; killing it")
+            self._signal(process, signal.SIGKILL)
+
+    def _reap(self, job_id: int, status: str, returncode: Optional[int], error: Optional[str] = None) -> None:
+        self.queue.finish(job_id, status, returncode=returncode, error=error)
+        self._running.pop(job_id, None)
+        self._stopping.pop(job_id, None)
+        self._logs.pop(job_id).close()
+        print(f"[queue] Job {job_id} {status}")
+
+    @staticmethod
+    def _group_alive(pgid: int) -> bool:
+        try:
+            os.killpg(pgid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _stop_orphans(self) -> int:
+        """Stop main.py processes left running by a worker service that died
+
+        Jobs run in their own session, so a recorded pid that still leads its
+        process group is the job's. Each group gets SIGTERM and the usual grace
+        period to checkpoint, then SIGKILL.
+
+        Returns:
+            int: Number of process groups that were still alive
+        """
+        orphans = {}
+        for job_id, pid in self.queue.running_pids().items():
+            try:
+                if os.getpgid(pid) == pid:
+                    orphans[job_id] = pid
+            except ProcessLookupError:
+                continue
+        for job_id, pid in orphans.items():
+            logger.warning(f"Stopping job {job_id} (pid {pid}) left running by a previous worker service")
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.stop_grace
+        while any(self._group_alive(pid) for pid in orphans.values()) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for job_id, pid in orphans.items():
+            if self._group_alive(pid):
+                logger.warning(f"Job {job_id} ignored SIGTERM for {self.stop_grace}s; killing it")
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        return len(orphans)
+
+    def poll_once(self) -> int:
+        """Reap finished jobs, stop cancelled ones and fill free slots
+
+        Returns:
+            int: Number of jobs running afterwards
+        """
+        for job_id, process in list(self._running.items()):
+            returncode = process.poll()
+            if returncode is None and self.queue.cancel_requested(job_id):
+                self._request_stop(job_id, process)
+            elif returncode is not None:
+                if self.queue.cancel_requested(job_id):
+                    self._reap(job_id, CANCELLED, returncode)
+                elif returncode == 0:
+                    self._reap(job_id, COMPLETED, returncode)
+                else:
+                    self._reap(job_id, FAILED, returncode, error=f"main.py exited with status {returncode}")
+
+        while len(self._running) < self.workers:
+            job = self.queue.claim_next()
+            if job is None:
+                break
+            self._launch(job)
+        return len(self._running)
+
+    def shutdown(self) -> None:
+        """Stop every running job, letting each checkpoint within the grace period"""
+        for job_id, process in self._running.items():
+            self._request_stop(job_id, process)
+        deadline = time.monotonic() + self.stop_grace
+        for job_id, process in list(self._running.items()):
+            try:
+                process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self._signal(process, signal.SIGKILL)
+                process.wait()
+            self._reap(job_id, CANCELLED, process.returncode, error="Worker service shut down")
+
+    def serve(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """Process jobs until stop_event is set
+
+        Returns:
+            bool: False if another worker service already owns the queue
+        """
+        pid = os.getpid()
+        if not self.queue.claim_service(pid):
+            logger.warning(f"Another worker service is already processing {self.queue.path}")
+            return False
+        self._stop_orphans()
+        interrupted = self.queue.fail_interrupted()
+        if interrupted:
+            logger.warning(f"Marked {interrupted} interrupted job(s) as failed")
+        print(f"[queue] Serving {self.queue.path} with {self.workers} worker(s)")
+        stop_event = stop_event or threading.Event()
+        try:
+            while not stop_event.is_set():
+                self.poll_once()
+                self.queue.claim_service(pid)  # Heartbeat
+                stop_event.wait(self.poll_interval)
+        finally:
+            self.shutdown()
+            self.queue.release_service(pid)
+        return True
+
+
+def ensure_worker_service(queue_path: str, workers: int = 2, requests_per_minute: Optional[float] = None) -> bool:
+    """Start a detached worker service for the queue unless one is alive
+
+    Returns:
+        bool: True if a new service was started
+    """
+    if JobQueue(queue_path).service_alive():
+        return False
+    argv = [sys.executable, os.path.abspath(__file__), "--queue", queue_path, "serve", "--workers", str(workers)]
+    if requests_per_minute:
+        argv += ["--rpm", str(requests_per_minute)]
+    # A racing second service exits on its own after failing claim_service
+    subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    return True
+
+
+def _format_job(job: Job) -> str:
+    line = f"{job.id:>5}  {job.status:<10} p{job.priority:<3} {job.genre:<12} {job.run_id}  {job.prompt[:40]}"
+    return line + (f"  ({job.error})" if job.error else "")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Book generation job queue")
+    parser.add_argument("--queue", default=None, help="Queue database (default: <GEN_OUTPUT_DIR>/jobs.sqlite3)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the worker service")
+    serve.add_argument("--workers", type=int, default=2, help="Maximum concurrent generations")
+    serve.add_argument("--rpm", type=float, default=None, help="Requests per minute shared by all workers")
+
+    submit = commands.add_parser("submit", help="Queue a book")
+    submit.add_argument("--prompt", required=True)
+    submit.add_argument("--genre", default=os.getenv("BOOK_GENRE"), required=not os.getenv("BOOK_GENRE"))
+    submit.add_argument("--model", default=None)
+    submit.add_argument("--chapters", type=int, default=None)
+    submit.add_argument("--custom-outline", default=None)
+    submit.add_argument("--priority", type=int, default=0)
+
+    status = commands.add_parser("status", help="Show queued and recent jobs")
+    status.add_argument("job_id", type=int, nargs="?")
+
+    cancel = commands.add_parser("cancel", help="Cancel a queued or running job")
+    cancel.add_argument("job_id", type=int)
+
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.queue or default_queue_path())
+
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO)
+        stop_event = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop_event.set())
+        return 0 if WorkerPool(queue, args.workers, args.rpm).serve(stop_event) else 1
+    if args.command == "submit":
+        job = queue.submit(args.prompt, args.genre, model=args.model, chapters=args.chapters,
+                           custom_outline=args.custom_outline, priority=args.priority)
+        print(f"Queued job {job.id} (run {job.run_id})")
+        if not queue.service_alive():
+            print("No worker service is running; start one with: python job_queue.py serve")
+        return 0
+    if args.command == "status":
+        if args.job_id is not None:
+            job = queue.get(args.job_id)
+            if job is None:
+                print(f"No job {args.job_id}", file=sys.stderr)
+                return 1
+            print(_format_job(job))
+            return 0
+        print(f"Service {'running' if queue.service_alive() else 'not running'}; {queue.counts()}")
+        for job in queue.list_jobs():
+            print(_format_job(job))
+        return 0
+    if not queue.cancel(args.job_id):
+        print(f"Job {args.job_id} is not queued or running", file=sys.stderr)
+        return 1
+    print(f"Cancelled job {args.job_id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Cooperative cancellation shared by the LLM clients and the orchestrator
+
+A signal handler cancels the process-wide token instead of exiting. Clients
+check it between stream chunks and before each attempt and abort with
+GenerationCancelled carrying whatever text had arrived. The orchestrator then
+flushes partial transcripts and a resumable checkpoint before the shutdown
+deadline.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(Exception):
+    """Raised when work stops because cancellation was requested
+
+    Attributes:
+        reason: Why cancellation was requested, e.g. the signal name
+        partial: Text received before the request was aborted
+    """
+
+    def __init__(self, reason: str = "cancelled", partial: str = ""):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag with an optional shutdown deadline"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        self.deadline: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled", grace: Optional[float] = None) -> None:
+        """Request cancellation; grace sets how long cleanup may take"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.deadline = time.monotonic() + grace if grace is not None else None
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.warning(f"Cancellation requested: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Cancellation callback failed: {e}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run callback when cancelled, immediately if already cancelled
+
+        Returns:
+            Callable[[], None]: Unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self, partial: str = "") -> None:
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason or "cancelled", partial)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout, waking early on cancellation
+
+        Returns:
+            bool: True if cancelled
+        """
+        return self._event.wait(timeout)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the shutdown deadline, if one was set"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._event.clear()
+            self._callbacks = []
+            self.reason = None
+            self.deadline = None
+
+
+# The token every client and the orchestrator check
+shutdown_token = CancellationToken()
+
+
+_ITEM, _DONE, _ERROR, _CANCELLED = range(4)
+
+
+def read_until_cancelled(
+    stream: Iterable[T],
+    close: Callable[[], None],
+    partial: Callable[[], str] = lambda: "",
+    token: Optional[CancellationToken] = None
+) -> Iterator[T]:
+    """Iterate a stream on a reader thread so cancellation also interrupts a stalled read
+
+    A stream only yields control between chunks, so a connection that stops
+    sending would hold a cancelled call until its idle timeout, past the
+    shutdown grace. Here the caller waits on a queue instead: on cancellation
+    close is called to release the connection and GenerationCancelled is
+    raised at once, carrying partial(). The reader fetches one item per
+    request, so it never reads ahead of the caller.
+    """
+    token = token or shutdown_token
+    handoff: "queue.Queue" = queue.Queue()
+    wanted = threading.Semaphore(0)
+    finished = threading.Event()
+
+    def read() -> None:
+        items = iter(stream)
+        try:
+            while True:
+                wanted.acquire()
+                if finished.is_set():
+                    return
+                try:
+                    item = next(items)
+                except StopIteration:
+                    handoff.put((_DONE, None))
+                    return
+                handoff.put((_ITEM, item))
+        except BaseException as e:
+            handoff.put((_ERROR, e))
+
+    def interrupt() -> None:
+        handoff.put((_CANCELLED, None))
+        close()
+
+    unregister = token.on_cancel(interrupt)
+    try:
+        threading.Thread(target=read, name="stream-reader", daemon=True).start()
+        while True:
+            wanted.release()
+            kind, value = handoff.get()
+            if kind == _ITEM:
+                yield value
+            elif kind == _ERROR:
+                token.raise_if_cancelled(partial())  # Errors caused by close() are the cancellation
+                raise value
+            elif kind == _CANCELLED:
+                token.raise_if_cancelled(partial())
+            else:
+                return
+    finally:
+        unregister()
+        finished.set()
+        wanted.release()  # Let an idle reader exit
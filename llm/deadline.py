@@ -0,0 +1,130 @@
+"""Per-call deadlines propagated from the chapter budget down to each HTTP request
+
+A deadline scope sets how long the work inside it may take. Nested scopes can
+only shorten the deadline, so a step's budget never outlives its chapter's.
+Clients read the current budget when they send a request: the connect timeout
+bounds connection setup, the idle timeout bounds the wait for each streamed
+chunk and the remaining total bounds the whole call.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_MIN_TIMEOUT = 0.001
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call's total deadline passes
+
+    Attributes:
+        label: The scope whose deadline passed
+        partial: Text received before the deadline
+    """
+
+    def __init__(self, label: str = "", partial: str = ""):
+        super().__init__(f"Deadline exceeded{f' for {label}' if label else ''}")
+        self.label = label
+        self.partial = partial
+
+
+class TimeoutDefaults:
+    """Timeouts used when no scope sets them; configured once at startup"""
+
+    def __init__(self, connect: float = 30.0, idle: float = 60.0, total: float = 300.0):
+        self.connect = connect
+        self.idle = idle
+        self.total = total
+
+    def configure(self, connect: Optional[float] = None, idle: Optional[float] = None,
+                  total: Optional[float] = None) -> None:
+        """Replace the defaults that are given; None keeps the current value"""
+        if connect:
+            self.connect = connect
+        if idle:
+            self.idle = idle
+        if total:
+            self.total = total
+
+
+timeout_defaults = TimeoutDefaults()
+
+
+@dataclass(frozen=True)
+class CallBudget:
+    """Timeouts for the calls made inside one scope"""
+    deadline: float  # time.monotonic() value
+    idle: float
+    connect: float
+    label: str = ""
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def total_timeout(self) -> float:
+        """Seconds left for a whole non-streaming call"""
+        return max(_MIN_TIMEOUT, self.remaining())
+
+    def read_timeout(self) -> float:
+        """Seconds to wait for the next chunk: the idle timeout, capped by the deadline"""
+        return max(_MIN_TIMEOUT, min(self.idle, self.remaining()))
+
+    def limited(self, total: Optional[float]) -> "CallBudget":
+        """This budget shortened to at most total seconds from now"""
+        if not total:
+            return self
+        return replace(self, deadline=min(self.deadline, time.monotonic() + total))
+
+    def check(self, partial: str = "") -> None:
+        """Raise DeadlineExceeded if the deadline has passed"""
+        if self.expired:
+            raise DeadlineExceeded(self.label, partial)
+
+
+_current: ContextVar[Optional[CallBudget]] = ContextVar("call_budget", default=None)
+
+
+def current_budget() -> CallBudget:
+    """The innermost scope's budget, or a fresh default budget for a single call"""
+    budget = _current.get()
+    if budget is None:
+        return CallBudget(time.monotonic() + timeout_defaults.total, timeout_defaults.idle,
+                          timeout_defaults.connect)
+    return budget
+
+
+@contextmanager
+def deadline_scope(total: Optional[float] = None, idle: Optional[float] = None,
+                   connect: Optional[float] = None, label: str = "") -> Iterator[CallBudget]:
+    """Run a block under a deadline no later than any enclosing scope's
+
+    Args:
+        total: Seconds the block may take; None inherits the enclosing deadline
+        idle: Longest wait for a streamed chunk; None inherits
+        connect: Connection setup timeout; None inherits
+        label: Name used in DeadlineExceeded messages and logs
+    """
+    parent = _current.get()
+    now = time.monotonic()
+    if parent is None:
+        deadline = now + (total or timeout_defaults.total)
+        parent_idle, parent_connect = timeout_defaults.idle, timeout_defaults.connect
+    else:
+        deadline = min(parent.deadline, now + total) if total else parent.deadline
+        parent_idle, parent_connect = parent.idle, parent.connect
+    budget = CallBudget(deadline, idle or parent_idle, connect or parent_connect,
+                        label or (parent.label if parent else ""))
+    logger.debug(f"Deadline scope {budget.label or '(unnamed)'}: {budget.remaining():.1f}s")
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
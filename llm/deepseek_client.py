@@ -2,10 +2,18 @@
 from types import SimpleNamespace
 from typing import Dict, List, Optional, Union
 import requests
+import json
 import os
 import logging
+import socket
 import time
 from autogen import oai
+from .cancellation import GenerationCancelled, read_until_cancelled, shutdown_token
+from .deadline import CallBudget, DeadlineExceeded, current_budget
+from .finish_reason import record_finish_reason
+from .rate_limiter import shared_rate_limiter
+from .reasoning import record_reasoning, split_reasoning
+from .stream_guard import LOOP_WORDS, RepetitionGuard
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,12 +44,13 @@ class DeepSeekClient:
         if not self.api_key:
             raise ValueError("API key not provided in config")
             
-        self.base_url = config.get('base_url', 'https://api.deepseek.com')
+        self.base_url = config.get('base_url') or 'https://api.deepseek.com'
         self.chat_endpoint = f"{self.base_url}/chat/completions"
         self.temperature = config.get('temperature', 0.7)
         self.max_tokens = config.get('max_tokens', 4096)
         self.retry_count = int(os.getenv('LITELLM_RETRY_COUNT', '3'))
         self.retry_delay = float(os.getenv('LITELLM_RETRY_DELAY', '1.0'))
+        self.loop_guard_words = kwargs.get('loop_guard_words', LOOP_WORDS)  # 0 disables loop detection
         
         logger.info("DeepSeek client initialized with API key length: %d", len(self.api_key))
         logger.info("Using base URL: %s", self.base_url)
@@ -70,7 +79,7 @@ class DeepSeekClient:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
-            "Accept": "application/json"
+            "Accept": "text/event-stream"
         }
         
         # Log request details (excluding API key)
@@ -83,58 +92,137 @@ class DeepSeekClient:
             "messages": params.get("messages", []),
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
-            "stream": False
+            # Streamed so cancellation can abort between chunks and keep the partial text
+            "stream": True,
+            "stream_options": {"include_usage": True}
         }
         
         logger.info("Request payload: %s", payload)
         
+        # Connect and idle timeouts per attempt; the total deadline spans all attempts
+        budget = current_budget()
         last_error = None
         for attempt in range(self.retry_count):
             try:
                 # Make the API request
                 logger.info("Attempt %d/%d", attempt + 1, self.retry_count)
+                shutdown_token.raise_if_cancelled()
+                budget.check()
+                shared_rate_limiter.acquire()
                 response = requests.post(
                     self.chat_endpoint,
                     headers=headers,
                     json=payload,
-                    timeout=60
+                    timeout=(budget.connect, budget.read_timeout()),
+                    stream=True
                 )
                 
                 # Log response details
                 logger.info("Response status: %d", response.status_code)
                 logger.info("Response headers: %s", response.headers)
-                logger.info("Response body: %s", response.text)
                 
                 response.raise_for_status()
-                data = response.json()
+                content, finish_reason, usage = self._read_stream(response, budget)
+                record_finish_reason(finish_reason)
+                logger.info("Response body: %s", content)
                 
                 # Convert to SimpleNamespace to match protocol
                 result = SimpleNamespace()
                 result.choices = []
                 result.model = "deepseek-chat"
+                result.usage = usage
                 
-                # Extract the message from the response
-                if data.get('choices') and len(data['choices']) > 0:
-                    for choice in data['choices']:
-                        choice_obj = SimpleNamespace()
-                        choice_obj.message = SimpleNamespace()
-                        choice_obj.message.content = choice['message']['content']
-                        choice_obj.message.role = choice['message']['role']
-                        choice_obj.message.function_call = None
-                        result.choices.append(choice_obj)
+                choice_obj = SimpleNamespace()
+                choice_obj.message = SimpleNamespace()
+                choice_obj.message.content = content
+                choice_obj.message.role = "assistant"
+                choice_obj.message.function_call = None
+                choice_obj.finish_reason = finish_reason
+                result.choices.append(choice_obj)
                 
                 logger.info("Successfully processed response")
                 return result
                 
+            except (GenerationCancelled, DeadlineExceeded):
+                raise
             except Exception as e:
                 last_error = e
                 logger.error("Error in attempt %d: %s", attempt + 1, str(e))
-                if attempt < self.retry_count - 1:
-                    time.sleep(self.retry_delay * (attempt + 1))
+                delay = self.retry_delay * (attempt + 1)
+                if attempt < self.retry_count - 1 and budget.remaining() > delay:
+                    shutdown_token.wait(delay)
                     continue
                 logger.error("Failed after %d attempts", self.retry_count)
                 raise last_error
 
+    def _read_stream(self, response: requests.Response, budget: Optional[CallBudget] = None):
+        """Assemble a streamed completion, aborting if shutdown is requested or the deadline passes
+
+        The idle timeout is enforced by the socket read timeout; the total
+        deadline is checked after every line. Cancellation shuts the
+        connection down even while a read is blocked. A stream that starts repeating
+        itself is closed, the loop is dropped and the finish reason is
+        "repetition". The reasoning trace is removed from the content and
+        recorded with llm.reasoning.record_reasoning.
+
+        Returns:
+            Tuple of the message content, the finish reason and the usage dict
+
+        Raises:
+            GenerationCancelled: With the text received so far; the connection is closed
+            DeadlineExceeded: With the text received so far; the connection is closed
+        """
+        parts, finish_reason, usage = [], None, {}
+        reasoning_parts = []
+        guard = RepetitionGuard(loop_words=self.loop_guard_words) if self.loop_guard_words else None
+        lines = read_until_cancelled(response.iter_lines(decode_unicode=True),
+                                     lambda: self._abort(response), lambda: "".join(parts))
+        try:
+            for line in lines:
+                if shutdown_token.cancelled:
+                    shutdown_token.raise_if_cancelled("".join(parts))
+                if budget is not None and budget.expired:
+                    budget.check("".join(parts))
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    delta = choice.get("delta") or {}
+                    parts.append(delta.get("content") or "")
+                    reasoning_parts.append(delta.get("reasoning_content") or "")
+                    finish_reason = choice.get("finish_reason") or finish_reason
+                    if guard:
+                        guard.feed(parts[-1])
+                if guard and guard.looping:
+                    logger.warning("Stream started repeating itself after %d words; stopped",
+                                   len(guard.kept().split()))
+                    return self._answer(guard.kept(), reasoning_parts), "repetition", usage
+        finally:
+            response.close()
+        return self._answer("".join(parts), reasoning_parts), finish_reason, usage
+
+    @staticmethod
+    def _abort(response: requests.Response) -> None:
+        """Close a stream from another thread; shutting the socket down wakes a blocked read"""
+        sock = getattr(getattr(getattr(response, "raw", None), "connection", None), "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
+
+    @staticmethod
+    def _answer(content: str, reasoning_parts: List[str]) -> str:
+        """Drop the reasoning trace from content and record it (or the reasoning_content deltas) instead"""
+        answer, reasoning = split_reasoning(content)
+        record_reasoning("".join(reasoning_parts).strip() or reasoning)
+        return answer
+
     def message_retrieval(self, response: SimpleNamespace) -> List[str]:
         """Retrieve messages from the response"""
         return [choice.message.content for choice in response.choices]
@@ -145,11 +233,12 @@ class DeepSeekClient:
 
     @staticmethod
     def get_usage(response: SimpleNamespace) -> Dict:
-        """Return usage statistics (placeholder)"""
+        """Return usage statistics reported at the end of the stream"""
+        usage = getattr(response, "usage", None) or {}
         return {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
             "cost": 0,
             "model": "deepseek-chat"
         }
@@ -10,10 +10,16 @@ from .litellm_implementations import (
 )
 from .interface import LLMInterface
 from .prompt import PromptConfig
-from .register_model_clients import register_deepseek_client
-import autogen
 from .litellm_base import LiteLLMBase
 
+# Accepted API key prefixes for providers that need a key
+API_KEY_PREFIXES = {
+    'openai': ('sk-',),
+    'deepseek': ('sk-', 'ds-'),
+    'gemini': ('AI',),
+    'groq': ('gsk_',),
+}
+
 class LLMFactory:
     """Factory for creating LLM instances"""
 
@@ -27,54 +33,39 @@ class LLMFactory:
 
         Returns:
             Configured LLMInterface instance
+
+        Raises:
+            ValueError: If the configuration is missing, malformed or names an unsupported model
         """
 
         # Validate required configuration
         if not isinstance(config, dict):
-            print("❌ Error: Invalid configuration format")
-            print("The LLM configuration must be provided as a dictionary")
-            exit(1)
-
-        if 'model' not in config:
-            print("❌ Error: Missing model configuration")
-            print("Please specify a model in your configuration")
-            print("Supported models:")
-            print("- mistral-nemo-instruct-2407 (local)")
-            print("- openai/ (e.g. openai/gpt-4)")
-            print("- deepseek/ (e.g. deepseek-chat)")
-            print("- gemini/ (e.g. gemini/gemini-pro)")
-            print("- groq/ (e.g. groq/llama2-70b)")
-            print("- ollama/ (e.g. ollama/llama2, ollama/deepseek-r1:14b)") # <-- Updated ollama list
-            exit(1)
+            raise ValueError("The LLM configuration must be provided as a dictionary")
+
+        if not config.get('model'):
+            raise ValueError(
+                "Missing model configuration. Supported models: mistral-nemo-instruct-2407 (local), "
+                "openai/ (e.g. openai/gpt-4), deepseek/ (e.g. deepseek-chat), gemini/ (e.g. gemini/gemini-pro), "
+                "groq/ (e.g. groq/llama2-70b), ollama/ (e.g. ollama/llama2, ollama/deepseek-r1:14b)"
+            )
 
         # Validate API key presence based on model type
         model = config['model'].lower()
-        if any(model.startswith(prefix) for prefix in ['openai/', 'deepseek/', 'gemini/', 'groq/']):
-            if 'api_key' not in config or not config['api_key']:
-                print(f"❌ Error: Missing API key for {model}")
-                print(f"Please provide a valid API key in your configuration")
-                print("You can set it via:")
-                print("1. The 'api_key' field in your config dictionary")
-                print("2. The appropriate environment variable:")
-                print("   - OPENAI_API_KEY for OpenAI models")
-                print("   - DEEPSEEK_API_KEY for DeepSeek models")
-                print("   - GEMINI_API_KEY for Gemini models")
-                print("   - GROQ_API_KEY for Groq models")
-                exit(1)
+        provider = 'deepseek' if model == 'deepseek-chat' else model.split('/', 1)[0]
+        if provider in API_KEY_PREFIXES:
+            api_key = config.get('api_key')
+            if not api_key:
+                raise ValueError(
+                    f"Missing API key for {model}. Set it in the config's 'api_key' field or via "
+                    f"{provider.upper()}_API_KEY"
+                )
 
             # Basic API key format validation
-            api_key = config['api_key']
-            if len(api_key) < 20 or not api_key.startswith(('sk-', 'ds-', 'AI')):
-                print(f"❌ Error: Invalid API key format for {model}")
-                print("API keys should be at least 20 characters long and start with:")
-                print("- 'sk-' for OpenAI")
-                print("- 'ds-' for DeepSeek")
-                print("- 'AI' for Gemini")
-                print("- 'ollama-' for Ollama (not required for localhost)") # <-- Added note about Ollama API key
-                exit(1)
-
-        # Register custom model clients
-        register_deepseek_client()
+            if len(api_key) < 20 or not api_key.startswith(API_KEY_PREFIXES[provider]):
+                raise ValueError(
+                    f"Invalid API key format for {model}: expected at least 20 characters "
+                    f"starting with {' or '.join(repr(p) for p in API_KEY_PREFIXES[provider])}"
+                )
 
         # Validate and create prompt configuration if provided
         prompt = None
@@ -90,6 +81,12 @@ class LLMFactory:
         # Create appropriate implementation based on model
         model = config['model'].lower()
 
+        # Per-use tuning (e.g. outline generation) passed through to LiteLLM
+        llm_kwargs = {
+            key: config[key] for key in ('timeout', 'max_tokens', 'temperature')
+            if config.get(key) is not None
+        }
+
         # Existing Mistral-Nemo implementation
         if model == 'mistral-nemo-instruct-2407':
             return MistralNemoImplementation(
@@ -103,58 +100,20 @@ class LLMFactory:
                 raise ValueError("OpenAI implementation requires api_key")
             return OpenAIImplementation(
                 model=model[7:],  # Remove 'openai/' prefix
-                api_key=config['api_key']
+                api_key=config['api_key'],
+                **llm_kwargs
             )
 
         if model.startswith('deepseek/') or model == 'deepseek-chat':
-            if 'api_key' not in config:
-                raise ValueError("DeepSeek implementation requires api_key")
-
-            # Get model from environment
-            model = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
-            print(f"Python sees LLM_MODEL as: {os.getenv('LLM_MODEL')}")
-            api_key = os.getenv('DEEPSEEK_API_KEY')
-
-            if not api_key:
-                raise ValueError("DEEPSEEK_API_KEY environment variable not set")
-
-            print(f"Using DeepSeek API with key length: {len(api_key)}")
-
-            # Create config for agent
-            config_list = [{
-                "model": model,
-                "api_key": api_key,
-                "temperature": 0.7,
-                "max_tokens": 4096
-            }]
-
-            # Create agents
-            assistant = autogen.AssistantAgent(
-                name="assistant",
-                llm_config={"config_list": config_list},
-                system_message="You are a helpful AI assistant."
-            )
-
-            user_proxy = autogen.UserProxyAgent(
-                name="user_proxy",
-                human_input_mode="NEVER",
-                max_consecutive_auto_reply=10,
-                llm_config={"config_list": config_list}
-            )
-
-            # Register DeepSeek client with both agents
-            register_deepseek_client(assistant)
-            register_deepseek_client(user_proxy)
-
-            # Create LiteLLM implementation with agents
-            return DeepSeekImplementation(assistant=assistant, user_proxy=user_proxy)
+            return DeepSeekImplementation(config, **llm_kwargs)
 
         if model.startswith('gemini/'):
             if 'api_key' not in config:
                 raise ValueError("Gemini implementation requires api_key")
             return GeminiImplementation(
                 model=model[7:],  # Remove 'gemini/' prefix
-                api_key=config['api_key']
+                api_key=config['api_key'],
+                **llm_kwargs
             )
 
         if model.startswith('groq/'):
@@ -162,13 +121,15 @@ class LLMFactory:
                 raise ValueError("Groq implementation requires api_key")
             return GroqImplementation(
                 model=model[5:],  # Remove 'groq/' prefix
-                api_key=config['api_key']
+                api_key=config['api_key'],
+                **llm_kwargs
             )
         if model.startswith('ollama/'): # <-- Ollama implementation
-            ollama_base_url = config.get('ollama_base_url')
+            ollama_base_url = config.get('ollama_base_url') or config.get('base_url')
             return OllamaImplementation(
                 model=model[7:],  # Remove 'ollama/' prefix
-                ollama_base_url=ollama_base_url # Pass base URL from config
+                ollama_base_url=ollama_base_url, # Pass base URL from config
+                **llm_kwargs
             )
         else:
             raise ValueError(f"Model '{config['model']}' is not supported or recognized.")
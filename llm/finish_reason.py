@@ -0,0 +1,22 @@
+"""Finish reason of the most recent completion in the current context
+
+Agents return only text, so clients record why a completion stopped here and
+the orchestrator reads it right after the call, in the same thread and
+context, to tell a truncated reply ("length") from a finished one.
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+_last_finish_reason: ContextVar[Optional[str]] = ContextVar("last_finish_reason", default=None)
+
+
+def record_finish_reason(reason: Optional[str]) -> None:
+    _last_finish_reason.set(reason)
+
+
+def last_finish_reason() -> Optional[str]:
+    return _last_finish_reason.get()
+
+
+def clear_finish_reason() -> None:
+    _last_finish_reason.set(None)
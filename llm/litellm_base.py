@@ -1,9 +1,15 @@
-from typing import Generator, Optional, List, Dict, Any
+from typing import Generator, Iterable, Optional, List, Dict, Any
 import os
 import logging
 import litellm
 import httpx
 from .interface import LLMInterface
+from .cancellation import GenerationCancelled, read_until_cancelled, shutdown_token
+from .deadline import CallBudget, DeadlineExceeded, current_budget
+from .finish_reason import record_finish_reason
+from .rate_limiter import shared_rate_limiter
+from .reasoning import ReasoningFilter, record_reasoning, split_reasoning
+from .stream_guard import LOOP_WORDS, RepetitionGuard
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +22,15 @@ class LiteLLMBase(LLMInterface):
     - Environment variable based configuration
     - Advanced error handling with retries
     - Modular model management
+    - Optional per-instance timeout, max_tokens and temperature
+    - Requests drawn from the process-wide shared rate limiter
+    - Cooperative cancellation: streams stop between chunks and retries stop waiting
+    - Deadlines from the enclosing deadline scope: a total timeout per call and
+      an idle timeout per streamed chunk
+    - Repetition-loop detection on streams: a stream that starts repeating
+      itself is closed and the loop is dropped (finish reason "repetition")
+    - Reasoning traces (<think> blocks) are removed from the answer and
+      recorded separately (see llm.reasoning)
     """
     
     def __init__(
@@ -35,6 +50,10 @@ class LiteLLMBase(LLMInterface):
         self.response_headers = {}
         self.retry_count = int(os.getenv('LITELLM_RETRY_COUNT', '3'))
         self.retry_delay = float(os.getenv('LITELLM_RETRY_DELAY', '1.0'))
+        self.timeout = kwargs.get('timeout')
+        self.max_tokens = kwargs.get('max_tokens')
+        self.temperature = kwargs.get('temperature')
+        self.loop_guard_words = kwargs.get('loop_guard_words', LOOP_WORDS)  # 0 disables loop detection
         
         if not self.api_key:
             error_msg = "API key must be provided or set in environment variables"
@@ -50,7 +69,6 @@ class LiteLLMBase(LLMInterface):
         function_call: Optional[str] = None
     ) -> str:
         """Generate text from a prompt with optional function calling"""
-        import time
         from litellm.exceptions import (
             RateLimitError,
             ServiceUnavailableError,
@@ -73,35 +91,49 @@ class LiteLLMBase(LLMInterface):
             params["base_url"] = self.base_url
         if self.organization:
             params["organization"] = self.organization
+        self._add_sampling_params(params)
         
         if functions:
             params["functions"] = functions
             params["function_call"] = function_call or "auto"
         
+        budget = self._call_budget()
         last_error = None
         for attempt in range(self.retry_count):
             try:
+                shutdown_token.raise_if_cancelled()
+                budget.check()
+                shared_rate_limiter.acquire()
                 response = litellm.completion(
                     return_response_headers=True,
+                    timeout=budget.total_timeout(),
                     **params
                 )
                 
                 # Update usage and store headers
                 self.total_tokens += response.usage.total_tokens
                 self.response_headers = response._headers
+                record_finish_reason(response.choices[0].finish_reason)
                 
-                return response.choices[0].message.content
+                message = response.choices[0].message
+                if not message.content:
+                    return message.content
+                answer, reasoning = split_reasoning(message.content)
+                record_reasoning(getattr(message, "reasoning_content", None) or reasoning)
+                return answer
                 
+            except (GenerationCancelled, DeadlineExceeded):
+                raise
             except RateLimitError as e:
                 last_error = e
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except ServiceUnavailableError as e:
                 last_error = e
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except APIError as e:
                 last_error = e
                 if e.status_code == 429:  # Rate limit
-                    time.sleep(self.retry_delay * (attempt + 1))
+                    self._backoff(attempt)
                 else:
                     raise
             except Exception as e:
@@ -119,7 +151,6 @@ class LiteLLMBase(LLMInterface):
         function_call: Optional[str] = None
     ) -> Generator[str, None, None]:
         """Stream text generation from a prompt with optional function calling"""
-        import time
         from litellm.exceptions import (
             RateLimitError,
             ServiceUnavailableError,
@@ -143,34 +174,40 @@ class LiteLLMBase(LLMInterface):
             params["base_url"] = self.base_url
         if self.organization:
             params["organization"] = self.organization
+        self._add_sampling_params(params)
         
         if functions:
             params["functions"] = functions
             params["function_call"] = function_call or "auto"
         
+        budget = self._call_budget()
         last_error = None
         for attempt in range(self.retry_count):
             try:
+                shutdown_token.raise_if_cancelled()
+                budget.check()
+                shared_rate_limiter.acquire()
                 response = litellm.completion(
+                    timeout=budget.total_timeout(),
+                    stream_timeout=budget.read_timeout(),
                     **params
                 )
                 
-                for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        self.total_tokens += 1
-                        yield chunk.choices[0].delta.content
+                yield from self._read_chunks(response, budget)
                 return
                 
+            except (GenerationCancelled, DeadlineExceeded):
+                raise
             except RateLimitError as e:
                 last_error = e
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except ServiceUnavailableError as e:
                 last_error = e
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except APIError as e:
                 last_error = e
                 if e.status_code == 429:  # Rate limit
-                    time.sleep(self.retry_delay * (attempt + 1))
+                    self._backoff(attempt)
                 else:
                     raise
             except Exception as e:
@@ -181,6 +218,80 @@ class LiteLLMBase(LLMInterface):
             f"Failed after {self.retry_count} attempts. Last error: {str(last_error)}"
         )
     
+    def _read_chunks(self, response: Iterable[Any], budget: CallBudget) -> Generator[str, None, None]:
+        """Yield the answer text of a streamed completion; record its finish reason and reasoning
+
+        Checks the deadline between chunks; cancellation also interrupts a
+        stalled read (see read_until_cancelled). Once the stream
+        starts looping it is closed and only the text before the loop is
+        yielded. <think> blocks are held back as reasoning.
+
+        Raises:
+            GenerationCancelled, DeadlineExceeded: With the text received so far; the stream is closed
+        """
+        guard = RepetitionGuard(loop_words=self.loop_guard_words) if self.loop_guard_words else None
+        reasoning = ReasoningFilter()
+        received = []
+        record_finish_reason(None)
+        record_reasoning(None)
+        chunks = read_until_cancelled(response, lambda: self._close_stream(response), lambda: "".join(received))
+        for chunk in chunks:
+            if shutdown_token.cancelled:
+                self._close_stream(response)
+                shutdown_token.raise_if_cancelled("".join(received))
+            if budget.expired:
+                self._close_stream(response)
+                budget.check("".join(received))
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                record_finish_reason(choice.finish_reason)
+            if getattr(choice.delta, "reasoning_content", None):
+                reasoning.add_reasoning(choice.delta.reasoning_content)
+            if not choice.delta.content:
+                continue
+            self.total_tokens += 1
+            received.append(choice.delta.content)
+            text = reasoning.feed(guard.feed(choice.delta.content) if guard else choice.delta.content)
+            if text:
+                yield text
+            if guard and guard.looping:
+                self._close_stream(response)
+                record_finish_reason("repetition")
+                logger.warning(f"{self.model} started repeating itself after {len(guard.kept().split())} words; "
+                               f"stream stopped")
+                break
+        tail = reasoning.feed(guard.flush()) if guard else ""
+        tail += reasoning.flush()
+        record_reasoning(reasoning.reasoning)
+        if tail:
+            yield tail
+
+    def _backoff(self, attempt: int) -> None:
+        """Wait before retrying, waking early if shutdown is requested"""
+        shutdown_token.wait(self.retry_delay * (attempt + 1))
+
+    @staticmethod
+    def _close_stream(response: Any) -> None:
+        """Close an in-flight stream so its HTTP connection is released"""
+        for target in (response, getattr(response, "completion_stream", None)):
+            close = getattr(target, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.debug(f"Error closing stream: {e}")
+
+    def _call_budget(self) -> CallBudget:
+        """Deadline for one call: the enclosing scope's, shortened by the per-instance timeout"""
+        return current_budget().limited(self.timeout)
+
+    def _add_sampling_params(self, params: Dict[str, Any]) -> None:
+        """Add the configured max_tokens and temperature to request params"""
+        if self.max_tokens:
+            params["max_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+
     def get_usage(self) -> Dict[str, Any]:
         """Get usage statistics for the LLM"""
         return {
@@ -191,7 +302,6 @@ class LiteLLMBase(LLMInterface):
 
     def test_connection(self) -> bool:
         """Test connection to the LLM service with advanced options"""
-        import time
         from litellm.exceptions import (
             RateLimitError,
             ServiceUnavailableError,
@@ -217,24 +327,28 @@ class LiteLLMBase(LLMInterface):
         last_error = None
         for attempt in range(self.retry_count):
             try:
+                shutdown_token.raise_if_cancelled()
+                shared_rate_limiter.acquire()
                 response = litellm.completion(
                     **params
                 )
                 logger.info("Connection test successful")
                 return True
+            except GenerationCancelled:
+                raise
             except RateLimitError as e:
                 last_error = e
                 logger.warning(f"Rate limited, retrying in {self.retry_delay * (attempt + 1)}s")
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except ServiceUnavailableError as e:
                 last_error = e
                 logger.warning(f"Service unavailable, retrying in {self.retry_delay * (attempt + 1)}s")
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except APIError as e:
                 last_error = e
                 if e.status_code == 429:  # Rate limit
                     logger.warning(f"Rate limited, retrying in {self.retry_delay * (attempt + 1)}s")
-                    time.sleep(self.retry_delay * (attempt + 1))
+                    self._backoff(attempt)
                 else:
                     logger.error(f"API error: {str(e)}")
                     break
@@ -253,7 +367,6 @@ class LiteLLMBase(LLMInterface):
         function_call: str = "auto"
     ) -> List[Dict[str, Any]]:
         """Perform parallel function calling with error handling"""
-        import time
         from litellm.exceptions import (
             RateLimitError,
             ServiceUnavailableError,
@@ -281,6 +394,8 @@ class LiteLLMBase(LLMInterface):
         last_error = None
         for attempt in range(self.retry_count):
             try:
+                shutdown_token.raise_if_cancelled()
+                shared_rate_limiter.acquire()
                 response = litellm.completion(
                     **params
                 )
@@ -300,19 +415,21 @@ class LiteLLMBase(LLMInterface):
                 logger.info(f"Successfully processed {len(results)} function calls")
                 return results
                 
+            except GenerationCancelled:
+                raise
             except RateLimitError as e:
                 last_error = e
                 logger.warning(f"Rate limited, retrying in {self.retry_delay * (attempt + 1)}s")
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except ServiceUnavailableError as e:
                 last_error = e
                 logger.warning(f"Service unavailable, retrying in {self.retry_delay * (attempt + 1)}s")
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(attempt)
             except APIError as e:
                 last_error = e
                 if e.status_code == 429:  # Rate limit
                     logger.warning(f"Rate limited, retrying in {self.retry_delay * (attempt + 1)}s")
-                    time.sleep(self.retry_delay * (attempt + 1))
+                    self._backoff(attempt)
                 else:
                     logger.error(f"API error: {str(e)}")
                     break
@@ -1,9 +1,13 @@
 """Implementations for various LiteLLM-based models, including Ollama, with debugging - CORRECTED REGISTER_MODEL"""
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 import os
 from .litellm_base import LiteLLMBase
 import litellm  # Ensure litellm is imported at the top
 from .deepseek_client import DeepSeekClient
+from .cancellation import shutdown_token
+from .deadline import current_budget
+from .finish_reason import last_finish_reason
+from .rate_limiter import shared_rate_limiter
 from types import SimpleNamespace
 import autogen
 import logging
@@ -25,11 +29,12 @@ class DeepSeekImplementation(LiteLLMBase):
     """Implementation for DeepSeek models"""
 
     def __init__(self, config: Dict, **kwargs):
-        """Initialize with configuration"""
+        """Initialize with configuration (model "deepseek-chat" or "deepseek/<name>")"""
+        name = (config.get("model") or "deepseek-chat").split("/")[-1]
         super().__init__(
-            model="deepseek-chat",
+            model=f"deepseek/{name}",
             api_key=config.get("api_key"),
-            base_url=config.get("base_url", "https://api.deepseek.com"),
+            base_url=config.get("base_url") or "https://api.deepseek.com",
             **kwargs
         )
         self.client = DeepSeekClient(config)
@@ -92,11 +97,16 @@ class OllamaImplementation(LiteLLMBase):
             is_chat_model=True
         )
 
-    def __init__(self, model: str, api_key: str = None, ollama_base_url: str = None, **kwargs):
+    def __init__(self, model: Union[str, Dict], api_key: str = None, ollama_base_url: str = None, **kwargs):
+        if isinstance(model, dict):  # Built by autogen's register_model_client from a config_list entry
+            config = model
+            model = config["model"].split("/", 1)[-1]  # "ollama/llama2" -> "llama2"
+            api_key = api_key or config.get("api_key")
+            ollama_base_url = ollama_base_url or config.get("ollama_base_url") or config.get("base_url")
         super().__init__(
             model=f"ollama/{model}", # Keep full ollama model string for internal model tracking
             base_url=ollama_base_url or os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'),
-            api_key=api_key,  # Ollama typically doesn't need an API key for local deployment
+            api_key=api_key or os.getenv('OLLAMA_API_KEY', 'ollama'),  # Ollama typically doesn't need an API key for local deployment
             **kwargs
         )
 
@@ -128,18 +138,41 @@ class OllamaImplementation(LiteLLMBase):
         logger.debug(f"OllamaImplementation create params: {params}") # ADDED: Log params in OllamaImplementation.create
         logger.debug(f"OllamaImplementation base_url: {self.base_url}") # ADDED: Log base_url in OllamaImplementation.create
         # model_name_for_litellm = self.model.split('/')[-1].split(':')[0] # No longer needed - use full model string
+        budget = current_budget().limited(self.timeout)
+        shutdown_token.raise_if_cancelled()
+        budget.check()
+        shared_rate_limiter.acquire()
         response = litellm.completion( # Call litellm.completion directly, passing FULL model string
             model=self.model, # Use FULL model string, e.g., "ollama/deepseek-r1:14b" # Modified line - use full model string NOW
             messages=params["messages"],
             base_url=self.base_url,
-            provider="ollama" # Explicitly set the provider to ollama
+            provider="ollama", # Explicitly set the provider to ollama
+            timeout=budget.total_timeout(),
+            stream=True,  # Streamed so a repetition loop is stopped instead of running to max_tokens
+            stream_timeout=budget.read_timeout()
         )
-        response_content = response.choices[0].message.content
+        response_content = "".join(self._read_chunks(response, budget))
+        finish_reason = last_finish_reason()
         result = SimpleNamespace()
-        result.choices = [SimpleNamespace(message=SimpleNamespace(content=response_content, role="assistant", function_call=None))]
+        result.choices = [SimpleNamespace(message=SimpleNamespace(content=response_content, role="assistant", function_call=None),
+                                          finish_reason=finish_reason)]
         result.model = self.model # Keep full ollama model string for internal tracking
         return result
 
+    def message_retrieval(self, response: SimpleNamespace) -> List[str]:
+        """Retrieve messages from a create() response (autogen ModelClient protocol)"""
+        return [choice.message.content for choice in response.choices]
+
+    def cost(self, response: SimpleNamespace) -> float:
+        """Local models cost nothing"""
+        return 0.0
+
+    def get_usage(self, response: Optional[SimpleNamespace] = None) -> Dict[str, Any]:
+        """Usage statistics for the client, or for a create() response when autogen passes one"""
+        if response is None:
+            return super().get_usage()
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0, "model": response.model}
+
 
 class O1PreviewImplementation(LiteLLMBase):
     """Implementation for O1-Preview models"""
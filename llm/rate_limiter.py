@@ -0,0 +1,68 @@
+"""Process-wide request rate limiting shared by every LLM client
+
+All clients (LiteLLM implementations, the DeepSeek autogen client and the
+Ollama client) acquire from the same limiter, so concurrent books in one
+process share a single provider budget. The limiter is unlimited until
+configured.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from .cancellation import shutdown_token
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Thread-safe token bucket measured in requests per minute"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, burst: Optional[int] = None):
+        self._lock = threading.Lock()
+        self.configure(requests_per_minute, burst)
+
+    def configure(self, requests_per_minute: Optional[float] = None, burst: Optional[int] = None) -> None:
+        """Set the request budget; None or 0 disables limiting"""
+        with self._lock:
+            self.requests_per_minute = requests_per_minute or None
+            self.capacity = float(burst or 1)
+            self._tokens = self.capacity
+            self._updated = time.monotonic()
+            self.total_wait = 0.0
+            self.requests = 0
+
+    def acquire(self) -> float:
+        """Block until a request may be sent
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            GenerationCancelled: If shutdown is requested while waiting
+        """
+        if not self.requests_per_minute:
+            with self._lock:
+                self.requests += 1
+            return 0.0
+
+        rate = self.requests_per_minute / 60.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    self.total_wait += waited
+                    return waited
+                delay = (1 - self._tokens) / rate
+            if shutdown_token.wait(delay):
+                shutdown_token.raise_if_cancelled()
+            waited += delay
+
+
+# The limiter every client acquires from
+shared_rate_limiter = RateLimiter()
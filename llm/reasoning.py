@@ -0,0 +1,106 @@
+"""Separate reasoning traces from answers in model output
+
+Reasoning models such as deepseek-r1 wrap their chain of thought in
+<think>...</think> before the answer. Only the answer belongs in the
+transcript: the reasoning would be re-sent to every later agent and can leak
+into chapters. Clients filter it out as the stream arrives and record it
+here, next to the finish reason, for the orchestrator to read right after
+the call in the same thread and context.
+"""
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+
+_last_reasoning: ContextVar[Optional[str]] = ContextVar("last_reasoning", default=None)
+
+
+def record_reasoning(reasoning: Optional[str]) -> None:
+    _last_reasoning.set(reasoning or None)
+
+
+def last_reasoning() -> Optional[str]:
+    return _last_reasoning.get()
+
+
+def clear_reasoning() -> None:
+    _last_reasoning.set(None)
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """Length of the longest prefix of tag that text ends with"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ReasoningFilter:
+    """Split a stream into answer text and <think> reasoning, even when tags span chunks
+
+    Feed each chunk and forward what feed returns; when the stream ends,
+    forward flush(). Reasoning from a separate field (e.g. a
+    reasoning_content delta) can be added with add_reasoning.
+    """
+
+    def __init__(self):
+        self._reasoning: List[str] = []
+        self._buffer = ""
+        self._thinking = False
+        self._answer_started = False
+
+    @property
+    def reasoning(self) -> str:
+        return "".join(self._reasoning).strip()
+
+    def add_reasoning(self, text: str) -> None:
+        self._reasoning.append(text)
+
+    def _route(self, text: str, answer: List[str]) -> None:
+        if self._thinking:
+            self._reasoning.append(text)
+            return
+        if not self._answer_started:
+            text = text.lstrip()  # The answer usually follows the closing tag after a blank line
+            self._answer_started = bool(text)
+        if text:
+            answer.append(text)
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the answer text it completes"""
+        self._buffer += chunk
+        answer: List[str] = []
+        while True:
+            tag = CLOSE_TAG if self._thinking else OPEN_TAG
+            index = self._buffer.find(tag)
+            if index < 0:
+                break
+            self._route(self._buffer[:index], answer)
+            self._buffer = self._buffer[index + len(tag):]
+            self._thinking = not self._thinking
+        keep = _partial_tag(self._buffer, CLOSE_TAG if self._thinking else OPEN_TAG)
+        self._route(self._buffer[:len(self._buffer) - keep], answer)
+        self._buffer = self._buffer[len(self._buffer) - keep:]
+        return "".join(answer)
+
+    def flush(self) -> str:
+        """The answer text still held back; an unclosed <think> block stays reasoning"""
+        answer: List[str] = []
+        self._route(self._buffer, answer)
+        self._buffer = ""
+        return "".join(answer)
+
+
+def split_reasoning(text: str) -> Tuple[str, str]:
+    """Split complete model output into (answer, reasoning)
+
+    Also handles output whose opening tag was part of the prompt template,
+    so only the closing tag appears.
+    """
+    if CLOSE_TAG in text and OPEN_TAG not in text:
+        reasoning, answer = text.split(CLOSE_TAG, 1)
+        return answer.strip(), reasoning.strip()
+    reasoning_filter = ReasoningFilter()
+    answer = reasoning_filter.feed(text) + reasoning_filter.flush()
+    return answer.strip(), reasoning_filter.reasoning
@@ -0,0 +1,117 @@
+"""Online repetition-loop detection for streamed completions
+
+Local models sometimes fall into a loop, repeating the same passage until
+max_tokens runs out. The guard hashes every word n-gram of the stream with a
+rolling hash as it arrives. A long enough run of n-grams that all occurred
+earlier means the model is copying itself, and the stream can be stopped
+there. Only the most recent n-grams are remembered, so memory stays bounded
+however long the stream runs. Text that might be the start of a loop is held
+back until it is known not to be, so a stopped stream never emits the
+repeated passage.
+"""
+import re
+from collections import Counter, deque
+from typing import Deque, List, Optional
+
+NGRAM_WORDS = 8
+LOOP_WORDS = 60  # Consecutive repeated n-grams that count as a loop
+HISTORY_NGRAMS = 4096  # N-grams remembered; a loop must repeat within this many words
+
+_MODULUS = (1 << 61) - 1
+_BASE = 1_000_003
+_WORD = re.compile(r"\S+")
+
+
+class RepetitionGuard:
+    """Watch a stream for a verbatim loop and release only text that is not part of one
+
+    Feed each chunk and emit what feed returns; when the stream ends (or
+    looping turns True and the stream is closed), emit flush().
+    """
+
+    def __init__(self, ngram: int = NGRAM_WORDS, loop_words: int = LOOP_WORDS, history: int = HISTORY_NGRAMS):
+        self.ngram = ngram
+        self.loop_words = loop_words
+        self.history = history
+        self.text = ""
+        self._word_starts: List[int] = []
+        self._window: Deque[int] = deque()
+        self._hash = 0
+        self._drop = pow(_BASE, ngram - 1, _MODULUS)  # Weight of the word leaving the window
+        self._history: Deque[int] = deque()  # Recent n-gram hashes, oldest first
+        self._seen: Counter = Counter()  # Hash -> occurrences in _history
+        self._run_start: Optional[int] = None  # Index of the first word whose n-gram repeated, in the current run
+        self._scanned = 0
+        self._emitted = 0
+
+    @property
+    def looping(self) -> bool:
+        return self._run_start is not None and len(self._word_starts) - self._run_start >= self.loop_words
+
+    @property
+    def loop_start(self) -> Optional[int]:
+        """Character offset where the repeated passage begins, once looping"""
+        if not self.looping:
+            return None
+        return self._word_starts[max(0, self._run_start - self.ngram + 1)]
+
+    def _add_word(self, start: int, word: str) -> None:
+        self._word_starts.append(start)
+        value = hash(word.lower()) & _MODULUS
+        if len(self._window) == self.ngram:
+            self._hash = (self._hash - self._window.popleft() * self._drop) % _MODULUS
+        self._window.append(value)
+        self._hash = (self._hash * _BASE + value) % _MODULUS
+        if len(self._window) < self.ngram:
+            return
+        if self._hash in self._seen:
+            if self._run_start is None:
+                self._run_start = len(self._word_starts) - 1
+        else:
+            self._run_start = None
+        self._remember(self._hash)
+
+    def _remember(self, ngram_hash: int) -> None:
+        """Record an n-gram, forgetting the oldest once history is full"""
+        self._history.append(ngram_hash)
+        self._seen[ngram_hash] += 1
+        if len(self._history) > self.history:
+            oldest = self._history.popleft()
+            self._seen[oldest] -= 1
+            if not self._seen[oldest]:
+                del self._seen[oldest]
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the text now safe to emit"""
+        if self.looping:
+            return ""
+        self.text += chunk
+        # Only words followed by whitespace are complete; a chunk may end mid-word
+        for match in _WORD.finditer(self.text, self._scanned):
+            if match.end() == len(self.text):
+                break
+            self._add_word(match.start(), match.group())
+            self._scanned = match.end()
+            if self.looping:
+                return ""
+        # Hold back the last n-1 words, which the next word may make the start of a repeat, and any run in progress
+        held = len(self._word_starts) - self.ngram + 1
+        if self._run_start is not None:
+            held = min(held, self._run_start - self.ngram + 1)
+        if held <= 0:
+            return ""
+        return self._release(self._word_starts[held] if held < len(self._word_starts) else self._scanned)
+
+    def flush(self) -> str:
+        """The remaining text to emit: everything before the loop, or the whole rest if there was none"""
+        return self._release(len(self.text) if self.loop_start is None else self.loop_start)
+
+    def kept(self) -> str:
+        """The whole text without the looped passage"""
+        return self.text if self.loop_start is None else self.text[:self.loop_start].rstrip()
+
+    def _release(self, end: int) -> str:
+        if end <= self._emitted:
+            return ""
+        released, self._emitted = self.text[self._emitted:end], end
+        return released
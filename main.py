@@ -1,43 +1,132 @@
-"""Main script for running the book generation system - now with SIGTERM signal handling"""
 #!/usr/bin/env python3
-import autogen # <----- ADD THIS LINE:  Crucial import for AutoGen
-print(f"--- DEBUG: AutoGen version at runtime: {autogen.__version__} ---") # ADD THIS LINE - Debug print for AutoGen version
-print("--- main.py script started ---")
-print("--- Debugging main.py: CUSTOM_OUTLINE check ---")
-import os
-import logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+"""Main script for running the book generation system - now with SIGTERM signal handling
 
-logger.debug("--- DEBUG: Main script started in DEBUG mode ---")  # Add this line
-
-print("--- Standard output test from main.py ---") # Keep this print
-from logging.config import dictConfig
+Heavy dependencies (autogen, litellm, the agent and generator modules) are
+imported only after arguments and configuration have been validated, so
+--help and configuration errors return immediately.
+"""
+import argparse
+import importlib
 import json
-from config import get_settings
+import logging
+import os
 import signal
 import sys
+import threading
+import time
 
-print(f"Python sys.path: {sys.path}")  # Print Python path for debugging
-
-# Configure logging (simplified for brevity)
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from agents import BookAgents
-from book_generator import BookGenerator
-from outline_generator import OutlineGenerator
-from fixed_outline import fixed_outline_data  # ADD THIS LINE - import fixed outline
+# Module name -> seconds spent importing it, reported by --import-time
+STARTUP_PROFILE = {}
 
 stop_book_generation = False
+shutdown_grace = 30.0  # Seconds allowed for checkpointing after a stop signal; set from settings
+
+DEFAULT_PROMPT = "Write a book about a dystopian future where AI controls society."
+EXIT_CANCELLED = 130
+
+def _force_exit():
+    print("\nShutdown deadline passed; exiting without finishing cleanup.", file=sys.stderr)
+    os._exit(EXIT_CANCELLED)
 
 def signal_handler(sig, frame):
+    """Request cooperative shutdown; a second signal or the grace deadline exits at once"""
     global stop_book_generation
-    print("\nStopping book generation process...")
+    if stop_book_generation:
+        _force_exit()
+    print("\nStopping book generation process... in-flight work will be checkpointed")
     stop_book_generation = True
-    sys.exit(0)
+    from llm.cancellation import shutdown_token
+    shutdown_token.cancel(signal.Signals(sig).name, grace=shutdown_grace)
+    watchdog = threading.Timer(shutdown_grace, _force_exit)
+    watchdog.daemon = True
+    watchdog.start()
+
+def install_signal_handlers(grace: float) -> None:
+    global shutdown_grace
+    shutdown_grace = grace
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+def _timed_import(module_name: str):
+    """Import a module on first use, recording how long it took"""
+    already_loaded = module_name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not already_loaded:
+        STARTUP_PROFILE[module_name] = time.perf_counter() - start
+    return module
+
+def print_startup_profile():
+    """Print import costs collected so far, slowest first"""
+    print("\n=== Startup import profile ===")
+    for name, seconds in sorted(STARTUP_PROFILE.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {name:24s} {seconds * 1000:8.1f} ms")
+    print(f"  {'total':24s} {sum(STARTUP_PROFILE.values()) * 1000:8.1f} ms")
+    print("For a per-module breakdown run: python -X importtime main.py --help")
 
-signal.signal(signal.SIGTERM, signal_handler)
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate a book with AI agents. Select a genre first with ./select_genre.py."
+    )
+    parser.add_argument("--import-time", action="store_true",
+                        help="Print how long each heavy dependency took to import")
+    parser.add_argument("--log-level", default=None,
+                        help="Logging level (defaults to LOG_LEVEL from settings)")
+    parser.add_argument("--prompt", default=os.getenv("INITIAL_BOOK_PROMPT", DEFAULT_PROMPT),
+                        help="Book premise (defaults to INITIAL_BOOK_PROMPT or an example prompt)")
+    parser.add_argument("--run-id", default=os.getenv("RUN_ID"),
+                        help="Id for this run's output directory (defaults to RUN_ID or a new timestamped id)")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None,
+                        help="Continue a cancelled or incomplete run from its checkpoint")
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument("--batch", metavar="MANIFEST",
+                       help="Generate every book in a JSONL manifest (prompt, genre, chapters, model) without prompting")
+    batch.add_argument("--concurrency", type=int, default=2,
+                       help="Maximum number of books generated at once (default: 2)")
+    batch.add_argument("--rpm", type=float, default=None,
+                       help="Requests per minute shared by all books (default: GEN_REQUESTS_PER_MINUTE or unlimited)")
+    batch.add_argument("--output-root", default="batch_output",
+                       help="Directory receiving one run directory per book, the run catalog and summary.json")
+    return parser.parse_args(argv)
+
+def run_batch(args, settings) -> int:
+    """Generate all books in a manifest and print the throughput summary"""
+    batch_runner = _timed_import("batch_runner")
+    try:
+        jobs = batch_runner.load_manifest(args.batch)
+    except (OSError, ValueError) as e:
+        print(f"Manifest error: {e}", file=sys.stderr)
+        return 2
+    if not jobs:
+        print(f"Manifest error: {args.batch} contains no books", file=sys.stderr)
+        return 2
+
+    print(f"Batch: {len(jobs)} books, concurrency {args.concurrency}, output in {args.output_root}")
+    runner = batch_runner.BatchRunner(settings, args.output_root, concurrency=args.concurrency,
+                                      requests_per_minute=args.rpm or settings.generation.requests_per_minute)
+    summary = runner.run(jobs)
+    print(summary.format())
+    return 0 if all(r.status == "completed" for r in summary.results) else 1
+
+def load_settings():
+    """Load and validate settings, reporting configuration errors without a traceback
+
+    Returns:
+        Settings or None: The validated settings, or None after printing the error
+    """
+    config = _timed_import("config")
+    try:
+        settings = config.get_settings()
+    except Exception as e:
+        print(f"Configuration error: {e}", file=sys.stderr)
+        return None
+    if not settings.llm.model:
+        print("Configuration error: no LLM model configured. Set LLM__MODEL in .env (see env.example).",
+              file=sys.stderr)
+        return None
+    return settings
 
 def load_custom_outline(outline_path):
     chapters = []
@@ -83,95 +172,171 @@ def display_startup_info(genre_config, outline):
     # ... (rest of your display_startup_info function - unchanged) ...
     input("\nPress Enter to start book generation...")
 
-def main():
-    print("--- main() function in main.py started ---")
+def configure_timeouts(settings) -> None:
+    """Set the timeouts LLM calls use outside any chapter or step deadline"""
+    _timed_import("llm.deadline").timeout_defaults.configure(
+        connect=settings.llm.connection_timeout,
+        idle=settings.timeouts.stream_idle,
+        total=settings.timeouts.request_total)
+
+def main(argv=None) -> int:
     global stop_book_generation
+    args = parse_args(argv)
+
+    if args.batch:
+        # Genres come from the manifest, so no interactive genre selection is needed
+        settings = load_settings()
+        if settings is None:
+            return 2
+        logging.basicConfig(level=(args.log_level or settings.logging.level).upper())
+        install_signal_handlers(settings.generation.shutdown_grace_seconds)
+        configure_timeouts(settings)
+        return run_batch(args, settings)
 
     genre = os.getenv('BOOK_GENRE')
-    print(f"--- BOOK_GENRE env var in main.py: {genre} ---")
     if not genre:
-        print("No genre selected. Please run './select_genre.py' first.")
-        return
+        print("No genre selected. Please run './select_genre.py' first.", file=sys.stderr)
+        return 2
 
-    settings = get_settings()
-    print("--- Settings object created in main.py ---")
+    settings = load_settings()
+    if settings is None:
+        return 2
 
-    # ... (API key validation section - unchanged) ...
+    logging.basicConfig(level=(args.log_level or settings.logging.level).upper())
+    install_signal_handlers(settings.generation.shutdown_grace_seconds)
+    configure_timeouts(settings)
+    if settings.generation.requests_per_minute:
+        _timed_import("llm.rate_limiter").shared_rate_limiter.configure(settings.generation.requests_per_minute)
+
+    # Validation passed; now pay for the heavy imports
+    BookAgents = _timed_import("agents").BookAgents
+    BookGenerator = _timed_import("book_generator").BookGenerator
+    OutlineGenerator = _timed_import("outline_generator").OutlineGenerator
+    fixed_outline_data = _timed_import("fixed_outline").fixed_outline_data
+    if args.import_time:
+        print_startup_profile()
+
+    GenerationCancelled = _timed_import("llm.cancellation").GenerationCancelled
+    DeadlineExceeded = _timed_import("llm.deadline").DeadlineExceeded
+    RunDirectory = _timed_import("run_store").RunDirectory
 
     genre_config = load_genre_config(genre)
     logger.debug(f"Loaded genre config: {genre_config}")
 
-    initial_prompt = "Write a book about a dystopian future where AI controls society."  # Example prompt
+    initial_prompt = args.prompt
+    resume_run = None
+    if args.resume:
+        try:
+            resume_run = RunDirectory.open(settings.generation.output_dir, args.resume)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Resume error: {e}", file=sys.stderr)
+            return 2
+        initial_prompt = resume_run.read_manifest().get("prompt", initial_prompt)
     print(f"Initial prompt: {initial_prompt}")
 
     num_chapters = settings.generation.max_chapters
     # --- MOVED BookAgents and agents CREATION UP HERE, BEFORE the if/else block ---
     # Create agents with genre configuration (BookAgents now expects outline=None initially)
-    outline_agents = BookAgents(settings.llm, None, genre_config)  # Pass outline=None initially
-    print("--- BookAgents (outline) created in main.py ---")
-
-    # --- DEBUGGING PRINTS - ADDED HERE ---
-    print("--- DEBUG: LLM Config BEFORE agent creation ---")
-    llm_config_for_agents = settings.get_llm_config() # Get LLM config dict
-    print(f"--- DEBUG: llm_config from settings.get_llm_config(): {llm_config_for_agents}") # Print the config dict
-    print(f"--- DEBUG: settings.llm: {settings.llm}") # Print the settings.llm object itself
-    print("--- DEBUG: End LLM Config ---")
-    # --- END DEBUGGING PRINTS ---
-
-    agents = outline_agents.create_agents(initial_prompt, num_chapters)
+    book_agents = BookAgents(settings.llm, None, genre_config)  # Outline attached later; agents are built once
+    print("--- BookAgents created in main.py ---")
+
+    logger.debug(f"LLM model before agent creation: {settings.llm.model}")
+
+    agents = book_agents.create_agents(initial_prompt, num_chapters)
     print("--- Agents created in main.py ---")
+    logger.info(f"Startup metrics: {book_agents.startup_metrics()}")
     # --- END MOVED SECTION ---
 
     # Check if using custom outline
     custom_outline_path = os.getenv('CUSTOM_OUTLINE')
-    print(f"--- DEBUG: CUSTOM_OUTLINE env var value: '{custom_outline_path}' (Type: {type(custom_outline_path)}) ---")
+    logger.debug(f"CUSTOM_OUTLINE env var value: '{custom_outline_path}' (Type: {type(custom_outline_path)})")
 
     outline = None
     use_fixed_outline = os.getenv('USE_FIXED_OUTLINE', 'False').lower() == 'true'  # ADD THIS LINE - check for env var
 
-    if use_fixed_outline:  # ADD THIS BLOCK - use fixed outline if env var is set
-        print("--- DEBUG: Using FIXED OUTLINE from fixed_outline.py ---")
+    if resume_run is not None:
+        outline_path = os.path.join(resume_run.chapters_dir, "outline.json")
+        if not os.path.exists(outline_path):
+            print(f"Resume error: run {resume_run.run_id} has no saved outline", file=sys.stderr)
+            return 2
+        with open(outline_path, 'r', encoding='utf-8') as f:
+            outline = json.load(f)
+        logger.info(f"Resuming run {resume_run.run_id} with {len(outline)} chapters")
+    elif use_fixed_outline:  # ADD THIS BLOCK - use fixed outline if env var is set
+        logger.debug("Using FIXED OUTLINE from fixed_outline.py")
         outline = fixed_outline_data
     elif custom_outline_path and os.path.exists(custom_outline_path): # Changed to ELIF
-        print("--- DEBUG: Custom outline path condition is TRUE ---")
+        logger.debug("Custom outline path condition is TRUE")
         logger.info(f"Loading custom outline from: {custom_outline_path}")
         outline = load_custom_outline(custom_outline_path)
         if not outline:
             logger.error("Failed to load custom outline, check format")
-            return
+            return 1
         logger.info(f"Loaded outline with {len(outline)} chapters")
     elif not use_fixed_outline: # Use ELIF and check NOT use_fixed_outline here # Changed from ELSE to ELIF
         # Only generate outline with LLM if NOT using fixed and NOT using custom outline
-        print("--- DEBUG: Proceeding to LLM Outline Generation ---")  # Updated debug message
-        print("--- DEBUG: Custom outline path condition is FALSE - Generating outline automatically with LLM ---")  # DEBUG message updated
+        logger.debug("Proceeding to LLM Outline Generation")  # Updated debug message
+        logger.debug("Custom outline path condition is FALSE - Generating outline automatically with LLM")  # DEBUG message updated
         logger.info("No custom outline provided - generating outline automatically.")
-        llm_config = settings.get_llm_config()
-        print("--- llm_config obtained in main.py ---")
+        outline_llm_config = settings.get_outline_llm_config()  # Outline model/timeout tuned separately from prose
+        print("--- outline llm_config obtained in main.py ---")
         print("--- Before OutlineGenerator ---")
-        outline_gen = OutlineGenerator(agents, llm_config)  # 'agents' is now defined BEFORE OutlineGenerator
+        outline_gen = OutlineGenerator(agents, outline_llm_config)  # 'agents' is now defined BEFORE OutlineGenerator
         print("--- After OutlineGenerator ---")
         print("--- Before generate_outline ---")
-        outline = outline_gen.generate_outline(initial_prompt, num_chapters)
+        try:
+            # No on_chapter: agents already exist, and chapter 1 cannot start early because
+            # set_outline puts the whole outline into every agent's system message
+            outline = outline_gen.generate_outline(initial_prompt, num_chapters)
+        except GenerationCancelled:
+            print("Cancelled during outline generation; nothing to resume.")
+            return EXIT_CANCELLED
+        except DeadlineExceeded as e:
+            logger.error(f"Outline generation timed out: {e}")
+            return 1
         print("--- After generate_outline ---")
         if not outline:
             logger.error("Outline generation failed.")
-            return
+            return 1
+
+    # Reuse the same agents; only the outline section of their system messages is refreshed
+    book_agents.set_outline(outline)
 
-    # Create new agents with outline context and genre configuration (now using book_agents, not outline_agents)
-    book_agents = BookAgents(settings.llm, outline, genre_config)  # Re-create BookAgents with outline
-    agents_with_context = book_agents.create_agents(initial_prompt, num_chapters)  # Re-create agents with context
+    # Each run writes to its own directory so concurrent runs never share files
+    if resume_run is not None:
+        run = resume_run
+        run.update_manifest(status="running")
+    else:
+        run = RunDirectory.create(
+            settings.generation.output_dir, args.run_id,
+            metadata={"prompt": initial_prompt, "genre": genre, "model": settings.llm.model, "chapters": len(outline)})
+    print(f"Run {run.run_id}: output in {run.path}")
 
-    # Use the new agents for book generation
-    book_generator = BookGenerator(agents_with_context, settings.get_llm_config(), outline)
+    book_generator = BookGenerator(agents, settings.get_llm_config(), outline,
+                                   planning_concurrency=settings.generation.planning_concurrency,
+                                   draft_sections=settings.generation.draft_sections,
+                                   scene_beats=settings.generation.scene_beats,
+                                   book_agents=book_agents, run=run)
     print("--- BookGenerator created in main.py ---")
 
     # Start book generation process
     print("--- Starting book generation in main.py ---")
-    book_generator.generate_book(outline)
+    try:
+        book_generator.generate_book(outline, resume=resume_run is not None)
+    except GenerationCancelled as e:
+        run.finish("cancelled", reason=e.reason, chapters_written=len(run.chapter_files()))
+        print(f"Run {run.run_id} cancelled; resume with: python main.py --resume {run.run_id}")
+        return EXIT_CANCELLED
+    except BaseException:
+        run.finish("failed")
+        raise
+    written = len(run.chapter_files())
+    run.finish("completed" if written >= len(outline) else "incomplete", chapters_written=written)
     print("--- Book generation process finished in main.py ---")
 
     print("--- main() function in main.py finished ---")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
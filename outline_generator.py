@@ -1,23 +1,20 @@
 import autogen
-from typing import Dict, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Generator, List, Optional, Set, Tuple
+import hashlib
 import re
-import litellm
-from llm.litellm_base import LiteLLMBase
-from llm.litellm_implementations import OllamaImplementation
+import logging
+import threading
+from llm.cancellation import GenerationCancelled
+from llm.deadline import DeadlineExceeded
+from llm.factory import LLMFactory
+from llm.interface import LLMInterface
+from outline_parser import EXACT, FIELD_LABELS, OutlineStreamParser, ParsedChapter, parse_outline
 
-class OutlineGenerator:
-    def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict):
-        self.agents = agents
-        self.agent_config = agent_config
-
-    def generate_outline(self, initial_prompt: str, num_chapters: int = 25) -> List[Dict]:
-        print("\nGenerating outline...")
-
-        litellm_messages = [{
-            "role": "user",
-            "content": f"""Create a {num_chapters}-chapter outline in English. Follow this EXACT format for each chapter:
+logger = logging.getLogger(__name__)
 
- Chapter [N]: [Title]
+OUTLINE_FORMAT = """ Chapter [N]: [Title]
  Title: [Same title]
  Key Events:
  - [Event 1]
@@ -25,37 +22,321 @@ class OutlineGenerator:
  - [Event 3]
  Character Developments: [Details]
  Setting: [Details]
- Tone: [Details]
+ Tone: [Details]"""
+
+
+def _echo_chunk(chunk: str) -> None:
+    print(chunk, end='', flush=True)
+
+
+class OutlineGenerator:
+    # Fully parsed completions shared by every generator in the process, keyed by
+    # model and prompt; the least recently used entry is evicted past cache_size
+    _completion_cache: "OrderedDict[str, str]" = OrderedDict()
+    _cache_lock = threading.Lock()
+    cache_size = 64
+
+    def __init__(
+        self,
+        agents: Dict[str, autogen.ConversableAgent],
+        agent_config: Dict,
+        llm: Optional[LLMInterface] = None,
+        on_stream_chunk: Optional[Callable[[str], None]] = _echo_chunk
+    ):
+        """Initialize the outline generator
+
+        Args:
+            agents: Agents created by BookAgents
+            agent_config: LLM configuration for outline calls, normally
+                Settings.get_outline_llm_config() (model, api_key, base_url,
+                timeout, max_tokens, temperature, cache_enabled)
+            llm: Pre-built LLM client; created from agent_config via
+                LLMFactory on first use when omitted
+            on_stream_chunk: Called with each streamed chunk of a single-call
+                outline; defaults to echoing to stdout
+        """
+        self.agents = agents
+        self.agent_config = agent_config
+        self.llm = llm
+        self.on_stream_chunk = on_stream_chunk
+        self.cache_enabled = agent_config.get("cache_enabled", True)
+        self.hierarchical_threshold = 12  # Larger outlines are planned by act, then expanded in ranges
+        self.chapters_per_call = 8
+        self.max_parallel_calls = 4
+
+    def generate_outline(
+        self,
+        initial_prompt: str,
+        num_chapters: int = 25,
+        on_chapter: Optional[Callable[[Dict], None]] = None
+    ) -> List[Dict]:
+        """Stream the outline from the model, parsing chapters as they arrive
+
+        Outlines longer than hierarchical_threshold chapters are generated in
+        hierarchical mode (see _generate_hierarchical_outline) so no single
+        completion has to hold the whole outline.
+
+        Args:
+            initial_prompt: Book premise
+            num_chapters: Number of chapters to outline
+            on_chapter: Called with each chapter dict as soon as the next
+                chapter starts, before the rest of the outline has streamed. In
+                hierarchical mode chapters may arrive out of order.
+        """
+        print("\nGenerating outline...")
+
+        try:
+            if num_chapters > self.hierarchical_threshold:
+                return self._generate_hierarchical_outline(initial_prompt, num_chapters, on_chapter)
+
+            prompt = f"""Create a {num_chapters}-chapter outline in English. Follow this EXACT format for each chapter:
+
+{OUTLINE_FORMAT}
 
  Initial premise: {initial_prompt}
 
  Repeat EXACTLY this format for all {num_chapters} chapters.
  End with 'END OF OUTLINE'"""
-        }]
 
-        try:
-            response = litellm.completion(
-                model="ollama/deepseek-r1:14b", # Update with your desired model
-                messages=litellm_messages,
-                base_url="http://localhost:11434", # Update if your base URL is different
-                stream=True, # Added streaming
-            )
-
-            content = ""
             print("\nGenerating outline (streaming):")
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content_chunk = chunk.choices[0].delta.content
-                    print(content_chunk, end='', flush=True)
-                    content += content_chunk
+            stream_parser = self._stream_outline(prompt, on_chapter, echo=True)
 
-            outline_content = content
-            return self._process_outline_results([{"content": outline_content}], num_chapters)
+            if not stream_parser.chapters:
+                return self._process_outline_results([{"content": stream_parser.text}], num_chapters)
+            outline = self._build_outline(stream_parser.chapters, num_chapters)
+            self._cache_completion(prompt, stream_parser.text)
+            return outline
 
+        except (GenerationCancelled, DeadlineExceeded):
+            raise  # Stopping is not a bad outline; the caller must not save a placeholder
         except Exception as e:
             print(f"Error generating outline: {str(e)}")
             return self._emergency_outline_processing([], num_chapters)
 
+    def _get_llm(self) -> LLMInterface:
+        """Create the outline LLM client from agent_config on first use"""
+        if self.llm is None:
+            factory_config = {k: v for k, v in self.agent_config.items() if k != "cache_enabled"}
+            self.llm = LLMFactory.create_llm(factory_config)
+        return self.llm
+
+    def _cache_key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.agent_config.get('model')}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _stream_completion(self, prompt: str) -> Generator[str, None, None]:
+        """Yield text chunks of a streamed completion for the prompt, replaying cached completions"""
+        if self.cache_enabled:
+            cache_key = self._cache_key(prompt)
+            with self._cache_lock:
+                cached = self._completion_cache.get(cache_key)
+                if cached is not None:
+                    self._completion_cache.move_to_end(cache_key)
+            if cached is not None:
+                logger.info("Using cached outline completion")
+                yield cached
+                return
+
+        yield from self._get_llm().stream(prompt)
+
+    def _cache_completion(self, prompt: str, text: str) -> None:
+        """Cache a completion once it parsed fully, so a retry never replays a short or malformed one"""
+        if not self.cache_enabled:
+            return
+        with self._cache_lock:
+            self._completion_cache[self._cache_key(prompt)] = text
+            self._completion_cache.move_to_end(self._cache_key(prompt))
+            while len(self._completion_cache) > self.cache_size:
+                self._completion_cache.popitem(last=False)
+
+    def _stream_outline(
+        self,
+        prompt: str,
+        on_chapter: Optional[Callable[[Dict], None]] = None,
+        echo: bool = False
+    ) -> OutlineStreamParser:
+        """Stream a completion through an OutlineStreamParser"""
+        stream_parser = OutlineStreamParser()
+        for content_chunk in self._stream_completion(prompt):
+            if echo and self.on_stream_chunk:
+                self.on_stream_chunk(content_chunk)
+            self._notify_chapters(stream_parser.feed(content_chunk), on_chapter)
+        self._notify_chapters(stream_parser.close(), on_chapter)
+        return stream_parser
+
+    def _generate_hierarchical_outline(
+        self,
+        initial_prompt: str,
+        num_chapters: int,
+        on_chapter: Optional[Callable[[Dict], None]] = None
+    ) -> List[Dict]:
+        """Plan act-level beats, expand chapter ranges concurrently, then validate and stitch
+
+        Each expansion call covers at most chapters_per_call chapters, so the
+        per-call size stays bounded however long the book is.
+        """
+        print(f"\nGenerating {num_chapters}-chapter outline in hierarchical mode...")
+        acts_prompt = f"""Plan the act structure of a {num_chapters}-chapter book in English.
+
+ Initial premise: {initial_prompt}
+
+ For each act use EXACTLY this format:
+ Act [N]: [Act Title]
+ Chapters: [first chapter number]-[last chapter number]
+ Beats:
+ - [Major story beat]
+ - [Major story beat]
+
+ The chapter ranges must be contiguous and cover chapters 1-{num_chapters}.
+ End with 'END OF ACTS'"""
+        acts_text = "".join(self._stream_completion(acts_prompt))
+
+        acts = self._parse_acts(acts_text, num_chapters)
+        if acts:
+            self._cache_completion(acts_prompt, acts_text)
+        ranges = self._plan_chapter_ranges(acts, num_chapters)
+        print(f"Expanding {len(ranges)} chapter ranges with up to {self.max_parallel_calls} concurrent calls")
+
+        expanded: Dict[int, Dict] = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel_calls) as executor:
+            futures = {
+                executor.submit(self._expand_chapter_range, initial_prompt, num_chapters, acts_text, first, last, beats, on_chapter): (first, last)
+                for first, last, beats in ranges
+            }
+            for future in as_completed(futures):
+                first, last = futures[future]
+                try:
+                    expanded.update(future.result())
+                except (GenerationCancelled, DeadlineExceeded):
+                    raise
+                except Exception as e:
+                    logger.error(f"Expanding chapters {first}-{last} failed: {str(e)}")
+
+        # One sequential retry for any range that came back short; only its missing chapters are taken
+        for first, last, beats in ranges:
+            missing = {n for n in range(first, last + 1) if n not in expanded}
+            if missing:
+                print(f"Retrying outline for chapters {first}-{last}")
+                try:
+                    expanded.update(self._expand_chapter_range(initial_prompt, num_chapters, acts_text, first, last, beats,
+                                                               on_chapter, only=missing))
+                except (GenerationCancelled, DeadlineExceeded):
+                    raise
+                except Exception as e:
+                    logger.error(f"Retry for chapters {first}-{last} failed: {str(e)}")
+
+        missing = [n for n in range(1, num_chapters + 1) if n not in expanded]
+        if missing:
+            raise ValueError(f"Only processed {num_chapters - len(missing)} valid chapters out of {num_chapters} required (missing {missing})")
+
+        return [expanded[n] for n in range(1, num_chapters + 1)]
+
+    def _parse_acts(self, acts_text: str, num_chapters: int) -> List[Dict]:
+        """Parse 'Act N' blocks into chapter ranges with their beats"""
+        acts = []
+        for line in acts_text.splitlines():
+            stripped = line.strip().strip('*_# ')
+            if re.match(r'act\s+\d+', stripped, re.IGNORECASE):
+                acts.append({"first": None, "last": None, "beats": [stripped]})
+                continue
+            if not acts:
+                continue
+            range_match = re.match(r'chapters?\W*(\d+)\s*(?:-|–|—|to)\s*(\d+)', stripped, re.IGNORECASE)
+            if range_match:
+                acts[-1]["first"], acts[-1]["last"] = int(range_match.group(1)), int(range_match.group(2))
+            elif stripped and not stripped.lower().startswith(("beats", "end of acts")):
+                acts[-1]["beats"].append(stripped)
+
+        # Accept the plan only if the ranges are contiguous and cover the whole book
+        expected_first = 1
+        for act in acts:
+            if act["first"] != expected_first or act["last"] is None or act["last"] < act["first"]:
+                logger.warning("Act plan ranges are invalid, falling back to even chapter ranges")
+                return []
+            expected_first = act["last"] + 1
+        if expected_first != num_chapters + 1:
+            logger.warning("Act plan does not cover every chapter, falling back to even chapter ranges")
+            return []
+        return acts
+
+    def _plan_chapter_ranges(self, acts: List[Dict], num_chapters: int) -> List[Tuple[int, int, str]]:
+        """Split acts (or the whole book) into ranges of at most chapters_per_call chapters"""
+        if not acts:
+            acts = [{"first": 1, "last": num_chapters, "beats": []}]
+
+        ranges = []
+        for act in acts:
+            for first in range(act["first"], act["last"] + 1, self.chapters_per_call):
+                last = min(first + self.chapters_per_call - 1, act["last"])
+                ranges.append((first, last, "\n".join(act["beats"])))
+        return ranges
+
+    def _expand_chapter_range(
+        self,
+        initial_prompt: str,
+        num_chapters: int,
+        acts_text: str,
+        first: int,
+        last: int,
+        beats: str,
+        on_chapter: Optional[Callable[[Dict], None]] = None,
+        only: Optional[Set[int]] = None
+    ) -> Dict[int, Dict]:
+        """Generate the detailed outline for chapters first..last
+
+        When only is given, other chapter numbers are neither returned nor
+        passed to on_chapter (a retry must not replace chapters already used).
+        """
+        prompt = f"""You are outlining chapters {first} to {last} of a {num_chapters}-chapter book in English.
+
+ Initial premise: {initial_prompt}
+
+ Overall act plan:
+{acts_text.strip()}
+
+ Beats for the act containing these chapters:
+{beats or '[Follow the overall act plan]'}
+
+ Write ONLY chapters {first} to {last}, numbered {first} to {last}. Follow this EXACT format for each chapter:
+
+{OUTLINE_FORMAT}
+
+ End with 'END OF OUTLINE'"""
+
+        stream_parser = self._stream_outline(prompt)
+
+        # Trust the model's chapter numbers when they fall in range, otherwise use position
+        chapters: Dict[int, Dict] = {}
+        complete = [parsed for parsed in stream_parser.chapters if parsed.is_complete]
+        in_range = {parsed.chapter_number for parsed in complete if first <= parsed.chapter_number <= last}
+        use_headers = len(in_range) == len(complete)
+        for i, parsed in enumerate(complete):
+            number = parsed.chapter_number if use_headers else first + i
+            if number > last or number in chapters:
+                continue
+            chapters[number] = parsed.to_outline_entry(chapter_number=number)
+        logger.info(f"Expanded chapters {first}-{last}: {len(chapters)} of {last - first + 1} valid")
+        if len(chapters) == last - first + 1:
+            self._cache_completion(prompt, stream_parser.text)
+
+        if only is not None:
+            chapters = {number: chapter for number, chapter in chapters.items() if number in only}
+        for number, chapter in chapters.items():
+            self._notify_entry(chapter, on_chapter)
+        return chapters
+
+    def _notify_chapters(self, completed: List, on_chapter: Optional[Callable[[Dict], None]]) -> None:
+        """Hand chapters completed mid-stream to the caller"""
+        for position, parsed in completed:
+            self._notify_entry(parsed.to_outline_entry(chapter_number=position), on_chapter)
+
+    def _notify_entry(self, chapter: Dict, on_chapter: Optional[Callable[[Dict], None]]) -> None:
+        if not on_chapter:
+            return
+        try:
+            on_chapter(chapter)
+        except Exception as e:
+            logger.error(f"Outline chapter callback failed for chapter {chapter['chapter_number']}: {str(e)}")
+
     def _get_sender(self, msg: Dict) -> str:
         return msg.get("sender") or msg.get("name", "")
 
@@ -76,7 +357,7 @@ class OutlineGenerator:
 
         for msg in reversed(messages):
             content = msg.get("content", "")
-            if "Chapter 1:" in content or "**Chapter 1:**" in content:
+            if re.search(r'chapter\s+1\b', content, re.IGNORECASE):
                 return content
 
         return ""
@@ -88,52 +369,22 @@ class OutlineGenerator:
             print("No structured outline found, attempting emergency processing...")
             return self._emergency_outline_processing(messages, num_chapters)
 
-        chapters = []
-        chapter_sections = re.split(r'\nChapter \d+:', outline_content)
-
-        for i, section in enumerate(chapter_sections[1:], 1):
-            try:
-                title_match = re.search(r'Title: (.+?)(?=\nKey Events:|$)', section, re.IGNORECASE)
-                events_match = re.search(r'Key Events:\s*\n-(.+?)\n-(.+?)\n-(.+?)(?=\nCharacter Developments:|$)', section, re.DOTALL | re.IGNORECASE)
-                character_match = re.search(r'Character Developments: (.+?)(?=\nSetting:|$)', section, re.DOTALL | re.IGNORECASE)
-                setting_match = re.search(r'Setting: (.+?)(?=\nTone:|$)', section, re.DOTALL | re.IGNORECASE)
-                tone_match = re.search(r'Tone: (.+?)(?=\n\n|$)', section, re.DOTALL | re.IGNORECASE)
-
-                if not all([title_match, events_match, character_match, setting_match, tone_match]):
-                    print(f"Missing required components in Chapter {i}")
-                    missing = []
-                    if not title_match: missing.append("Title")
-                    if not events_match: missing.append("Key Events")
-                    if not character_match: missing.append("Character Developments")
-                    if not setting_match: missing.append("Setting")
-                    if not tone_match: missing.append("Tone")
-                    print(f"  Missing: {', '.join(missing)}")
-                    continue
-
-                events = events_match.group(0).split('\n-')[1:]
-                events = [e.strip() for e in events if e.strip()]
-
-                chapter_info = {
-                    "chapter_number": i,
-                    "title": title_match.group(1).strip(),
-                    "prompt": "\n".join([
-                        f"Key Events:",
-                        *[f"- {event}" for event in events],
-                        f"Character Developments: {character_match.group(1).strip()}",
-                        f"Setting: {setting_match.group(1).strip()}",
-                        f"Tone: {tone_match.group(1).strip()}"
-                    ])
-                }
+        return self._build_outline(parse_outline(outline_content), num_chapters)
 
-                if len(events) < 3:
-                    print(f"Chapter {i} has fewer than 3 events")
-                    continue
+    def _build_outline(self, parsed_chapters: List[ParsedChapter], num_chapters: int) -> List[Dict]:
+        """Convert parsed chapters to outline dicts, skipping incomplete ones"""
+        chapters = []
+        for i, parsed in enumerate(parsed_chapters, 1):
+            if not parsed.is_complete:
+                print(f"Missing required components in Chapter {i}")
+                print(f"  Missing: {', '.join(parsed.missing_fields)}")
+                continue
 
-                chapters.append(chapter_info)
+            low_confidence = [FIELD_LABELS[name] for name, score in parsed.confidence.items() if score < EXACT]
+            if low_confidence:
+                logger.debug(f"Chapter {i} parsed with tolerated formatting in: {', '.join(low_confidence)}")
 
-            except Exception as e:
-                print(f"Error processing Chapter {i}: {str(e)}")
-                continue
+            chapters.append(parsed.to_outline_entry(chapter_number=i))
 
         if len(chapters) < num_chapters:
             raise ValueError(f"Only processed {len(chapters)} valid chapters out of {num_chapters} required")
@@ -0,0 +1,273 @@
+"""Line-oriented outline parser tolerant of the formatting variations LLMs produce
+
+The parser makes a single pass over the outline text. Each line is classified
+(chapter header, field label, bullet, continuation) with anchored regexes that
+never backtrack across lines, so parsing is linear in the size of the outline.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+FIELDS = ("title", "key_events", "character_developments", "setting", "tone")
+
+FIELD_LABELS = {
+    "title": "Title",
+    "key_events": "Key Events",
+    "character_developments": "Character Developments",
+    "setting": "Setting",
+    "tone": "Tone",
+}
+
+# Confidence levels reported per field
+EXACT = 1.0      # Label written exactly as requested
+TOLERATED = 0.8  # Label found under markdown, bullets or numbering
+INFERRED = 0.6   # Value derived from elsewhere (e.g. title from the chapter header)
+MISSING = 0.0
+
+_DECORATION = r"[\s>#*_\-•+]*"
+_NUMBERING = r"(?:\d+[.)]\s*)?"
+
+_CHAPTER_RE = re.compile(
+    rf"^{_DECORATION}{_NUMBERING}[*_]*chapter\s+(\d+)[*_]*\s*(?:[:.\-–—]\s*[*_]*\s*(.*?))?[*_\s]*$",
+    re.IGNORECASE
+)
+_FIELD_RE = re.compile(
+    rf"^{_DECORATION}{_NUMBERING}[*_]*"
+    r"(chapter\s+title|title|key\s+events?|character\s+developments?|setting|tone)"
+    r"[*_]*\s*:\s*[*_]*\s*(.*)$",
+    re.IGNORECASE
+)
+_BULLET_RE = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+(.*)$")
+_SEPARATOR_RE = re.compile(r"^\s*(?:[-=_*]{3,}|#+)\s*$")
+_END_RE = re.compile(r"^[\s*_#]*end of outline[\s*_.]*$", re.IGNORECASE)
+_OUTLINE_START_RE = re.compile(r"^[\s*_#]*outline\s*:?[\s*_]*$", re.IGNORECASE)
+_CANONICAL_FIELD_RE = re.compile(r"^\s*(Title|Key Events|Character Developments|Setting|Tone):")
+
+
+def _field_key(label: str) -> str:
+    """Map a label as written by the model onto a field name"""
+    label = re.sub(r"\s+", " ", label.lower())
+    if label in ("title", "chapter title"):
+        return "title"
+    if label.startswith("key event"):
+        return "key_events"
+    if label.startswith("character development"):
+        return "character_developments"
+    return label
+
+
+def _strip_markdown(text: str) -> str:
+    """Remove emphasis markers left around values"""
+    return re.sub(r"^[*_\s]+|[*_\s]+$", "", text).replace("**", "")
+
+
+@dataclass
+class ParsedChapter:
+    """A chapter recovered from outline text with per-field confidence"""
+    chapter_number: int
+    title: str = ""
+    key_events: List[str] = field(default_factory=list)
+    character_developments: str = ""
+    setting: str = ""
+    tone: str = ""
+    confidence: Dict[str, float] = field(default_factory=lambda: {name: MISSING for name in FIELDS})
+
+    @property
+    def missing_fields(self) -> List[str]:
+        """Labels of fields that were not found"""
+        missing = [FIELD_LABELS[name] for name in FIELDS if self.confidence[name] == MISSING]
+        if "Key Events" not in missing and len(self.key_events) < 3:
+            missing.append("Key Events")
+        return missing
+
+    @property
+    def is_complete(self) -> bool:
+        """All fields present and at least three key events"""
+        return not self.missing_fields
+
+    def to_outline_entry(self, chapter_number: Optional[int] = None) -> Dict:
+        """Convert to the outline dict format used by BookAgents and BookGenerator"""
+        return {
+            "chapter_number": chapter_number if chapter_number is not None else self.chapter_number,
+            "title": self.title,
+            "prompt": "\n".join([
+                "Key Events:",
+                *[f"- {event}" for event in self.key_events],
+                f"Character Developments: {self.character_developments}",
+                f"Setting: {self.setting}",
+                f"Tone: {self.tone}"
+            ])
+        }
+
+
+class OutlineParser:
+    """Single-pass state machine over outline lines
+
+    States are implicit in ``current`` (the chapter being filled) and
+    ``active_field`` (the field continuation lines are appended to).
+    """
+
+    def __init__(self):
+        self.chapters: List[ParsedChapter] = []
+        self.current: Optional[ParsedChapter] = None
+        self.active_field: Optional[str] = None
+        self.finished = False
+
+    def feed_line(self, line: str) -> Optional[ParsedChapter]:
+        """Consume one line; returns the previous chapter when a new one starts"""
+        if self.finished:
+            return None
+
+        stripped = line.strip()
+        if not stripped or _SEPARATOR_RE.match(stripped) or _OUTLINE_START_RE.match(stripped):
+            return None
+
+        if _END_RE.match(stripped):
+            self.finished = True
+            return self._close_current()
+
+        # Cheap substring checks gate the regexes; most lines are events or values
+        has_colon = ":" in stripped
+        field_match = _FIELD_RE.match(stripped) if has_colon else None
+        header = _CHAPTER_RE.match(stripped) if "chapter" in stripped.lower() else None
+        if header and not field_match:
+            completed = self._close_current()
+            self.current = ParsedChapter(chapter_number=int(header.group(1)))
+            header_title = _strip_markdown(header.group(2) or "")
+            if header_title:
+                self.current.title = header_title
+                self.current.confidence["title"] = INFERRED
+            self.active_field = None
+            return completed
+
+        if self.current is None:
+            return None
+
+        if field_match:
+            name = _field_key(field_match.group(1))
+            value = _strip_markdown(field_match.group(2))
+            level = EXACT if _CANONICAL_FIELD_RE.match(line) else TOLERATED
+            self._set_field(name, value, level)
+            return None
+
+        bullet = _BULLET_RE.match(stripped)
+        if bullet and self.active_field == "key_events":
+            event = _strip_markdown(bullet.group(1))
+            if event:
+                self.current.key_events.append(event)
+            return None
+
+        # Continuation of a multi-line value
+        if self.active_field and self.active_field != "key_events":
+            text = _strip_markdown(bullet.group(1) if bullet else stripped)
+            previous = getattr(self.current, self.active_field)
+            setattr(self.current, self.active_field, f"{previous} {text}".strip())
+        elif self.active_field == "key_events":
+            # Unbulleted line directly under Key Events is still an event
+            self.current.key_events.append(_strip_markdown(stripped))
+        return None
+
+    def _set_field(self, name: str, value: str, level: float) -> None:
+        """Record a labelled field value"""
+        self.active_field = name
+        if name == "key_events":
+            self.current.confidence[name] = level
+            # Some models put the first event on the label line: "Key Events: - Event 1"
+            inline = re.sub(r"^[-*•+]\s*", "", value)
+            if inline:
+                self.current.key_events.append(inline)
+            return
+        if name == "title" and self.current.confidence["title"] > level:
+            return
+        setattr(self.current, name, value)
+        self.current.confidence[name] = level
+
+    def _close_current(self) -> Optional[ParsedChapter]:
+        """Finalise the chapter in progress"""
+        chapter = self.current
+        if chapter is None:
+            return None
+        if chapter.confidence["key_events"] != MISSING and len(chapter.key_events) < 3:
+            # Scale down confidence when fewer than the required three events were found
+            chapter.confidence["key_events"] *= len(chapter.key_events) / 3
+        self.chapters.append(chapter)
+        self.current = None
+        self.active_field = None
+        return chapter
+
+    def close(self) -> Optional[ParsedChapter]:
+        """Finish parsing; returns the last chapter if it was still open"""
+        self.finished = True
+        return self._close_current()
+
+
+def parse_outline(text: str) -> List[ParsedChapter]:
+    """Parse outline text into chapters in the order they appear"""
+    parser = OutlineParser()
+    for line in text.splitlines():
+        parser.feed_line(line)
+    parser.close()
+    return parser.chapters
+
+
+class OutlineStreamParser:
+    """Incremental parser for streamed outline text
+
+    Chunks are buffered in a list and only complete lines reach the
+    underlying OutlineParser. A chapter is emitted once it is closed by the
+    next chapter header or the end of the outline, so multi-line values are
+    whole, and consumers can start on it while later chapters stream.
+    """
+
+    def __init__(self):
+        self._parser = OutlineParser()
+        self._parts: List[str] = []
+        self._pending: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """All text received so far"""
+        return "".join(self._parts)
+
+    @property
+    def chapters(self) -> List[ParsedChapter]:
+        """Chapters parsed so far, including incomplete ones"""
+        return list(self._parser.chapters)
+
+    def feed(self, chunk: str) -> List[Tuple[int, ParsedChapter]]:
+        """Consume a streamed chunk
+
+        Returns:
+            List[Tuple[int, ParsedChapter]]: Newly completed chapters with their
+            position in the outline (1-based)
+        """
+        self._parts.append(chunk)
+        if "\n" not in chunk:
+            self._pending.append(chunk)
+            return []
+
+        lines = chunk.split("\n")
+        lines[0] = "".join(self._pending) + lines[0]
+        self._pending = [lines[-1]] if lines[-1] else []
+
+        completed: List[Tuple[int, ParsedChapter]] = []
+        for line in lines[:-1]:
+            self._feed_line(line, completed)
+        return completed
+
+    def close(self) -> List[Tuple[int, ParsedChapter]]:
+        """Flush the last partial line and finish parsing"""
+        completed: List[Tuple[int, ParsedChapter]] = []
+        if self._pending:
+            self._feed_line("".join(self._pending), completed)
+            self._pending = []
+        self._emit(self._parser.close(), completed)
+        return completed
+
+    def _feed_line(self, line: str, completed: List[Tuple[int, ParsedChapter]]) -> None:
+        self._emit(self._parser.feed_line(line), completed)
+
+    def _emit(self, closed: Optional[ParsedChapter], completed: List[Tuple[int, ParsedChapter]]) -> None:
+        """Report a chapter the parser just closed; it is always the last one appended"""
+        if closed is not None and closed.is_complete:
+            completed.append((len(self._parser.chapters), closed))
@@ -0,0 +1,152 @@
+"""Local quality checks run on a draft before the editor sees it
+
+The editor is an LLM call; a draft that is far too short, stuck in a
+repetition loop or full of leftover pipeline tags fails no matter what the
+editor says. The gate measures word count, repeated word trigrams, leftover
+tags, dialogue share and Flesch reading ease with numpy over the whole text.
+A clearly failing draft gets its feedback locally and the editor call is
+skipped; any other draft goes to the editor with its measurements attached.
+"""
+import logging
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tags the pipeline's agents and local steps emit; none belongs in prose
+PIPELINE_TAGS = ("MEMORY UPDATE", "PLAN", "SETTING", "CHARACTER", "PLOT", "WRITER BRIEF", "SCENE BEATS",
+                 "SCENE DRAFT", "SCENE FINAL", "SCENE", "FEEDBACK", "CONFIRMATION", "TRANSITION")
+
+_TAG = re.compile(r"\b(%s):" % "|".join(PIPELINE_TAGS))
+_LEADING_TAG = re.compile(r"^\s*(?:%s):" % "|".join(PIPELINE_TAGS))
+_SEPARATOR = re.compile(r"^--- .+ ---$", re.MULTILINE)  # Artifact headers from pipeline messages
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)*")
+
+_QUOTES = np.array([ord('"'), 0x201C, 0x201D], dtype=np.uint32)
+_VOWELS = np.array([ord(c) for c in "aeiouy"], dtype=np.uint32)
+_SENTENCE_ENDS = np.array([ord(c) for c in ".!?"], dtype=np.uint32)
+
+
+def _code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+
+
+def _run_starts(mask: np.ndarray) -> np.ndarray:
+    """True where a run of True values begins"""
+    return mask & ~np.concatenate(([False], mask[:-1]))
+
+
+def repetition_ratio(text: str, n: int = 3) -> float:
+    """Share of word n-grams that repeat an earlier one (0 for varied prose, near 1 for a loop)"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= n:
+        return 0.0
+    _, ids = np.unique(np.array(words), return_inverse=True)
+    grams = np.lib.stride_tricks.sliding_window_view(ids.ravel(), n)
+    return 1.0 - len(np.unique(grams, axis=0)) / len(grams)
+
+
+def dialogue_ratio(text: str) -> float:
+    """Share of characters between double quotation marks"""
+    codes = _code_points(text)
+    if not codes.size:
+        return 0.0
+    quotes = np.isin(codes, _QUOTES)
+    inside = (np.cumsum(quotes) % 2 == 1) & ~quotes
+    return float(inside.sum() / codes.size)
+
+
+def reading_ease(text: str) -> float:
+    """Flesch reading ease, counting syllables as vowel groups
+
+    60-80 is plain prose; below 0 usually means run-on or garbled text.
+    """
+    codes = _code_points(text.lower())
+    letters = (codes >= ord("a")) & (codes <= ord("z"))
+    word_starts = _run_starts(letters)
+    words = int(word_starts.sum())
+    if not words:
+        return 0.0
+    syllable_starts = _run_starts(np.isin(codes, _VOWELS))
+    word_index = np.cumsum(word_starts) - 1
+    syllables = int(np.maximum(np.bincount(word_index[syllable_starts], minlength=words), 1).sum())
+    sentences = max(1, int(_run_starts(np.isin(codes, _SENTENCE_ENDS)).sum()))
+    return 206.835 - 1.015 * words / sentences - 84.6 * syllables / words
+
+
+def leaked_tags(text: str) -> List[str]:
+    """Pipeline tags and artifact headers left in prose, in order of appearance"""
+    found = [match.group(0) for match in _TAG.finditer(text)] + _SEPARATOR.findall(text)
+    return list(dict.fromkeys(found))
+
+
+@dataclass
+class DraftMetrics:
+    """Measurements of one draft"""
+    words: int
+    repetition: float
+    dialogue: float
+    reading_ease: float
+    leaked_tags: List[str] = field(default_factory=list)
+
+    @classmethod
+    def measure(cls, text: str) -> "DraftMetrics":
+        """Measure a draft; a leading tag such as 'SCENE DRAFT:' is ignored"""
+        text = _LEADING_TAG.sub("", text, count=1).strip()
+        return cls(len(text.split()), repetition_ratio(text), dialogue_ratio(text), reading_ease(text),
+                   leaked_tags(text))
+
+    def summary(self) -> str:
+        tags = ", ".join(self.leaked_tags) or "none"
+        return (f"words: {self.words} | repeated trigrams: {self.repetition:.0%} | dialogue: {self.dialogue:.0%} | "
+                f"reading ease: {self.reading_ease:.0f} | leftover tags: {tags}")
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class QualityGate:
+    """Thresholds past which a draft fails without an editor review"""
+    min_words: int = 0  # For the whole chapter; a section is held to its share
+    max_repetition: float = 0.3
+    min_reading_ease: float = 0.0
+
+    def problems(self, metrics: DraftMetrics, sections: int = 1) -> List[str]:
+        """Concrete revision instructions for every threshold the draft misses"""
+        problems = []
+        min_words = self.min_words // sections
+        if metrics.words < min_words:
+            problems.append(f"The draft has {metrics.words} words; it needs at least {min_words}. "
+                            f"Expand the existing scenes with action, dialogue and detail.")
+        if metrics.repetition > self.max_repetition:
+            problems.append(f"{metrics.repetition:.0%} of three-word phrases repeat earlier ones. "
+                            f"Cut repeated passages and rewrite them as new events.")
+        if metrics.leaked_tags:
+            problems.append(f"Remove leftover tags and headers from the prose: {', '.join(metrics.leaked_tags)}.")
+        if metrics.reading_ease < self.min_reading_ease:
+            problems.append(f"Reading ease is {metrics.reading_ease:.0f}. Break run-on sentences "
+                            f"and remove garbled text.")
+        return problems
+
+    def precheck(self, draft: str, sections: int = 1) -> Tuple[Optional[str], str]:
+        """Review a draft before the editor is called
+
+        Returns:
+            Tuple of local FEEDBACK replacing the editor's reply (None when
+            the draft needs an editor) and a note of the measurements for the
+            editor's message
+        """
+        metrics = DraftMetrics.measure(draft)
+        problems = self.problems(metrics, sections)
+        if problems:
+            logger.info(f"Quality gate failed the draft without an editor call: {metrics.summary()}")
+            return ("FEEDBACK:\nAutomatic quality check; the draft fails basic rules, so revise these first:\n"
+                    + "\n".join(f"- {problem}" for problem in problems)
+                    + f"\n\nMeasurements: {metrics.summary()}"), ""
+        logger.info(f"Quality gate passed the draft to the editor: {metrics.summary()}")
+        return None, (f"\n--- DRAFT MEASUREMENTS ---\n{metrics.summary()}\n"
+                      f"These were measured locally; use them instead of recounting.")
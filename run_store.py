@@ -0,0 +1,195 @@
+"""Run-scoped output directories so concurrent generations never share files
+
+Every generation run gets its own directory under the output root:
+
+    <root>/runs.jsonl                         append-only catalog, one line per run
+    <root>/runs/YYYY/MM/DD/<run_id>/
+        manifest.json                         run metadata and status
+        checkpoint.json                       where a cancelled run resumes
+        chapters/                             chapter_NN.txt, toc.txt, outline.json
+        transcripts/                          chapter_NN.jsonl agent messages
+        metrics/                              chapter_NN.json step timings
+
+Run ids start with their UTC creation time, so a run is located from its id
+without scanning, day directories stay small, and listing the catalog reads
+one file instead of walking the tree.
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "runs.jsonl"
+CHECKPOINT_FILE = "checkpoint.json"
+RUNS_DIR = "runs"
+
+_RUN_ID_PATTERN = re.compile(r"^(\d{4})(\d{2})(\d{2})T\d{6}-[0-9a-f]{8}(-[a-z0-9-]+)?$")
+
+
+def new_run_id(label: Optional[str] = None) -> str:
+    """Sortable, collision-free run id such as 20260101T120000-1a2b3c4d[-label]"""
+    run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    if label:
+        slug = re.sub(r"[^a-z0-9]+", "-", label.lower()).strip("-")[:40]
+        if slug:
+            run_id = f"{run_id}-{slug}"
+    return run_id
+
+
+def run_path(root: str, run_id: str) -> str:
+    """Directory of a run, derived from the date encoded in its id"""
+    match = _RUN_ID_PATTERN.match(run_id)
+    if not match:
+        raise ValueError(f"Invalid run id: {run_id}")
+    year, month, day = match.group(1, 2, 3)
+    return os.path.join(root, RUNS_DIR, year, month, day, run_id)
+
+
+def _write_json_atomic(path: str, data: Dict) -> None:
+    """Write JSON through a temporary file so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class RunDirectory:
+    """Output location and manifest of a single generation run"""
+
+    def __init__(self, root: str, run_id: str):
+        self.root = os.path.abspath(root)
+        self.run_id = run_id
+        self.path = run_path(self.root, run_id)
+        self.chapters_dir = os.path.join(self.path, "chapters")
+        self.transcripts_dir = os.path.join(self.path, "transcripts")
+        self.metrics_dir = os.path.join(self.path, "metrics")
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+
+    @classmethod
+    def create(cls, root: str, run_id: Optional[str] = None, metadata: Optional[Dict] = None) -> "RunDirectory":
+        """Create a new run directory and record it in the catalog
+
+        Raises:
+            FileExistsError: If a run with this id already exists
+        """
+        run = cls(root, run_id or new_run_id())
+        os.makedirs(os.path.dirname(run.path), exist_ok=True)
+        os.makedirs(run.path)  # Fails rather than letting two runs share a directory
+        for directory in (run.chapters_dir, run.transcripts_dir, run.metrics_dir):
+            os.makedirs(directory)
+
+        created = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        manifest = {"run_id": run.run_id, "status": "running", "created": created, "updated": created,
+                    **(metadata or {})}
+        _write_json_atomic(run.manifest_path, manifest)
+
+        entry = {"run_id": run.run_id, "created": created, "path": os.path.relpath(run.path, run.root),
+                 **{k: v for k, v in (metadata or {}).items() if isinstance(v, (str, int, float, bool))}}
+        # One short O_APPEND write per run keeps concurrent appends whole
+        with open(os.path.join(run.root, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        logger.info(f"Created run {run.run_id} at {run.path}")
+        return run
+
+    @classmethod
+    def open(cls, root: str, run_id: str) -> "RunDirectory":
+        """Open an existing run
+
+        Raises:
+            FileNotFoundError: If the run does not exist
+        """
+        run = cls(root, run_id)
+        if not os.path.exists(run.manifest_path):
+            raise FileNotFoundError(f"No run {run_id} under {root}")
+        return run
+
+    def read_manifest(self) -> Dict:
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def update_manifest(self, **fields) -> Dict:
+        """Merge fields into the manifest"""
+        manifest = self.read_manifest()
+        manifest.update(fields)
+        manifest["updated"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        _write_json_atomic(self.manifest_path, manifest)
+        return manifest
+
+    def finish(self, status: str, **fields) -> Dict:
+        """Record the final status, e.g. completed, failed or stopped"""
+        return self.update_manifest(status=status, **fields)
+
+    def chapter_path(self, chapter_number: int) -> str:
+        return os.path.join(self.chapters_dir, f"chapter_{chapter_number:02d}.txt")
+
+    def chapter_files(self) -> List[str]:
+        """Saved chapter files in chapter order"""
+        return sorted(os.path.join(self.chapters_dir, name) for name in os.listdir(self.chapters_dir)
+                      if re.fullmatch(r"chapter_\d+\.txt", name))
+
+    def write_transcript(self, name: str, messages: List[Dict]) -> str:
+        """Write agent messages as JSON lines"""
+        path = os.path.join(self.transcripts_dir, f"{name}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for message in messages:
+                entry = {"name": message.get("name"), "role": message.get("role"), "content": message.get("content")}
+                if message.get("partial"):
+                    entry["partial"] = True
+                f.write(json.dumps(entry, default=str) + "\n")
+        return path
+
+    def write_metrics(self, name: str, data: Dict) -> str:
+        path = os.path.join(self.metrics_dir, f"{name}.json")
+        _write_json_atomic(path, data)
+        return path
+
+    def write_checkpoint(self, data: Dict) -> str:
+        """Record where an interrupted run should resume"""
+        path = os.path.join(self.path, CHECKPOINT_FILE)
+        _write_json_atomic(path, data)
+        return path
+
+    def read_checkpoint(self) -> Optional[Dict]:
+        path = os.path.join(self.path, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def clear_checkpoint(self) -> None:
+        path = os.path.join(self.path, CHECKPOINT_FILE)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def list_runs(root: str, limit: Optional[int] = None) -> List[Dict]:
+    """Catalog entries, newest first, read from the index without walking the tree"""
+    index_path = os.path.join(root, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+    entries = []
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed catalog line in {index_path}")
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+def latest_run(root: str) -> Optional[RunDirectory]:
+    """The most recently created run, if any"""
+    runs = list_runs(root, limit=1)
+    return RunDirectory(root, runs[0]["run_id"]) if runs else None
@@ -0,0 +1,214 @@
+"""Scene-beat chapter drafting within per-call token limits
+
+A single completion cannot hold a 5000-word chapter: the clients cap output
+at a few thousand tokens and the text is cut off. Instead the PLOT output is
+split into scene beats sized to fit one call, the beats are drafted
+concurrently, and the seams between neighbouring scenes are rewritten so the
+stitched chapter reads as one piece. Revision works the same way, passage by
+passage.
+"""
+import contextvars
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+from continuation import continue_reply
+from llm.cancellation import CancellationToken, shutdown_token
+from llm.finish_reason import clear_finish_reason
+from llm.reasoning import split_reasoning
+
+logger = logging.getLogger(__name__)
+
+WORDS_PER_TOKEN = 0.75
+CALL_HEADROOM = 0.7  # Share of max_tokens a beat may fill; models overshoot length targets
+
+_BEAT_LINE = re.compile(r"^\s*(?:\d+\s*[.):-]|[-*•]|(?:scene|beat)\s+\d+\s*[.):-])\s*(.+)$", re.IGNORECASE)
+_PLANNED_BEAT = re.compile(r"^\s*(\d+)\.\s*\(~(\d+) words\)\s*(.+)$")
+_SEAM_SPLIT = re.compile(r"^\s*={3,}\s*$", re.MULTILINE)
+
+
+@dataclass
+class SceneBeat:
+    """One scene of a chapter, drafted in a single call"""
+    number: int
+    description: str
+    target_words: int
+
+
+def words_per_call(max_tokens: int) -> int:
+    """Words one completion can safely produce under max_tokens"""
+    return max(200, int(max_tokens * WORDS_PER_TOKEN * CALL_HEADROOM))
+
+
+def parse_beats(plot: str) -> List[str]:
+    """Extract beat descriptions from a PLOT output
+
+    Numbered, bulleted and "Scene N:" lines start beats; unmarked lines
+    continue the previous beat. Without list markers, paragraphs are used.
+    """
+    text = plot.split("PLOT:", 1)[-1].strip()
+    beats: List[str] = []
+    for line in text.splitlines():
+        match = _BEAT_LINE.match(line)
+        if match:
+            beats.append(match.group(1).strip())
+        elif line.strip() and beats:
+            beats[-1] = f"{beats[-1]} {line.strip()}"
+    if len(beats) < 2:
+        beats = [" ".join(p.split()) for p in re.split(r"\n\s*\n", text) if p.strip()]
+    return beats or [text]
+
+
+def plan_beats(descriptions: List[str], target_words: int, max_words: int, max_beats: int = 12) -> List[SceneBeat]:
+    """Size beats so the chapter reaches target_words with no beat over max_words
+
+    Too many beats are merged in neighbouring groups; beats too long for one
+    call are split into parts.
+    """
+    if len(descriptions) > max_beats:
+        size = math.ceil(len(descriptions) / max_beats)
+        descriptions = ["; then ".join(descriptions[i:i + size]) for i in range(0, len(descriptions), size)]
+    per_beat = math.ceil(target_words / len(descriptions))
+    parts = math.ceil(per_beat / max_words)
+    planned = []
+    for description in descriptions:
+        for part in range(1, parts + 1):
+            suffix = f" (part {part} of {parts})" if parts > 1 else ""
+            planned.append(f"{description}{suffix}")
+    words = math.ceil(target_words / len(planned))
+    return [SceneBeat(number, description, words) for number, description in enumerate(planned, 1)]
+
+
+def format_beats(beats: List[SceneBeat]) -> str:
+    """Tagged beat list, readable in the transcript and parsed back by read_beats"""
+    return "SCENE BEATS:\n" + "\n".join(f"{b.number}. (~{b.target_words} words) {b.description}" for b in beats)
+
+
+def read_beats(text: str) -> List[SceneBeat]:
+    beats = []
+    for line in text.splitlines():
+        match = _PLANNED_BEAT.match(line)
+        if match:
+            beats.append(SceneBeat(int(match.group(1)), match.group(3).strip(), int(match.group(2))))
+    return beats
+
+
+def paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def split_passages(text: str, max_words: int) -> List[str]:
+    """Group whole paragraphs into passages of at most max_words (a longer paragraph stands alone)"""
+    passages, current, count = [], [], 0
+    for paragraph in paragraphs(text):
+        words = len(paragraph.split())
+        if current and count + words > max_words:
+            passages.append("\n\n".join(current))
+            current, count = [], 0
+        current.append(paragraph)
+        count += words
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+class SceneBeatWriter:
+    """Draft, stitch and revise a chapter in beat-sized concurrent calls"""
+
+    def __init__(self, max_workers: int = 3, cancel_token: Optional[CancellationToken] = None,
+                 max_continuations: int = 3):
+        self.max_workers = max_workers
+        self.cancel_token = cancel_token or shutdown_token
+        self.max_continuations = max_continuations
+
+    def _ask(self, agent: Any, message: str, tag: str, brief: Optional[str] = None) -> str:
+        """One reply from agent with the tag and surrounding whitespace removed
+
+        With a brief, a reply cut off at the token limit is continued from its tail.
+        """
+        self.cancel_token.raise_if_cancelled()
+        clear_finish_reason()
+        reply = agent.generate_reply(messages=[{"role": "user", "content": message}])
+        if isinstance(reply, dict):
+            reply = reply.get("content")
+        reply = split_reasoning(str(reply or ""))[0]
+        if not reply:
+            raise ValueError(f"{getattr(agent, 'name', 'agent')} returned an empty {tag}")
+        if brief is not None and self.max_continuations:
+            reply, _ = continue_reply(agent, brief, tag, reply, max_continuations=self.max_continuations)
+        return reply.split(f"{tag}:", 1)[-1].strip()
+
+    def _map(self, func: Callable, items: List) -> List:
+        """Run func over items concurrently; each worker inherits the caller's deadline scope"""
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        contexts = [contextvars.copy_context() for _ in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(lambda ctx, item: ctx.run(func, item), contexts, items))
+
+    def draft(self, agent: Any, beats: List[SceneBeat], context: str) -> List[str]:
+        """Draft every beat concurrently; each call knows its neighbours so the scenes connect"""
+        outline = "\n".join(f"{b.number}. {b.description}" for b in beats)
+
+        def draft_beat(beat: SceneBeat) -> str:
+            neighbours = []
+            if beat.number > 1:
+                neighbours.append(f"The previous scene covers: {beats[beat.number - 2].description}")
+            if beat.number < len(beats):
+                neighbours.append(f"The next scene covers: {beats[beat.number].description}")
+            message = (f"{context}\n\n--- SCENE BEATS ---\n{outline}\n\n"
+                       f"Your task (SCENE DRAFT): Write ONLY scene {beat.number} of {len(beats)}: {beat.description}\n"
+                       + "\n".join(neighbours) +
+                       f"\nWrite about {beat.target_words} words of finished prose. Do not summarize or write "
+                       f"other scenes.\nBegin your response with 'SCENE DRAFT:'.")
+            text = self._ask(agent, message, "SCENE DRAFT", brief=context)
+            logger.info(f"Scene beat {beat.number}/{len(beats)} drafted: {len(text.split())} words")
+            return text
+
+        return self._map(draft_beat, beats)
+
+    def smooth(self, agent: Any, scenes: List[str]) -> List[str]:
+        """Rewrite the paragraphs on either side of each seam so scenes flow into each other
+
+        A seam is skipped when smoothing it would rewrite a paragraph that the
+        neighbouring seam also rewrites.
+        """
+        parts = [paragraphs(scene) for scene in scenes]
+        last = len(parts) - 1
+        seams = [k for k in range(last) if parts[k] and parts[k + 1]
+                 and (len(parts[k]) >= 2 or k == 0) and (len(parts[k + 1]) >= 2 or k + 1 == last)]
+
+        def smooth_seam(k: int) -> Optional[Tuple[str, str]]:
+            message = ("Two consecutive scenes of a chapter were written separately. Rewrite the last paragraph "
+                       "of the first scene and the first paragraph of the second so they flow naturally, keeping "
+                       "their events and voice. Return the two paragraphs separated by a line containing only ===."
+                       f"\n\n--- END OF SCENE {k + 1} ---\n{parts[k][-1]}"
+                       f"\n\n--- START OF SCENE {k + 2} ---\n{parts[k + 1][0]}"
+                       "\n\nBegin your response with 'TRANSITION:'.")
+            pair = [p.strip() for p in _SEAM_SPLIT.split(self._ask(agent, message, "TRANSITION"))]
+            if len(pair) != 2 or not all(pair):
+                logger.warning(f"Transition {k + 1}->{k + 2} was not returned as two paragraphs; kept as drafted")
+                return None
+            return pair[0], pair[1]
+
+        for k, pair in zip(seams, self._map(smooth_seam, seams)):
+            if pair:
+                parts[k][-1], parts[k + 1][0] = pair
+        return ["\n\n".join(p) for p in parts]
+
+    def revise(self, agent: Any, draft: str, feedback: str, context: str, max_words: int) -> str:
+        """Apply editor feedback passage by passage so no call has to reproduce the whole chapter"""
+        passages = split_passages(draft, max_words)
+
+        def revise_passage(index: int) -> str:
+            message = (f"{context}\n\n--- FEEDBACK ---\n{feedback}\n\n"
+                       f"--- PASSAGE {index + 1} OF {len(passages)} ---\n{passages[index]}\n\n"
+                       f"Your task (SCENE FINAL): Revise ONLY this passage using the feedback that applies to it. "
+                       f"Keep its opening and closing so it still joins the passages around it. Return the full "
+                       f"revised passage, at least as long as the original.\nBegin your response with 'SCENE FINAL:'.")
+            return self._ask(agent, message, "SCENE FINAL", brief=context)
+
+        return "\n\n".join(self._map(revise_passage, list(range(len(passages)))))
@@ -3,25 +3,18 @@ Streamlit UI for AI Book Writer - WITH OLLAMA BASE URL INPUT IN UI
 """
 import os
 import streamlit as st
-import ebooklib
-from ebooklib import epub
 from datetime import datetime
 from pathlib import Path
 import glob
 import json
-import markdown
 import subprocess
-import signal  # Import the signal module
-from config.settings import Settings, LLMSettings
+from config.settings import get_settings
+from run_store import RunDirectory, list_runs, new_run_id
+from job_queue import CANCELLED, COMPLETED, FAILED, JobQueue, default_queue_path, ensure_worker_service
 import logging
 from logging.config import dictConfig
-from agents import BookAgents
-from book_generator import BookGenerator
-from outline_generator import OutlineGenerator
-import litellm  # Import litellm for listing ollama models
-
-# Enable verbose logging for litellm - ADDED HERE!
-litellm.set_verbose = True
+# ebooklib, markdown and litellm are imported inside the functions that use them;
+# book generation runs in main.py processes started by the job_queue worker service
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,8 +27,8 @@ if 'current_chapter' not in st.session_state:
     st.session_state.current_chapter = 1
 if 'preview_content' not in st.session_state:
     st.session_state.preview_content = ""
-if 'process' not in st.session_state:  # To store the subprocess
-    st.session_state.process = None
+if 'job_id' not in st.session_state:  # Queued generation job submitted from this session
+    st.session_state.job_id = None
 if 'stop_generation' not in st.session_state:  # Flag to control generation
     st.session_state.stop_generation = False
 if 'ollama_models' not in st.session_state: # Store Ollama model list in session state
@@ -61,6 +54,8 @@ def save_env_file(env_dict):
 
 def create_epub(title, author, chapters_dir, output_path, cover_image=None):
     """Create EPUB book from generated chapters with enhanced features"""
+    import markdown
+    from ebooklib import epub
     book = epub.EpubBook()
 
     # Set metadata
@@ -157,6 +152,7 @@ def export_to_pdf(epub_path, output_path):
 
 def preview_chapter(chapter_path):
     """Preview chapter content with formatting"""
+    import markdown
     try:
         with open(chapter_path, 'r') as f:
             content = f.read()
@@ -166,6 +162,8 @@ def preview_chapter(chapter_path):
 
 def get_ollama_models():
     """Lists models available in Ollama using litellm"""
+    import litellm
+    litellm.set_verbose = True
     try:
         response = litellm.ollama_list_models()
         if response and response.get('models'):
@@ -192,7 +190,7 @@ def main():
 
     # Initialize settings
     print("Environment LLM__MODEL:", os.environ.get('LLM__MODEL')) # <-- Add this
-    settings = Settings()
+    settings = get_settings()  # Cached; reloaded automatically after .env is saved
     print("Settings LLM Model:", settings.llm.model) # <-- Add this
 
     # Tabs for different sections
@@ -340,15 +338,16 @@ def main():
                     return
 
                 # Save custom outline if provided
+                custom_outline_path = None
                 if custom_outline:
-                    os.makedirs('book_output', exist_ok=True)
-                    with open('book_output/custom_outline.txt', 'w') as f:
+                    outlines_dir = os.path.join(settings.generation.output_dir, "outlines")
+                    os.makedirs(outlines_dir, exist_ok=True)
+                    custom_outline_path = os.path.join(outlines_dir, f"{new_run_id()}.txt")  # Unique, so concurrent jobs don't collide
+                    with open(custom_outline_path, 'w') as f:
                         f.write(custom_outline)
-                    os.environ['CUSTOM_OUTLINE'] = "book_output/custom_outline.txt" # Set env var for custom outline
-                    print(f"Custom outline saved to book_output/custom_outline.txt and CUSTOM_OUTLINE env var set") # Log custom outline saving
+                    print(f"Custom outline saved to {custom_outline_path}") # Log custom outline saving
                 else:
-                    os.environ.pop('CUSTOM_OUTLINE', None) # Ensure custom outline env var is unset if no custom outline provided
-                    print("CUSTOM_OUTLINE environment variable unset (using generated outline)") # Log outline type
+                    print("No custom outline (using generated outline)") # Log outline type
 
                 st.session_state.generation_status = "Generating Outline"
                 st.session_state.current_chapter = 1
@@ -358,25 +357,16 @@ def main():
                 env_dict['NUM_CHAPTERS'] = str(num_chapters)
                 save_env_file(env_dict)
 
-                # Prepare and start book generation process
-                progress_bar = st.progress(0)
-                status_text_area = st.empty()
-                print("Before subprocess.Popen (direct main.py)") # Updated print message
-                st.session_state.process = subprocess.Popen(
-                    ["./venv/bin/python", "main.py"],  # Run main.py directly
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    env={**os.environ.copy(),  # Inherit existing env vars and add/override:
-                         "LLM__MODEL": env_dict.get('LLM__MODEL'), # Pass LLM_MODEL
-                         "BOOK_GENRE": env_dict.get('BOOK_GENRE'), # Pass BOOK_GENRE
-                         "OLLAMA_BASE_URL": env_dict.get('OLLAMA_BASE_URL', 'http://localhost:11434'), # Pass Ollama URL
-                         "CUSTOM_OUTLINE": os.environ.get('CUSTOM_OUTLINE', '') # Pass CUSTOM_OUTLINE if set, otherwise empty
-                         },
-                    preexec_fn=os.setsid,
-                    cwd=os.getcwd()
-                )
-                print("After subprocess.Popen (direct main.py)") # Updated print message
+                # Queue the job; the worker service limits how many books generate at once
+                queue_path = default_queue_path()
+                job = JobQueue(queue_path).submit(
+                    initial_prompt_text, env_dict.get('BOOK_GENRE'), model=env_dict.get('LLM__MODEL'),
+                    chapters=int(num_chapters), custom_outline=custom_outline_path)
+                st.session_state.job_id = job.id
+                st.session_state.run_id = job.run_id  # main.py writes the chapters under this run
+                if ensure_worker_service(queue_path, requests_per_minute=settings.generation.requests_per_minute):
+                    print("Started job queue worker service")
+                print(f"Queued job {job.id} for run {job.run_id}")
                 st.session_state.generation_status = "Generating Book Content"
                 print("--- End Generate Book Button Clicked ---\n") # ADD THIS LINE
 
@@ -394,30 +384,46 @@ def main():
 
             chapter_display.markdown(f"**Generating Chapter:** {st.session_state.current_chapter}")
 
-            if st.session_state.process and st.session_state.process.poll() is None: # Check if process is running
+            job_queue = JobQueue(default_queue_path())
+            job = job_queue.get(st.session_state.job_id) if st.session_state.job_id else None
+            if job:
+                queued_ahead = len([j for j in job_queue.list_jobs(status="queued", limit=1000)
+                                    if (j.priority, -j.id) > (job.priority, -job.id)])
+                st.caption(f"Job {job.id}: {job.status}" + (f" ({queued_ahead} ahead in queue)" if job.status == "queued" else ""))
+
+            if job and job.status not in (COMPLETED, FAILED, CANCELLED): # Queued or running
                  with stop_button_col[0]: # Use the first column for button
                     if st.button("Stop Generation"):
-                        if st.session_state.process:
-                            os.killpg(os.getpgid(st.session_state.process.pid), signal.SIGTERM) # Send SIGTERM to the process group
-                            st.session_state.stop_generation = True # Set stop flag
-                            st.session_state.process = None # Reset process state
-                            st.session_state.generation_status = "Generation Stopped by User"
-                            status_display.warning("Generation Stopped by User")
+                        job_queue.cancel(job.id) # The worker service stops the job's process group
+                        st.session_state.stop_generation = True # Set stop flag
+                        st.session_state.job_id = None # Reset job state
+                        st.session_state.generation_status = "Generation Stopped by User"
+                        status_display.warning("Generation Stopped by User")
 
 
-            if st.session_state.generation_status == "Generating Book Content" and st.session_state.process:
-                if st.session_state.process.poll() is not None: # Process finished
+            if st.session_state.generation_status == "Generating Book Content" and job:
+                if job.status == COMPLETED:
                     st.session_state.generation_status = "Book Generation Complete"
                     status_display.success("Book Generation Complete!")
                     chapter_display.empty() # Clear chapter display on completion
-                    st.session_state.process = None # Reset process state
-                    progress_bar.empty() # Clear progress bar
-                    status_text_area.empty() # Clear status text area
+                    st.session_state.job_id = None # Reset job state
+                elif job.status in (FAILED, CANCELLED):
+                    st.session_state.generation_status = f"Book Generation {job.status.title()}"
+                    status_display.error(f"Book generation {job.status}: {job.error or ''}")
+                    st.session_state.job_id = None # Reset job state
 
 
     with tab3:
         st.header("Preview & Export")
-        chapter_files_preview = glob.glob('book_output/chapter_*.txt')
+        output_root = settings.generation.output_dir
+        runs = list_runs(output_root, limit=200)  # Read from the run catalog; no directory walk
+        run_ids = [entry["run_id"] for entry in runs]
+        current_run = st.session_state.get("run_id")
+        selected_run_id = st.selectbox("Select Run", run_ids,
+                                       index=run_ids.index(current_run) if current_run in run_ids else 0)
+        selected_run = RunDirectory(output_root, selected_run_id) if selected_run_id else None
+        chapters_dir = selected_run.chapters_dir if selected_run else output_root
+        chapter_files_preview = glob.glob(os.path.join(chapters_dir, 'chapter_*.txt'))
         chapter_files_preview.sort()
         selected_chapter_file = st.selectbox("Select Chapter to Preview", chapter_files_preview)
         if selected_chapter_file:
@@ -430,10 +436,10 @@ def main():
         book_title_export = st.text_input("Book Title for Export", value=env_dict.get('BOOK_TITLE', 'My AI Book') + " export")
         book_author_export = st.text_input("Author Name for Export", value=env_dict.get('BOOK_AUTHOR', 'AI Author'))
         export_format = st.selectbox("Export Format", ["EPUB", "PDF"], index=0)
-        chapters_dir = 'book_output'
+        export_dir = selected_run.path if selected_run else output_root
         output_filename_base = f"{book_title_export.replace(' ', '_').lower()}_by_{book_author_export.replace(' ', '_').lower()}".replace(" ", "_")
-        output_epub_path = os.path.join('book_output', f"{output_filename_base}.epub")
-        output_pdf_path = os.path.join('book_output', f"{output_filename_base}.pdf")
+        output_epub_path = os.path.join(export_dir, f"{output_filename_base}.epub")
+        output_pdf_path = os.path.join(export_dir, f"{output_filename_base}.pdf")
 
         if st.button("Export Book"):
             if export_format == "EPUB":
@@ -2,7 +2,7 @@
 
 import pytest
 import json
-from config.settings import LLMSettings
+from config.settings import LLMSettings, OutlineSettings, Settings
 
 def test_secret_str_serialization():
     """Test that SecretStr fields are properly serialized to JSON"""
@@ -43,3 +43,74 @@ def test_get_llm_config_serialization():
     assert data["model"] == "openai/gpt-4"
     assert data["api_key"] == "test-key-123"
     assert data["base_url"] is None
+
+def test_outline_llm_config_overrides():
+    """Outline settings override the main model while inheriting credentials lookup"""
+    settings = Settings(
+        llm=LLMSettings(model="openai/gpt-4", openai_api_key="test-key-123"),
+        outline=OutlineSettings(model="ollama/llama2", timeout=45, cache_enabled=False)
+    )
+
+    config = settings.get_outline_llm_config()
+
+    assert config["model"] == "ollama/llama2"
+    assert config["ollama_base_url"] == "http://localhost:11434"
+    assert config["timeout"] == 45
+    assert config["cache_enabled"] is False
+
+    settings = Settings(llm=LLMSettings(model="openai/gpt-4", openai_api_key="test-key-123"))
+    config = settings.get_outline_llm_config()
+    assert config["model"] == "openai/gpt-4"
+    assert config["api_key"] == "test-key-123"
+
+
+@pytest.fixture
+def isolated_env(tmp_path, monkeypatch):
+    """Run against an empty working directory so the cached settings read a test .env"""
+    import config.settings as settings_module
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings_module, "_DOTENV_PATH", "")
+    settings_module.reload_settings()
+    yield tmp_path
+    settings_module.reload_settings()
+
+
+def test_get_settings_is_cached_and_frozen(isolated_env):
+    """Repeated calls return the same validated instance, which cannot be mutated"""
+    from config.settings import get_settings
+    first = get_settings()
+    assert get_settings() is first
+    with pytest.raises(Exception):
+        first.generation.max_chapters = 3
+
+
+def test_settings_reload_when_env_file_changes(isolated_env, monkeypatch):
+    """Writing .env invalidates the cache on the next call; reload_settings forces it"""
+    import os
+    from config.settings import get_settings, reload_settings
+    monkeypatch.delenv("GEN_MAX_CHAPTERS", raising=False)  # Restored after the test
+    monkeypatch.setenv("LLM__MODEL", "ollama/llama2")  # Set explicitly, e.g. for one queued job
+    env_file = isolated_env / ".env"
+    env_file.write_text("GEN_MAX_CHAPTERS=10\nLLM__MODEL=deepseek-chat\n")
+    before = reload_settings()
+    assert (before.generation.max_chapters, before.llm.model) == (10, "ollama/llama2")
+
+    env_file.write_text("GEN_MAX_CHAPTERS=7\nLLM__MODEL=deepseek-chat\n")
+    os.utime(env_file, (1_000_000_000, 1_000_000_000))
+    assert get_settings().generation.max_chapters == 7
+    assert get_settings().llm.model == "ollama/llama2"  # .env never overrides the real environment
+
+    env_file.write_text("")
+    forced = reload_settings()
+    assert get_settings() is forced
+    assert "GEN_MAX_CHAPTERS" not in os.environ  # Dropped from .env, so no longer exported
+
+
+def test_agent_timeouts_from_env(monkeypatch):
+    """TIMEOUT_AGENTS replaces the per-agent map; missing agents use the request total"""
+    from config.settings import TimeoutSettings
+    monkeypatch.setenv("TIMEOUT_AGENTS", '{"writer": 1200}')
+    monkeypatch.setenv("TIMEOUT_REQUEST_TOTAL", "90")
+    timeouts = TimeoutSettings()
+    assert timeouts.for_agent("writer") == 1200
+    assert timeouts.for_agent("memory_keeper") == 90
@@ -0,0 +1,156 @@
+"""Tests for cooperative cancellation in the LLM clients"""
+import json
+import threading
+import time
+
+import pytest
+
+from llm.cancellation import CancellationToken, GenerationCancelled, shutdown_token
+from llm.rate_limiter import RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def reset_shutdown_token():
+    shutdown_token.reset()
+    yield
+    shutdown_token.reset()
+
+
+def test_token_wakes_waiters_and_runs_callbacks():
+    token = CancellationToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("first"))
+    timer = threading.Timer(0.05, token.cancel, args=("SIGTERM",), kwargs={"grace": 10})
+    timer.start()
+
+    start = time.perf_counter()
+    assert token.wait(5)
+    assert time.perf_counter() - start < 1
+    timer.join()  # Callbacks run on the cancelling thread
+    assert calls == ["first"]
+    assert 0 < token.remaining() <= 10
+    token.on_cancel(lambda: calls.append("late"))  # Already cancelled: runs immediately
+    assert calls == ["first", "late"]
+
+    with pytest.raises(GenerationCancelled) as excinfo:
+        token.raise_if_cancelled(partial="half a sent")
+    assert (excinfo.value.reason, excinfo.value.partial) == ("SIGTERM", "half a sent")
+
+
+def test_rate_limiter_wait_is_interrupted_by_shutdown():
+    limiter = RateLimiter(requests_per_minute=1, burst=1)
+    limiter.acquire()  # Next token is a minute away
+    threading.Timer(0.05, shutdown_token.cancel, args=("SIGTERM",)).start()
+    start = time.perf_counter()
+    with pytest.raises(GenerationCancelled):
+        limiter.acquire()
+    assert time.perf_counter() - start < 1
+
+
+class FakeStreamResponse:
+    """requests.Response stand-in yielding server-sent event lines"""
+
+    def __init__(self, lines, on_line=None):
+        self.lines = lines
+        self.on_line = on_line
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=True):
+        for index, line in enumerate(self.lines):
+            if self.on_line:
+                self.on_line(index)
+            yield line
+
+    def close(self):
+        self.closed = True
+
+
+def _event(content=None, finish_reason=None, usage=None):
+    chunk = {"choices": [{"delta": {"content": content}, "finish_reason": finish_reason}] if content or finish_reason else []}
+    if usage:
+        chunk["usage"] = usage
+    return "data: " + json.dumps(chunk)
+
+
+def test_deepseek_stream_is_assembled_with_usage():
+    from llm.deepseek_client import DeepSeekClient
+
+    client = DeepSeekClient({"api_key": "sk-test"})
+    response = FakeStreamResponse([_event("Once "), "", _event("upon", "stop"),
+                                   _event(usage={"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}),
+                                   "data: [DONE]"])
+    content, finish_reason, usage = client._read_stream(response)
+    assert (content, finish_reason, usage["total_tokens"]) == ("Once upon", "stop", 5)
+    assert response.closed
+
+
+def test_deepseek_stream_aborts_with_partial_text():
+    from llm.deepseek_client import DeepSeekClient
+
+    client = DeepSeekClient({"api_key": "sk-test"})
+    lines = [_event("Once "), _event("upon "), _event("a time"), "data: [DONE]"]
+    response = FakeStreamResponse(lines, on_line=lambda i: i == 2 and shutdown_token.cancel("SIGTERM"))
+    with pytest.raises(GenerationCancelled) as excinfo:
+        client._read_stream(response)
+    assert excinfo.value.partial == "Once upon "
+    assert response.closed
+
+
+def test_stalled_litellm_stream_is_closed_on_cancel():
+    """A stream that stops sending is closed and abandoned instead of waiting out its idle timeout"""
+    from types import SimpleNamespace
+    from llm.deadline import current_budget
+    from llm.litellm_implementations import OllamaImplementation
+
+    class StalledStream:
+        def __init__(self):
+            self.released = threading.Event()
+
+        def __iter__(self):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Once upon "),
+                                                           finish_reason=None)])
+            self.released.wait(30)
+            raise ConnectionError("stream closed")
+
+        def close(self):
+            self.released.set()
+
+    stream = StalledStream()
+    client = OllamaImplementation(model="llama2")
+    threading.Timer(0.05, shutdown_token.cancel, args=("SIGTERM",), kwargs={"grace": 30}).start()
+    with pytest.raises(GenerationCancelled) as excinfo:
+        list(client._read_chunks(stream, current_budget()))
+    assert excinfo.value.partial == "Once upon "
+    assert stream.released.is_set()
+
+
+def test_stalled_deepseek_stream_is_shut_down_on_cancel():
+    """Cancellation shuts the socket of a stalled DeepSeek stream down, waking the blocked read"""
+    import socket
+    import requests
+    from llm.deepseek_client import DeepSeekClient
+
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    disconnected = threading.Event()
+
+    def serve():
+        conn, _ = server.accept()
+        conn.recv(65536)
+        line = (_event("Once upon ") + "\n").encode()
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n"
+                     + b"%x\r\n%s\r\n" % (len(line), line))
+        conn.settimeout(30)
+        if conn.recv(1) == b"":  # Stalls until the client hangs up
+            disconnected.set()
+        conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    response = requests.post(f"http://127.0.0.1:{server.getsockname()[1]}/", stream=True, timeout=(5, 30))
+    threading.Timer(0.2, shutdown_token.cancel, args=("SIGTERM",), kwargs={"grace": 30}).start()
+    with pytest.raises(GenerationCancelled) as excinfo:
+        DeepSeekClient({"api_key": "sk-test"})._read_stream(response)
+    assert excinfo.value.partial == "Once upon "
+    assert disconnected.wait(10)
+    server.close()
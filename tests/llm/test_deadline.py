@@ -0,0 +1,85 @@
+"""Tests for deadline scopes and their use by the LLM clients"""
+import json
+import time
+
+import pytest
+import requests
+
+from llm.deadline import DeadlineExceeded, current_budget, deadline_scope, timeout_defaults
+
+
+def test_nested_scopes_only_shorten_the_deadline():
+    with deadline_scope(10, idle=5, connect=3, label="chapter") as chapter:
+        with deadline_scope(100, label="writer") as step:
+            assert step.deadline == chapter.deadline  # Cannot outlive the chapter
+            assert (step.idle, step.connect, step.label) == (5, 3, "writer")
+        with deadline_scope(1) as short:
+            assert short.remaining() <= 1
+            assert short.label == "chapter"
+            assert short.read_timeout() <= 1  # Idle timeout capped by the deadline
+        assert current_budget() is chapter
+    assert current_budget().remaining() == pytest.approx(timeout_defaults.total, abs=1)
+
+
+def test_expired_budget_raises_with_partial_text():
+    with deadline_scope(0.01, label="memory_update") as budget:
+        time.sleep(0.02)
+        assert budget.expired
+        assert budget.total_timeout() > 0  # Never a zero timeout, which some clients treat as none
+        with pytest.raises(DeadlineExceeded) as excinfo:
+            budget.check("Remembered so far")
+    assert isinstance(excinfo.value, TimeoutError)
+    assert (excinfo.value.label, excinfo.value.partial) == ("memory_update", "Remembered so far")
+    assert budget.limited(None) is budget
+
+
+class SlowStreamResponse:
+    """requests.Response stand-in whose lines arrive slowly"""
+
+    def __init__(self, contents, delay):
+        self.contents = contents
+        self.delay = delay
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=True):
+        for content in self.contents:
+            time.sleep(self.delay)
+            yield "data: " + json.dumps({"choices": [{"delta": {"content": content}, "finish_reason": None}]})
+        yield "data: [DONE]"
+
+    def close(self):
+        self.closed = True
+
+
+def test_deepseek_stream_stops_at_the_total_deadline():
+    """Chunks that each arrive within the idle timeout still cannot exceed the total"""
+    from llm.deepseek_client import DeepSeekClient
+
+    client = DeepSeekClient({"api_key": "sk-test"})
+    response = SlowStreamResponse(["It ", "was ", "a ", "dark ", "night"], delay=0.03)
+    with deadline_scope(0.08, idle=1) as budget:
+        with pytest.raises(DeadlineExceeded) as excinfo:
+            client._read_stream(response, budget)
+    assert excinfo.value.partial.startswith("It ")
+    assert excinfo.value.partial != "It was a dark night"
+    assert response.closed
+
+
+def test_deepseek_uses_budget_timeouts_and_skips_retries_without_time(monkeypatch):
+    from llm.deepseek_client import DeepSeekClient
+
+    calls = []
+
+    def hung_post(url, headers=None, json=None, timeout=None, stream=False):
+        calls.append(timeout)
+        raise requests.exceptions.ReadTimeout("no data")
+
+    monkeypatch.setattr(requests, "post", hung_post)
+    client = DeepSeekClient({"api_key": "sk-test"})
+    client.retry_delay = 1.0
+    with deadline_scope(0.5, idle=7, connect=4):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            client.create({"messages": [{"role": "user", "content": "hi"}]})
+    assert len(calls) == 1  # The 1s backoff would overrun the 0.5s deadline
+    connect, read = calls[0]
+    assert connect == 4 and 0 < read <= 0.5
@@ -3,7 +3,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))) # Add project root to PYTHONPATH
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch
 from llm.litellm_implementations import OllamaImplementation
 from types import SimpleNamespace
 
@@ -22,10 +22,11 @@ class TestOllamaImplementationCreate(unittest.TestCase):
         self.litellm_completion_patcher = patch('llm.litellm_implementations.litellm.completion')
         self.mock_litellm_completion = self.litellm_completion_patcher.start()
 
-        # Configure mock response for litellm.completion
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock(message=MagicMock(content='Mocked response content'))]
-        self.mock_litellm_completion.return_value = mock_response
+        # Configure litellm.completion to stream the response in chunks
+        self.mock_litellm_completion.return_value = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=reason)])
+            for text, reason in (('Mocked response ', None), ('content', 'stop'))
+        ]
 
     def tearDown(self):
         """Clean up test fixture"""
@@ -37,11 +38,17 @@ class TestOllamaImplementationCreate(unittest.TestCase):
 
         # Assert that litellm.completion was called with the correct arguments
         self.mock_litellm_completion.assert_called_once_with(
-            model=self.model_name, # Now passing just the model name
+            model=f"ollama/{self.model_name}", # Full ollama model string
             messages=self.sample_messages,
             base_url=self.base_url,
-            provider="ollama"
+            provider="ollama",
+            timeout=ANY,
+            stream=True,
+            stream_timeout=ANY
         )
+        kwargs = self.mock_litellm_completion.call_args.kwargs
+        self.assertGreater(kwargs['timeout'], 0)
+        self.assertGreater(kwargs['stream_timeout'], 0)
 
         # Assert that the function returns a SimpleNamespace object
         self.assertIsInstance(result, SimpleNamespace)
@@ -50,6 +57,7 @@ class TestOllamaImplementationCreate(unittest.TestCase):
 
         # Assert that the response content is correctly extracted
         self.assertEqual(result.choices[0].message.content, 'Mocked response content')
+        self.assertEqual(result.choices[0].finish_reason, 'stop')
         self.assertEqual(result.model, f"ollama/{self.model_name}") # Model name should be the full ollama model string
 
 
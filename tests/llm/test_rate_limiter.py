@@ -0,0 +1,36 @@
+"""Tests for the shared LLM request rate limiter"""
+import threading
+import time
+
+from llm.rate_limiter import RateLimiter
+
+
+def test_unconfigured_limiter_never_waits():
+    limiter = RateLimiter()
+    assert all(limiter.acquire() == 0.0 for _ in range(100))
+    assert limiter.requests == 100
+    assert limiter.total_wait == 0.0
+
+
+def test_burst_is_free_then_requests_are_spaced():
+    limiter = RateLimiter(requests_per_minute=1200, burst=2)  # One token every 50 ms
+    start = time.perf_counter()
+    limiter.acquire()
+    limiter.acquire()
+    assert time.perf_counter() - start < 0.03
+    waited = limiter.acquire()
+    assert 0.03 < waited < 0.2
+    assert limiter.total_wait == waited
+
+
+def test_limit_holds_across_threads():
+    limiter = RateLimiter(requests_per_minute=1200, burst=1)
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(5)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The first request is immediate, the next four each wait for a 50 ms token
+    assert time.perf_counter() - start >= 0.18
+    assert limiter.requests == 5
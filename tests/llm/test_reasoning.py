@@ -0,0 +1,73 @@
+"""Tests for separating reasoning traces from answers"""
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from llm.reasoning import ReasoningFilter, clear_reasoning, last_reasoning, split_reasoning
+
+OUTPUT = "<think>The chapter should open on the pier.\nKeep it short.</think>\n\nSCENE DRAFT: The tide rolled in."
+
+
+@pytest.fixture(autouse=True)
+def fresh_reasoning():
+    clear_reasoning()
+    yield
+    clear_reasoning()
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 8, len(OUTPUT)])
+def test_filter_handles_tags_split_across_chunks(size):
+    reasoning_filter = ReasoningFilter()
+    answer = "".join(reasoning_filter.feed(OUTPUT[i:i + size]) for i in range(0, len(OUTPUT), size))
+    answer += reasoning_filter.flush()
+    assert answer == "SCENE DRAFT: The tide rolled in."
+    assert reasoning_filter.reasoning == "The chapter should open on the pier.\nKeep it short."
+
+
+def test_split_reasoning():
+    assert split_reasoning(OUTPUT) == ("SCENE DRAFT: The tide rolled in.",
+                                       "The chapter should open on the pier.\nKeep it short.")
+    assert split_reasoning("Plan first.</think>PLAN: Open on the pier.") == ("PLAN: Open on the pier.", "Plan first.")
+    assert split_reasoning("She wrote <thin lines.") == ("She wrote <thin lines.", "")
+    assert split_reasoning("<think>cut off mid-thought") == ("", "cut off mid-thought")
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=None)])
+
+
+def test_litellm_stream_and_ollama_forward_only_the_answer():
+    from llm.litellm_implementations import OllamaImplementation
+
+    client = OllamaImplementation(model="deepseek-r1:14b")
+    with patch("litellm.completion", return_value=[_chunk(OUTPUT[i:i + 4]) for i in range(0, len(OUTPUT), 4)]):
+        pieces = list(client.stream("Write"))
+    assert "".join(pieces) == "SCENE DRAFT: The tide rolled in."
+    assert not any("think" in piece for piece in pieces)
+    assert last_reasoning() == "The chapter should open on the pier.\nKeep it short."
+
+    clear_reasoning()
+    with patch("litellm.completion", return_value=[_chunk(OUTPUT)]):
+        result = client.create({"messages": [{"role": "user", "content": "Write"}]})
+    assert result.choices[0].message.content == "SCENE DRAFT: The tide rolled in."
+    assert last_reasoning().startswith("The chapter should open")
+
+
+def test_deepseek_reasoning_content_is_recorded_not_returned():
+    from llm.deepseek_client import DeepSeekClient
+
+    class Response:
+        def iter_lines(self, decode_unicode=True):
+            for delta in ({"reasoning_content": "Open on the pier."}, {"content": "SCENE DRAFT: "},
+                          {"content": "The tide rolled in."}):
+                yield "data: " + json.dumps({"choices": [{"delta": delta, "finish_reason": None}]})
+            yield "data: [DONE]"
+
+        def close(self):
+            pass
+
+    content, _, _ = DeepSeekClient({"api_key": "sk-test"})._read_stream(Response())
+    assert content == "SCENE DRAFT: The tide rolled in."
+    assert last_reasoning() == "Open on the pier."
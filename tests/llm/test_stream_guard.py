@@ -0,0 +1,139 @@
+"""Tests for repetition-loop detection on streamed completions"""
+import json
+import random
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from llm.cancellation import shutdown_token
+from llm.finish_reason import clear_finish_reason, last_finish_reason
+from llm.stream_guard import RepetitionGuard
+
+INTRO = "Mara reached the harbour as the lamps were lit. "
+LOOP = INTRO + "She walked to the window and looked out at the grey sea once more. " * 20
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    shutdown_token.reset()
+    clear_finish_reason()
+    yield
+    shutdown_token.reset()
+
+
+def _chunks(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _feed(guard, chunks):
+    emitted = []
+    for chunk in chunks:
+        emitted.append(guard.feed(chunk))
+        if guard.looping:
+            break
+    return "".join(emitted) + guard.flush()
+
+
+def test_loop_is_cut_after_its_first_occurrence():
+    guard = RepetitionGuard()
+    emitted = _feed(guard, _chunks(LOOP))
+    assert guard.looping
+    assert emitted.strip() == guard.kept() == (INTRO + "She walked to the window and looked out at the grey sea once more.")
+    assert len(guard.text) < len(LOOP)  # Stopped before the stream ended
+
+
+def test_varied_text_and_short_echoes_pass_through_unchanged():
+    rng = random.Random(3)
+    words = [f"word{i}" for i in range(400)]
+    prose = " ".join(rng.choice(words) for _ in range(3000))
+    guard = RepetitionGuard()
+    assert _feed(guard, _chunks(prose, 11)) == prose and not guard.looping
+
+    # A refrain repeated twice is well under the loop length
+    refrain = INTRO + "The bell rang over the water and no one answered it. " * 2 + "Then she went home."
+    guard = RepetitionGuard()
+    assert _feed(guard, _chunks(refrain)) == refrain and not guard.looping
+
+
+def test_ngram_history_is_bounded():
+    rng = random.Random(5)
+    prose = " ".join(f"word{rng.randrange(10**6)}" for _ in range(5000))
+    guard = RepetitionGuard(history=500)
+    assert _feed(guard, _chunks(prose, 11)) == prose
+    assert len(guard._history) == 500 and sum(guard._seen.values()) == 500
+
+    # A loop is still caught once the n-grams from before it have been forgotten
+    guard = RepetitionGuard(history=500)
+    _feed(guard, _chunks(prose + " " + LOOP))
+    assert guard.looping and guard.kept().endswith("grey sea once more.")
+
+
+def test_held_text_is_released_as_the_stream_moves_on():
+    guard = RepetitionGuard(ngram=3, loop_words=10)
+    assert guard.feed("one two three four ") == "one two "  # The last n-1 words are held back
+    assert guard.feed("five six ") == "three four "
+    assert guard.flush() == "five six "
+
+
+def _chunk(content=None, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content),
+                                                    finish_reason=finish_reason)])
+
+
+class FakeLiteLLMStream:
+    def __init__(self, text):
+        self.chunks = [_chunk(c) for c in _chunks(text)] + [_chunk(finish_reason="length")]
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def test_ollama_and_litellm_streams_stop_looping_generations():
+    from llm.litellm_implementations import OllamaImplementation
+
+    client = OllamaImplementation(model="deepseek-r1:14b")
+    stream = FakeLiteLLMStream(LOOP)
+    with patch("litellm.completion", return_value=stream) as completion:
+        result = client.create({"messages": [{"role": "user", "content": "Write"}]})
+    assert completion.call_args.kwargs["stream"] is True
+    assert result.choices[0].message.content.strip().endswith("grey sea once more.")
+    assert result.choices[0].finish_reason == last_finish_reason() == "repetition"
+    assert stream.closed and stream.read < len(stream.chunks)
+
+    stream = FakeLiteLLMStream(LOOP)
+    with patch("litellm.completion", return_value=stream):
+        streamed = "".join(client.stream("Write"))
+    assert streamed.strip() == result.choices[0].message.content.strip()
+
+    unguarded = OllamaImplementation(model="deepseek-r1:14b", loop_guard_words=0)
+    with patch("litellm.completion", return_value=FakeLiteLLMStream(LOOP)):
+        assert "".join(unguarded.stream("Write")) == LOOP
+    assert last_finish_reason() == "length"
+
+
+def test_deepseek_stream_drops_the_loop():
+    from llm.deepseek_client import DeepSeekClient
+
+    class Response:
+        closed = False
+
+        def iter_lines(self, decode_unicode=True):
+            for piece in _chunks(LOOP):
+                yield "data: " + json.dumps({"choices": [{"delta": {"content": piece}, "finish_reason": None}]})
+            yield "data: [DONE]"
+
+        def close(self):
+            self.closed = True
+
+    response = Response()
+    content, finish_reason, _ = DeepSeekClient({"api_key": "sk-test"})._read_stream(response)
+    assert (content.endswith("grey sea once more."), finish_reason) == (True, "repetition")
+    assert response.closed
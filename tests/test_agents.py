@@ -1,5 +1,6 @@
 """Unit tests for the BookAgents class"""
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 from agents import BookAgents
 
@@ -186,5 +187,98 @@ class TestBookAgents(unittest.TestCase):
         )
         self.assertEqual(agents.get_character_context(), expected_output)
 
+class TestOllamaAgents(unittest.TestCase):
+    """Agents for Ollama models call the model through OllamaImplementation"""
+
+    def setUp(self):
+        self.config_patcher = patch('agents.get_config', return_value={
+            "model": "ollama/llama2", "api_key": "ollama", "base_url": "http://localhost:11434"})
+        self.config_patcher.start()
+
+    def tearDown(self):
+        self.config_patcher.stop()
+
+    def test_replies_come_from_the_ollama_client(self):
+        """Generation is streamed by OllamaImplementation, not autogen's OpenAI client"""
+        from llm.litellm_implementations import OllamaImplementation
+
+        book_agents = BookAgents({"temperature": 0.7, "cache_seed": None})
+        writer = book_agents.create_agents("premise", 2)["writer"]
+        self.assertIsInstance(writer.client._clients[0], OllamaImplementation)
+
+        answer = "SCENE DRAFT: The tide rolled in."
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=answer[i:i + 8]),
+                                                           finish_reason=None)])
+                  for i in range(0, len(answer), 8)]
+        with patch('llm.litellm_implementations.litellm.completion', return_value=chunks) as completion:
+            reply = writer.generate_reply(messages=[{"role": "user", "content": "Write the scene"}])
+
+        self.assertEqual(reply, answer)
+        self.assertEqual(completion.call_args.kwargs["model"], "ollama/llama2")
+        self.assertEqual(completion.call_args.kwargs["base_url"], "http://localhost:11434")
+        self.assertTrue(completion.call_args.kwargs["stream"])
+
+
+class TestAgentModelRouting(unittest.TestCase):
+    """The agents' config_list follows the configured model"""
+
+    def test_config_list_uses_the_configured_model(self):
+        config = BookAgents({"temperature": 0.7}, llm_config={
+            "model": "deepseek/deepseek-reasoner", "api_key": "sk-test", "base_url": None}).agent_config
+        self.assertEqual([(entry["model"], entry["model_client_cls"]) for entry in config["config_list"]],
+                         [("deepseek-reasoner", "DeepSeekClient")])
+
+    def test_unroutable_models_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, "cannot be used by the book agents"):
+            BookAgents({"temperature": 0.7}, llm_config={"model": "openai/gpt-4o", "api_key": "sk-test"})
+
+
+class TestAgentRegistry(unittest.TestCase):
+    """Agents are built once and only their dynamic context is refreshed"""
+
+    def setUp(self):
+        self.config_patcher = patch('agents.get_config', return_value={
+            "model": "deepseek/deepseek-chat", "api_key": "sk-test", "base_url": "https://api.deepseek.com"})
+        self.mock_get_config = self.config_patcher.start()
+
+    def tearDown(self):
+        self.config_patcher.stop()
+
+    def test_agents_built_once_and_refreshed(self):
+        """A second create_agents call returns the same agents with the outline filled in"""
+        book_agents = BookAgents({"temperature": 0.7})
+        first = book_agents.create_agents("premise", 2)
+        book_agents.set_outline([{"chapter_number": 1, "title": "The Beginning", "prompt": "Start"}])
+        second = book_agents.create_agents("premise", 2)
+
+        self.assertTrue(all(first[name] is second[name] for name in first))
+        self.assertIn("Chapter 1: The Beginning", second["memory_keeper"].system_message)
+        self.assertEqual(second["writer_final"].system_message, second["writer"].system_message)
+        self.assertEqual(self.mock_get_config.call_count, 1)
+
+        metrics = book_agents.startup_metrics()
+        self.assertEqual(metrics["agents_built"], 10)
+        self.assertIn("writer", metrics["per_step_seconds"])
+
+    def test_world_updates_refresh_only_affected_agents(self):
+        """World context changes touch the writer, writer_final and editor only"""
+        book_agents = BookAgents({"temperature": 0.7})
+        book_agents.create_agents("premise", 2)
+        book_agents.update_world_element("Harbor", "Flooded docks")
+        self.assertEqual(book_agents.refresh_context(), 3)
+        self.assertEqual(book_agents.refresh_context(), 0)
+
+    def test_reuse_renders_the_new_premise_and_chapter_count(self):
+        """Reused agents take the premise and chapter count of the latest call"""
+        book_agents = BookAgents({"temperature": 0.7})
+        first = book_agents.create_agents("premise", 2)
+        second = book_agents.create_agents("A lighthouse keeper's secret", 5)
+
+        self.assertIs(first["outline_creator"], second["outline_creator"])
+        self.assertIn("A lighthouse keeper's secret", second["outline_creator"].system_message)
+        self.assertIn("5-chapter outline", second["outline_creator"].system_message)
+        self.assertNotIn("2-chapter outline", second["outline_creator"].system_message)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,100 @@
+"""Tests for headless batch generation"""
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from batch_runner import BatchRunner, load_manifest
+
+
+def _write(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def _settings(max_chapters=2):
+    return SimpleNamespace(generation=SimpleNamespace(max_chapters=max_chapters, planning_concurrency=1))
+
+
+def test_load_manifest_reads_jobs(tmp_path):
+    path = _write(tmp_path / "books.jsonl", [
+        json.dumps({"prompt": "A heist on Mars", "genre": "scifi", "chapters": 3, "model": "ollama/llama3"}),
+        "# comments and blank lines are skipped",
+        "",
+        json.dumps({"id": "Cozy Mystery", "prompt": "A village baker solves a murder"}),
+    ])
+    jobs = load_manifest(path)
+    assert [job.book_id for job in jobs] == ["0001-a-heist-on-mars", "cozy-mystery"]
+    assert (jobs[0].genre, jobs[0].chapters, jobs[0].model) == ("scifi", 3, "ollama/llama3")
+    assert (jobs[1].genre, jobs[1].chapters, jobs[1].model) == (None, None, None)
+
+
+@pytest.mark.parametrize("line, message", [
+    ("{not json", "invalid JSON"),
+    (json.dumps({"genre": "fantasy"}), "each entry needs a non-empty 'prompt'"),
+    (json.dumps({"prompt": "ok", "model": "openai/gpt-4o"}), "Model 'openai/gpt-4o' cannot be used by the book agents"),
+])
+def test_load_manifest_reports_line_numbers(tmp_path, line, message):
+    path = _write(tmp_path / "books.jsonl", [json.dumps({"prompt": "ok"}), line])
+    with pytest.raises(ValueError, match=f":2: {message}"):
+        load_manifest(path)
+
+
+def test_load_manifest_rejects_duplicate_ids(tmp_path):
+    path = _write(tmp_path / "books.jsonl", [json.dumps({"id": "same", "prompt": p}) for p in ("a", "b")])
+    with pytest.raises(ValueError, match="duplicate book id"):
+        load_manifest(path)
+
+
+class FakeBatchRunner(BatchRunner):
+    """Writes chapter files instead of calling the LLM and records concurrency"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def generate_book(self, job, run):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.05)
+            if job.prompt == "fail":
+                raise RuntimeError("model unavailable")
+            chapters = 1 if job.prompt == "short" else (job.chapters or 2)
+            for number in range(1, chapters + 1):
+                with open(run.chapter_path(number), "w") as f:
+                    f.write("one two three")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_runner_limits_concurrency_and_summarizes(tmp_path):
+    path = _write(tmp_path / "books.jsonl", [json.dumps({"prompt": p, "chapters": 2})
+                                             for p in ("a", "b", "c", "short", "fail")])
+    output_root = tmp_path / "out"
+    runner = FakeBatchRunner(_settings(), str(output_root), concurrency=2)
+    summary = runner.run(load_manifest(path))
+
+    assert runner.peak == 2
+    assert [r.status for r in summary.results] == ["completed"] * 3 + ["partial", "failed"]
+    assert summary.results[-1].error == "model unavailable"
+    assert summary.chapters_written == 7
+    assert summary.words == 21
+    # Each book gets its own run directory, recorded with its final status
+    assert len({r.output_dir for r in summary.results}) == 5
+    for result in summary.results:
+        assert result.output_dir.startswith(str(output_root / "runs"))
+        with open(os.path.join(result.output_dir, "manifest.json")) as f:
+            assert json.load(f)["status"] == result.status
+
+    written = json.loads((output_root / "summary.json").read_text())
+    assert (written["books"], written["completed"], written["partial"], written["failed"]) == (5, 3, 1, 1)
+    assert written["books_per_hour"] > 0
+    assert "Batch Summary" in summary.format()
@@ -0,0 +1,471 @@
+"""Tests for the chapter pipeline executor and its use in BookGenerator"""
+import json
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from chapter_pipeline import ChapterPipeline, PipelineCancelled, PipelineError, PipelineStep
+from llm.cancellation import CancellationToken, GenerationCancelled
+
+
+class FakeAgent:
+    """Agent stub that records the messages it receives"""
+
+    def __init__(self, name, reply=None, delay=0.0):
+        self.name = name
+        self.reply = reply
+        self.delay = delay
+        self.received = []
+        self.system_message = f"You are {name}."
+
+    def generate_reply(self, messages=None, sender=None, **kwargs):
+        self.received.append(messages[-1]["content"])
+        if self.delay:
+            time.sleep(self.delay)
+        if callable(self.reply):
+            return self.reply(messages[-1]["content"])
+        return self.reply if self.reply is not None else f"reply from {self.name}"
+
+
+def _prose(sentences=260):
+    """Varied prose over min_chapter_length; a repeated sentence would fail the quality gate"""
+    rng = random.Random(0)
+    vocabulary = ("tide pier lantern rope water boathouse bell sail harbour wall nets lighthouse anchor shingle "
+                  "boat storm cannery keeper brother fisherman gulls ferry crew mother stranger night dawn rain "
+                  "salt wind fog gravel plank hull oar mast deck cabin ledger letter coin knife candle window "
+                  "stair door key chain bucket hook net line cove reef cliff path gate chapel market inn cellar "
+                  "watched crossed remembered followed ignored searched mended counted waited cursed listened "
+                  "carried dropped opened closed hid found lost whispered laughed shivered ran climbed slipped "
+                  "old cold grey quiet broken torn rusted empty heavy bright narrow distant sudden late").split()
+    lines = ["The tide rolled in over the broken pier."]
+    lines += [" ".join(rng.sample(vocabulary, 9)).capitalize() + "." for _ in range(sentences - 1)]
+    return " ".join(lines)
+
+
+def _steps():
+    return [
+        PipelineStep("plan", "planner", "PLAN", "Plan it.", depends_on=("context",)),
+        PipelineStep("setting", "setter", "SETTING", "Set it.", depends_on=("plan",)),
+        PipelineStep("plot", "plotter", "PLOT", "Plot it.", depends_on=("plan",)),
+        PipelineStep("scene", "writer", "SCENE DRAFT", "Write it.", depends_on=("setting", "plot")),
+    ]
+
+
+def test_waves_follow_dependencies():
+    """Independent steps share a wave; dependents wait for them"""
+    pipeline = ChapterPipeline({}, _steps())
+    waves = [[step.name for step in wave] for wave in pipeline.waves(("context",))]
+    assert waves == [["plan"], ["setting", "plot"], ["scene"]]
+
+
+def test_unresolvable_dependency_is_rejected():
+    """A step depending on an unknown artifact fails before any agent is called"""
+    pipeline = ChapterPipeline({}, [PipelineStep("a", "x", "A", "", depends_on=("missing",))])
+    with pytest.raises(PipelineError):
+        pipeline.waves()
+
+
+def test_steps_receive_only_their_dependencies():
+    """Each agent sees the brief and its declared inputs, not the whole transcript"""
+    agents = {name: FakeAgent(name, reply=f"{tag}: {name} output") for name, tag in [
+        ("planner", "PLAN"), ("setter", "SETTING"), ("plotter", "PLOT"), ("writer", "SCENE DRAFT")]}
+    run = ChapterPipeline(agents, _steps()).run("Chapter 1: Brief", {"context": "earlier chapters"})
+
+    setting_message = agents["setter"].received[0]
+    assert "planner output" in setting_message
+    assert "earlier chapters" not in setting_message
+    writer_message = agents["writer"].received[0]
+    assert "setter output" in writer_message and "plotter output" in writer_message
+    assert "planner output" not in writer_message
+
+    assert [m["name"] for m in run.messages] == ["user_proxy", "planner", "setter", "plotter", "writer"]
+    assert set(run.timings) == {"plan", "setting", "plot", "scene"}
+
+
+def test_independent_steps_run_concurrently():
+    """Steps in the same wave overlap in time"""
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def reply(_message):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return "ok"
+
+    agents = {name: FakeAgent(name, reply=reply) for name in ("planner", "setter", "plotter", "writer")}
+    run = ChapterPipeline(agents, _steps(), max_workers=3).run("brief", {"context": ""})
+    assert max(peak) == 2
+    assert run.concurrency_savings() > 0.03
+
+
+def test_missing_tag_is_restored_and_failures_raise():
+    """Untagged replies are tagged by the executor; an empty reply fails the run"""
+    agents = {"planner": FakeAgent("planner", reply="just a plan")}
+    run = ChapterPipeline(agents, _steps()[:1]).run("brief", {"context": ""})
+    assert run.results["plan"].content.startswith("PLAN:")
+
+    agents = {"planner": FakeAgent("planner", reply="")}
+    with pytest.raises(PipelineError):
+        ChapterPipeline(agents, _steps()[:1]).run("brief", {"context": ""})
+
+
+def test_cancellation_keeps_completed_and_partial_steps():
+    """A step aborted mid-stream stops the run with its partial text and the finished steps"""
+    token = CancellationToken()
+
+    def interrupted(message):
+        token.cancel("SIGTERM")
+        raise GenerationCancelled("SIGTERM", partial="The plot so f")
+
+    agents = {"planner": FakeAgent("planner", "PLAN: p"), "setter": FakeAgent("setter", "SETTING: s"),
+              "plotter": FakeAgent("plotter", interrupted), "writer": FakeAgent("writer")}
+    pipeline = ChapterPipeline(agents, _steps(), cancel_token=token)
+
+    with pytest.raises(PipelineCancelled) as excinfo:
+        pipeline.run("brief", {"context": "ctx"})
+    run = excinfo.value.run
+    assert excinfo.value.reason == "SIGTERM"
+    assert run.completed == {"plan": "PLAN: p", "setting": "SETTING: s"}
+    assert run.partial == {"plot": "The plot so f"}
+    assert agents["writer"].received == []
+
+
+def test_cancelled_token_stops_before_the_next_wave():
+    token = CancellationToken()
+    token.cancel("stop")
+    agents = {name: FakeAgent(name) for name in ("planner", "setter", "plotter", "writer")}
+    with pytest.raises(PipelineCancelled, match="before step plan"):
+        ChapterPipeline(agents, _steps(), cancel_token=token).run("brief", {"context": "ctx"})
+    assert all(agent.received == [] for agent in agents.values())
+
+
+def test_completed_steps_are_not_run_again():
+    """Outputs from a checkpoint stand in for their steps"""
+    agents = {name: FakeAgent(name) for name in ("planner", "setter", "plotter", "writer")}
+    run = ChapterPipeline(agents, _steps(), cancel_token=CancellationToken()).run(
+        "brief", {"context": "ctx"}, completed={"plan": "PLAN: saved", "setting": "SETTING: saved"})
+
+    assert agents["planner"].received == [] and agents["setter"].received == []
+    assert "SETTING: saved" in agents["writer"].received[0]
+    assert run.results["plan"].resumed
+    assert [m["content"] for m in run.messages[1:3]] == ["PLAN: saved", "SETTING: saved"]
+
+
+def test_book_generator_runs_nine_steps(tmp_path, monkeypatch):
+    """generate_chapter runs every documented step once and saves the final scene"""
+    from book_generator import BookGenerator
+
+    monkeypatch.chdir(tmp_path)
+    prose = _prose()
+    replies = {
+        "memory_keeper": "MEMORY UPDATE: Nothing yet.",
+        "story_planner": "PLAN: Open on the pier.",
+        "setting_builder": "SETTING: A broken pier.",
+        "character_agent": "CHARACTER: Mara hesitates.",
+        "plot_agent": "PLOT: The tide turns.",
+        "writer": f"SCENE DRAFT: {prose}",
+        "editor": "FEEDBACK: Approved.",
+        "writer_final": f"SCENE FINAL: {prose}",
+    }
+    agents = {name: FakeAgent(name, reply=reply) for name, reply in replies.items()}
+    agents["user_proxy"] = FakeAgent("user_proxy")
+    outline = [{"chapter_number": 1, "title": "The Pier", "prompt": "Key Events:\n- Arrival"}]
+
+    generator = BookGenerator(agents, {}, outline)
+    monkeypatch.setattr(generator, "_get_writer_final", lambda: agents["writer_final"])
+    generator.generate_chapter(1, outline[0]["prompt"])
+
+    assert all(len(agent.received) == 1 for name, agent in agents.items() if name != "user_proxy")
+    assert agents["user_proxy"].received == []
+    assert set(generator.step_timings[1]) == {
+        "memory_update", "plan", "setting", "character", "plot", "planning_brief",
+        "scene", "feedback", "scene_final", "confirmation"}
+    writer_message = agents["writer"].received[0]
+    assert "WRITER BRIEF:\nSETTING: A broken pier.\n\nCHARACTER: Mara hesitates.\n\nPLOT: The tide turns." in writer_message
+    assert generator.run.path.startswith(str(tmp_path))
+    with open(generator.run.chapter_path(1), encoding="utf-8") as f:
+        assert f.read().startswith("Chapter 1\n\nThe tide rolled in")
+    assert os.listdir(generator.run.transcripts_dir) == ["chapter_01.jsonl"]
+    assert os.listdir(generator.run.metrics_dir) == ["chapter_01.json"]
+
+
+def test_book_generator_checkpoints_and_resumes(tmp_path, monkeypatch):
+    """A cancelled chapter leaves a checkpoint; resuming skips the steps that finished"""
+    from book_generator import BookGenerator
+    from run_store import RunDirectory
+
+    prose = _prose()
+    token = CancellationToken()
+
+    def cancelled_draft(message):
+        token.cancel("SIGTERM")
+        raise GenerationCancelled("SIGTERM", partial="The tide rol")
+
+    replies = {
+        "memory_keeper": "MEMORY UPDATE: Nothing yet.",
+        "story_planner": "PLAN: Open on the pier.",
+        "setting_builder": "SETTING: A broken pier.",
+        "character_agent": "CHARACTER: Mara hesitates.",
+        "plot_agent": "PLOT: The tide turns.",
+        "writer": cancelled_draft,
+        "editor": "FEEDBACK: Approved.",
+        "writer_final": f"SCENE FINAL: {prose}",
+    }
+    agents = {name: FakeAgent(name, reply=reply) for name, reply in replies.items()}
+    agents["user_proxy"] = FakeAgent("user_proxy")
+    outline = [{"chapter_number": 1, "title": "The Pier", "prompt": "Key Events:\n- Arrival"}]
+    run = RunDirectory.create(str(tmp_path))
+
+    generator = BookGenerator(agents, {}, outline, run=run, cancel_token=token)
+    monkeypatch.setattr(generator, "_get_writer_final", lambda: agents["writer_final"])
+    with pytest.raises(GenerationCancelled):
+        generator.generate_book(outline)
+
+    checkpoint = run.read_checkpoint()
+    assert checkpoint["chapter_number"] == 1
+    assert set(checkpoint["completed_steps"]) == {"memory_update", "plan", "setting", "character", "plot",
+                                                  "planning_brief"}
+    assert checkpoint["partial_steps"] == {"scene": "The tide rol"}
+    assert os.path.exists(os.path.join(run.transcripts_dir, "chapter_01.partial.jsonl"))
+    assert agents["user_proxy"].received == []  # No retry after a cancellation
+
+    # Resume in a fresh generator with a working writer
+    agents["writer"].reply = f"SCENE DRAFT: {prose}"
+    before = {name: len(agent.received) for name, agent in agents.items()}
+    resumed = BookGenerator(agents, {}, outline, run=run, cancel_token=CancellationToken())
+    monkeypatch.setattr(resumed, "_get_writer_final", lambda: agents["writer_final"])
+    monkeypatch.setattr(resumed, "_verify_chapter_content", lambda messages, number: True)
+    resumed.generate_book(outline, resume=True)
+
+    assert len(agents["story_planner"].received) == before["story_planner"]
+    assert len(agents["writer"].received) == before["writer"] + 1
+    assert os.path.exists(run.chapter_path(1))
+    assert run.read_checkpoint() is None
+
+
+def test_step_deadlines_nest_inside_the_chapter_scope():
+    """Parallel steps see the caller's deadline; a step that overruns fails the run"""
+    from llm.deadline import current_budget, deadline_scope
+
+    seen = {}
+
+    def record(name):
+        def reply(message):
+            seen[name] = current_budget().remaining()
+            return f"{name.upper()}: ok"
+        return reply
+
+    def hung(message):
+        time.sleep(0.05)
+        current_budget().check("It was a dark")
+        return "SCENE DRAFT: too late"
+
+    agents = {"planner": FakeAgent("planner", record("plan")), "setter": FakeAgent("setter", record("setting")),
+              "plotter": FakeAgent("plotter", record("plot")), "writer": FakeAgent("writer", hung)}
+    pipeline = ChapterPipeline(agents, _steps(), cancel_token=CancellationToken(),
+                               step_timeouts={"planner": 5, "writer": 0.01})
+    with deadline_scope(30, label="chapter 1"):
+        with pytest.raises(PipelineError, match="Step scene failed: Deadline exceeded for scene"):
+            pipeline.run("brief", {"context": "ctx"})
+
+    assert seen["plan"] <= 5
+    assert 5 < seen["setting"] <= 30 and 5 < seen["plot"] <= 30  # Inherited in worker threads
+
+
+def test_expired_chapter_deadline_stops_before_the_next_wave():
+    from llm.deadline import deadline_scope
+
+    agents = {name: FakeAgent(name) for name in ("planner", "setter", "plotter", "writer")}
+    agents["planner"].delay = 0.05
+    with deadline_scope(0.01):
+        with pytest.raises(PipelineError, match="Deadline exceeded before step setting"):
+            ChapterPipeline(agents, _steps(), cancel_token=CancellationToken()).run("brief", {"context": "ctx"})
+    assert agents["setter"].received == []
+
+
+def _chain_steps():
+    return [
+        PipelineStep("plan", "planner", "PLAN", "Plan it.", depends_on=("context",)),
+        PipelineStep("scene", "writer", "SCENE DRAFT", "Write it.", depends_on=("plan",), sectioned=True),
+        PipelineStep("feedback", "editor", "FEEDBACK", "Review it.", depends_on=("scene",), sectioned=True),
+        PipelineStep("scene_final", "reviser", "SCENE FINAL", "Revise it.",
+                     depends_on=("scene", "feedback"), sectioned=True),
+    ]
+
+
+def _section(message):
+    return message.split("This is section ")[1].split(" of")[0]
+
+
+def test_sectioned_chain_overlaps_draft_review_and_revision():
+    """The editor and reviser start on early sections while the writer drafts later ones"""
+    log = []
+    lock = threading.Lock()
+
+    def stage(name, tag):
+        def reply(message):
+            section = _section(message)
+            with lock:
+                log.append((name, section, "start"))
+            time.sleep(0.05)
+            with lock:
+                log.append((name, section, "end"))
+            return f"{tag}: {name} {section}"
+        return reply
+
+    agents = {"planner": FakeAgent("planner", "PLAN: p"),
+              "writer": FakeAgent("writer", stage("writer", "SCENE DRAFT")),
+              "editor": FakeAgent("editor", stage("editor", "FEEDBACK")),
+              "reviser": FakeAgent("reviser", stage("reviser", "SCENE FINAL"))}
+    run = ChapterPipeline(agents, _chain_steps(), cancel_token=CancellationToken(), sections=3).run(
+        "brief", {"context": "ctx"})
+
+    assert run.results["scene_final"].content == "SCENE FINAL:\nreviser 1\n\nreviser 2\n\nreviser 3"
+    assert [m["name"] for m in run.messages[1:]] == ["planner", "writer", "editor", "reviser"]
+    # The editor's second section sees only the second draft section, plus its own earlier feedback
+    assert "writer 2" in agents["editor"].received[1] and "writer 1" not in agents["editor"].received[1]
+    assert "YOUR FEEDBACK SO FAR ---\neditor 1" in agents["editor"].received[1]
+    assert log.index(("editor", "1", "start")) < log.index(("writer", "2", "end"))
+    assert run.concurrency_savings() > 0.1
+
+
+def test_sectioned_chain_failure_stops_downstream_steps():
+    def writer(message):
+        if _section(message) == "2":
+            raise RuntimeError("model overloaded")
+        return "SCENE DRAFT: part 1"
+
+    agents = {"planner": FakeAgent("planner", "PLAN: p"), "writer": FakeAgent("writer", writer),
+              "editor": FakeAgent("editor", "FEEDBACK: fine"), "reviser": FakeAgent("reviser", "SCENE FINAL: done")}
+    with pytest.raises(PipelineError, match="Step scene failed: model overloaded"):
+        ChapterPipeline(agents, _chain_steps(), cancel_token=CancellationToken(), sections=3).run(
+            "brief", {"context": "ctx"})
+    assert len(agents["editor"].received) <= 1
+
+
+def test_partly_checkpointed_chain_runs_step_by_step():
+    agents = {name: FakeAgent(name) for name in ("planner", "writer", "editor", "reviser")}
+    pipeline = ChapterPipeline(agents, _chain_steps(), cancel_token=CancellationToken(), sections=3)
+    assert pipeline.sectioned_chain(("scene",)) == []
+    run = pipeline.run("brief", {"context": "ctx"}, completed={"plan": "PLAN: p", "scene": "SCENE DRAFT: saved"})
+    assert len(agents["editor"].received) == 1 and "This is section" not in agents["editor"].received[0]
+    assert run.results["scene_final"].ok
+
+
+def test_failed_step_is_retried_from_completed_outputs(tmp_path, monkeypatch):
+    """A failing step is rerun with the earlier outputs reused; the planning steps are not repeated"""
+    from book_generator import BookGenerator
+    from chapter_pipeline import PipelineRun, StepResult
+
+    monkeypatch.chdir(tmp_path)
+    prose = _prose()
+    failures = iter([RuntimeError("upstream 503")])
+
+    def flaky_editor(message):
+        error = next(failures, None)
+        if error:
+            raise error
+        return "FEEDBACK: Approved."
+
+    replies = {
+        "memory_keeper": "MEMORY UPDATE: Nothing yet.",
+        "story_planner": "PLAN: Open on the pier.",
+        "setting_builder": "SETTING: A broken pier.",
+        "character_agent": "CHARACTER: Mara hesitates.",
+        "plot_agent": "PLOT: The tide turns.",
+        "writer": f"SCENE DRAFT: {prose}",
+        "editor": flaky_editor,
+        "writer_final": f"SCENE FINAL: {prose}",
+    }
+    agents = {name: FakeAgent(name, reply=reply) for name, reply in replies.items()}
+    agents["user_proxy"] = FakeAgent("user_proxy")
+    outline = [{"chapter_number": 1, "title": "The Pier", "prompt": "Key Events:\n- Arrival"}]
+
+    generator = BookGenerator(agents, {}, outline)
+    monkeypatch.setattr(generator, "_get_writer_final", lambda: agents["writer_final"])
+    generator.generate_chapter(1, outline[0]["prompt"])
+
+    assert len(agents["editor"].received) == 2
+    assert all(len(agents[name].received) == 1 for name in ("memory_keeper", "story_planner", "plot_agent",
+                                                            "writer", "writer_final"))
+    assert agents["user_proxy"].received == []  # The simplified retry was not needed
+    with open(os.path.join(generator.run.metrics_dir, "chapter_01.json"), encoding="utf-8") as f:
+        assert "scene" in json.load(f)["reused_steps"]
+    assert os.path.exists(generator.run.chapter_path(1))
+
+    # A rejected final text is redone, but nothing before it
+    finished = PipelineRun(results={name: StepResult(name, "agent", f"{name} text")
+                                    for name in ("plan", "scene", "feedback", "scene_final", "confirmation")})
+    assert set(generator._reusable_steps(finished)) == {"plan", "scene", "feedback"}
+    assert set(generator._reusable_steps(finished, "confirmation")) == {"plan", "scene", "feedback"}
+    assert set(generator._reusable_steps(finished, "feedback")) == set(finished.completed)
+
+
+def test_reasoning_traces_stay_out_of_the_transcript():
+    """A <think> block left in a reply is recorded on the step, not passed to the next agent"""
+    agents = {"planner": FakeAgent("planner", "<think>Start small.</think>\nPLAN: Open on the pier."),
+              "writer": FakeAgent("writer", "SCENE DRAFT: The tide rolled in.")}
+    steps = [PipelineStep("plan", "planner", "PLAN", "Plan it.", depends_on=("context",)),
+             PipelineStep("scene", "writer", "SCENE DRAFT", "Write it.", depends_on=("plan",))]
+    run = ChapterPipeline(agents, steps, max_continuations=0).run("brief", {"context": "ctx"})
+
+    assert run.results["plan"].content == "PLAN: Open on the pier."
+    assert run.results["plan"].reasoning == "Start small."
+    assert "think" not in agents["writer"].received[0] and "Start small" not in agents["writer"].received[0]
+    assert all("<think>" not in m["content"] for m in run.messages)
+
+
+def test_rejected_chapter_leaves_memory_untouched(tmp_path, monkeypatch):
+    """Summaries are recorded only once the chapter was saved, so a retry does not add a second one"""
+    from book_generator import BookGenerator
+
+    monkeypatch.chdir(tmp_path)
+    generator = BookGenerator({"user_proxy": FakeAgent("user_proxy")}, {}, [])
+    memory = {"role": "assistant", "name": "memory_keeper", "content": "MEMORY UPDATE: Mara reaches the pier."}
+
+    with pytest.raises(ValueError, match="too short"):
+        generator._process_chapter_results(1, [memory, {"role": "assistant", "name": "writer_final",
+                                                        "content": "SCENE FINAL: The tide rolled in."}])
+    assert generator.chapters_memory == []
+
+    generator._process_chapter_results(1, [memory, {"role": "assistant", "name": "writer_final",
+                                                    "content": f"SCENE FINAL: {_prose()}"}])
+    assert generator.chapters_memory == ["Mara reaches the pier."]
+
+
+def test_incomplete_retry_is_rejected(tmp_path, monkeypatch):
+    """The simplified retry must pass the completion policy before its chapter is saved"""
+    from book_generator import BookGenerator
+
+    monkeypatch.chdir(tmp_path)
+    agents = {"user_proxy": FakeAgent("user_proxy"),
+              "story_planner": FakeAgent("story_planner", "PLAN: Open on the pier."),
+              "writer": FakeAgent("writer", "PLAN: Still planning.")}
+    generator = BookGenerator(agents, {}, [])
+
+    with pytest.raises(ValueError, match="Chapter 1 generation incomplete"):
+        generator._handle_chapter_generation_failure(1, "Key Events:\n- Arrival")
+    assert not os.path.exists(generator.run.chapter_path(1))
+
+
+def test_stopped_book_keeps_its_checkpoint(tmp_path, monkeypatch):
+    """A book that stops before its last chapter keeps the checkpoint for resume"""
+    from book_generator import BookGenerator
+    from run_store import RunDirectory
+
+    outline = [{"chapter_number": 1, "title": "The Pier", "prompt": "Key Events:\n- Arrival"}]
+    run = RunDirectory.create(str(tmp_path))
+    run.write_checkpoint({"chapter_number": 1, "completed_steps": {"plan": "PLAN: Open on the pier."}})
+    generator = BookGenerator({}, {}, outline, run=run)
+    monkeypatch.setattr(generator, "generate_chapter", lambda chapter_number, prompt: None)  # Saves nothing
+
+    generator.generate_book(outline, resume=True)
+    assert run.read_checkpoint()["chapter_number"] == 1
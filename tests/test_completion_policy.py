@@ -0,0 +1,42 @@
+"""Tests for the chapter completion policy"""
+from completion_policy import DEFAULT_POLICY, ArtifactRule, CompletionPolicy
+
+PROSE = " ".join(["The tide rolled in over the broken pier."] * 20)
+
+
+def _transcript(*messages):
+    return [{"role": "user", "name": "user_proxy", "content": "Chapter 3: The Pier\nFocus ONLY on this chapter."}] + [
+        {"role": "assistant", "name": name, "content": content} for name, content in messages]
+
+
+def test_optional_tags_do_not_fail_a_chapter():
+    """A transcript with only the final scene passes; skipped optional steps are reported"""
+    report = DEFAULT_POLICY.evaluate(_transcript(("writer", f"SCENE FINAL: {PROSE}")), chapter_number=3)
+    assert report.passed
+    assert report.final_words == 160
+    assert "plan" in report.missing_optional and "confirmation" in report.missing_optional
+    assert report.summary().startswith("complete (160 words; optional not found: memory_update, plan")
+
+
+def test_failures_explain_themselves():
+    report = DEFAULT_POLICY.evaluate(_transcript(("writer", "PLAN: Open on the pier."),
+                                                 ("editor", "SCENE FINAL: quoting the draft")), chapter_number=4)
+    assert not report.passed
+    assert report.problems == ["header names chapter 3, expected 4", "missing required scene_final"]
+
+    short = DEFAULT_POLICY.evaluate(_transcript(("writer_final", "SCENE FINAL: Too short.")))
+    assert short.summary() == "scene_final has 2 words, fewer than 100"
+    assert short.chapter_number == 3
+
+    headless = DEFAULT_POLICY.evaluate([{"name": "writer", "content": f"SCENE FINAL: {PROSE}"}])
+    assert headless.problems == ["no 'Chapter N:' header in the transcript"]
+
+
+def test_custom_policy_can_require_more():
+    policy = CompletionPolicy(artifacts=(ArtifactRule("feedback", ("FEEDBACK:",), required=True),
+                                         ArtifactRule("scene_final", ("SCENE FINAL:",), required=True)),
+                              min_words=10, require_chapter_header=False)
+    messages = [{"name": "writer", "content": "SCENE FINAL: " + "word " * 12}]
+    assert policy.evaluate(messages).problems == ["missing required feedback"]
+    assert policy.final_text(messages) == ("word " * 12).strip()
+    assert policy.evaluate(messages + [{"name": "editor", "content": "FEEDBACK: fine"}]).to_dict()["passed"]
@@ -0,0 +1,87 @@
+"""Tests for length-driven continuation"""
+import pytest
+
+from chapter_pipeline import ChapterPipeline, PipelineStep
+from continuation import append_continuation, continuation_message, continue_reply
+from llm.cancellation import CancellationToken, GenerationCancelled
+from llm.finish_reason import clear_finish_reason, record_finish_reason
+
+
+class TruncatingAgent:
+    """Agent stub that returns scripted (text, finish_reason) pairs and records them like a client"""
+
+    def __init__(self, name, replies):
+        self.name = name
+        self.replies = list(replies)
+        self.received = []
+
+    def generate_reply(self, messages=None, **kwargs):
+        self.received.append(messages[-1]["content"])
+        text, finish_reason = self.replies.pop(0)
+        if isinstance(text, Exception):
+            raise text
+        record_finish_reason(finish_reason)
+        return text
+
+
+@pytest.fixture(autouse=True)
+def fresh_finish_reason():
+    clear_finish_reason()
+    yield
+    clear_finish_reason()
+
+
+def test_append_continuation_joins_without_duplicating():
+    text = "SCENE DRAFT: The rain had not stopped for three days and the harbour"
+    assert append_continuation(text, "SCENE DRAFT: lights flickered.", "SCENE DRAFT") == \
+        text + " lights flickered."
+    restated = "stopped for three days and the harbour lights flickered."
+    assert append_continuation(text, restated, "SCENE DRAFT") == text + " lights flickered."
+    assert append_continuation("She left.", "Morning came.", "SCENE DRAFT") == "She left.\n\nMorning came."
+    assert append_continuation("She left.", "   ", "SCENE DRAFT") == "She left."
+
+
+def test_continuation_message_sends_only_the_tail():
+    text = "SCENE DRAFT: " + " ".join(f"w{i}" for i in range(1000))
+    message = continuation_message("Chapter 1: The Pier", "SCENE DRAFT", text, min_words=1500, tail_words=50)
+    assert message.startswith("Chapter 1: The Pier")
+    assert "w949" not in message and "...w950" in message and "w999" in message
+    assert "Write at least 500 more words." in message
+
+
+def test_truncated_reply_is_continued_until_it_finishes():
+    agent = TruncatingAgent("writer", [("The storm", "length"), ("broke at dawn", "length"), ("over the pier.", "stop")])
+    agent.generate_reply(messages=[{"content": "write"}])
+    text, calls = continue_reply(agent, "brief", "SCENE DRAFT", "SCENE DRAFT: The storm")
+    assert (text, calls) == ("SCENE DRAFT: The storm broke at dawn over the pier.", 2)
+    assert all("--- END OF YOUR SCENE DRAFT SO FAR ---" in m for m in agent.received[1:])
+
+
+def test_continuation_stops_at_the_limit_or_when_nothing_is_added():
+    agent = TruncatingAgent("writer", [("more", "length")] * 5)
+    record_finish_reason("length")
+    assert continue_reply(agent, "brief", "PLAN", "PLAN: a", max_continuations=2)[1] == 2
+    record_finish_reason("length")
+    stalled = TruncatingAgent("writer", [("", "stop")])
+    assert continue_reply(stalled, "brief", "PLAN", "PLAN: a") == ("PLAN: a", 1)
+
+
+def test_cancelled_continuation_keeps_the_text_written_so_far():
+    agent = TruncatingAgent("writer", [(GenerationCancelled("SIGTERM", partial="broke at"), None)])
+    record_finish_reason("length")
+    with pytest.raises(GenerationCancelled) as excinfo:
+        continue_reply(agent, "brief", "SCENE DRAFT", "SCENE DRAFT: The storm")
+    assert excinfo.value.partial == "SCENE DRAFT: The storm broke at"
+
+
+def test_pipeline_extends_short_drafts_to_min_words():
+    short = " ".join(["word"] * 40)
+    writer = TruncatingAgent("writer", [(f"SCENE DRAFT: {short}.", "stop"), (f"{short} more.", "stop"),
+                                        (f"{short} end.", "stop")])
+    steps = [PipelineStep("scene", "writer", "SCENE DRAFT", "Write it.", depends_on=("context",), min_words=100)]
+    run = ChapterPipeline({"writer": writer}, steps, cancel_token=CancellationToken()).run("brief", {"context": "ctx"})
+
+    result = run.results["scene"]
+    assert result.continuations == 2
+    assert len(result.content.split()) > 120
+    assert [m["name"] for m in run.messages] == ["user_proxy", "writer"]  # One message for the whole draft
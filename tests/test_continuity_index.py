@@ -0,0 +1,96 @@
+"""Unit tests for the continuity retrieval index"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from continuity_index import ContinuityIndex, HashingVectorizer
+
+
+class TestHashingVectorizer(unittest.TestCase):
+    """Test cases for the hashing vectorizer"""
+
+    def test_rows_are_normalised(self):
+        """Non-empty texts embed to unit vectors, empty text to zeros"""
+        vectors = HashingVectorizer(n_features=256).transform(["the old lighthouse", ""])
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        self.assertEqual(float(np.abs(vectors[1]).sum()), 0.0)
+
+    def test_deterministic(self):
+        """The same text always embeds to the same vector"""
+        vectorizer = HashingVectorizer(n_features=256)
+        first = vectorizer.transform(["Mara opened the sealed archive"])
+        second = vectorizer.transform(["Mara opened the sealed archive"])
+        np.testing.assert_array_equal(first, second)
+
+
+class TestContinuityIndex(unittest.TestCase):
+    """Test cases for ContinuityIndex"""
+
+    def setUp(self):
+        """Set up a temporary index directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = ContinuityIndex(self.tmpdir.name, chunk_words=20, chunk_overlap=5)
+        self.index.add_chapter(1, "Mara found a brass key hidden beneath the lighthouse stairs.\n\n"
+                                  "The storm tore the roof from the harbor master's office.")
+        self.index.add_chapter(2, "In the city, the council voted to ration water for the winter.")
+
+    def tearDown(self):
+        """Clean up the temporary directory"""
+        self.tmpdir.cleanup()
+
+    def test_search_returns_relevant_passage(self):
+        """The best match shares vocabulary with the query"""
+        results = self.index.search("Mara uses the brass key", top_k=1)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["chapter_number"], 1)
+        self.assertIn("brass key", results[0]["text"])
+
+    def test_search_respects_before_chapter(self):
+        """Passages from the current or later chapters are excluded"""
+        results = self.index.search("council water ration", top_k=5, before_chapter=2)
+        self.assertTrue(all(r["chapter_number"] < 2 for r in results))
+
+    def test_reindexing_replaces_chapter(self):
+        """Re-saving a chapter drops its previous passages"""
+        self.index.add_chapter(2, "A completely rewritten second chapter about ships.")
+        texts = [c["text"] for c in self.index.chunks if c["chapter_number"] == 2]
+        self.assertEqual(texts, ["A completely rewritten second chapter about ships."])
+        self.assertEqual(len(self.index), len(self.index.chunks))
+
+    def test_index_persists(self):
+        """A new instance loads the saved vectors and passages"""
+        reloaded = ContinuityIndex(self.tmpdir.name, chunk_words=20, chunk_overlap=5)
+        self.assertEqual(reloaded.chunks, self.index.chunks)
+        self.assertEqual(reloaded.search("Mara uses the brass key"), self.index.search("Mara uses the brass key"))
+
+    def test_adding_a_chapter_leaves_earlier_chapters_untouched(self):
+        """Each chapter has its own sparse vectors file; indexing one never rewrites another"""
+        first_file = os.path.join(self.tmpdir.name, "chapter_01.npz")
+        os.utime(first_file, (1_000_000_000, 1_000_000_000))
+        self.index.add_chapter(3, "The ferry left the harbor at dawn.")
+        self.assertEqual(os.stat(first_file).st_mtime, 1_000_000_000)
+        with np.load(first_file) as vectors:
+            self.assertEqual(vectors["cols"].size, vectors["offsets"][-1])
+            self.assertLess(vectors["cols"].size, 100)  # Non-zero entries only, not 2**14 per passage
+
+    def test_sparse_rows_match_dense_embedding(self):
+        """transform_sparse holds exactly the non-zero entries of transform"""
+        vectorizer = HashingVectorizer(n_features=256)
+        text = "the keeper and the keeper's brother rowed out"
+        cols, values = vectorizer.transform_sparse(text)
+        dense = vectorizer.transform([text])[0]
+        np.testing.assert_array_equal(np.flatnonzero(dense), cols)
+        np.testing.assert_allclose(dense[cols], values)
+
+    def test_chunking_splits_long_paragraphs(self):
+        """Long paragraphs are split into overlapping windows"""
+        words = " ".join(f"w{i}" for i in range(50))
+        chunks = self.index.chunk_text(words)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(c.split()) <= 20 for c in chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Tests for the SQLite job queue and worker pool"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from job_queue import CANCELLED, COMPLETED, FAILED, QUEUED, RUNNING, JobQueue, WorkerPool
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def _command(code):
+    """A worker command that ignores main.py's arguments"""
+    return [sys.executable, "-c", code]
+
+
+def test_claims_follow_priority_then_submission_order(queue):
+    low = queue.submit("low", "fantasy")
+    high = queue.submit("high", "fantasy", priority=5)
+    second_low = queue.submit("low again", "fantasy")
+
+    assert [queue.claim_next().id for _ in range(3)] == [high.id, low.id, second_low.id]
+    assert queue.claim_next() is None
+    assert queue.get(high.id).status == RUNNING
+    assert len({job.run_id for job in queue.list_jobs()}) == 3
+
+
+def test_concurrent_claims_never_share_a_job(queue):
+    for i in range(20):
+        queue.submit(f"book {i}", "fantasy")
+    claimed, lock = [], threading.Lock()
+
+    def claim():
+        while (job := queue.claim_next()) is not None:
+            with lock:
+                claimed.append(job.id)
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == list(range(1, 21))
+
+
+def test_cancel_queued_and_running(queue):
+    queued = queue.submit("a", "fantasy")
+    running = queue.submit("b", "fantasy", priority=1)
+    queue.claim_next()
+
+    assert queue.cancel(queued.id)
+    assert queue.get(queued.id).status == CANCELLED
+    assert queue.cancel(running.id)
+    assert queue.get(running.id).status == RUNNING  # The worker stops it
+    assert queue.cancel_requested(running.id)
+    assert not queue.cancel(queued.id)  # Already finished
+    assert not queue.cancel(999)
+
+
+def test_only_one_service_owns_a_queue(queue):
+    assert queue.claim_service(1)
+    assert queue.service_alive()
+    assert not queue.claim_service(2)
+    assert queue.claim_service(2, stale_after=0)  # Heartbeat too old
+    queue.release_service(2)
+    assert not queue.service_alive()
+
+
+def test_pool_limits_concurrency_and_records_results(queue):
+    pool = WorkerPool(queue, workers=2, command=_command(
+        "import sys, time; time.sleep(0.3); sys.exit(3 if 'fail' in sys.argv else 0)"))
+    jobs = [queue.submit(prompt, "fantasy") for prompt in ("one", "fail", "three")]
+
+    assert pool.poll_once() == 2
+    assert queue.get(jobs[2].id).status == QUEUED
+    deadline = time.time() + 10
+    while (pool.poll_once() or queue.counts().get(QUEUED)) and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert [queue.get(job.id).status for job in jobs] == [COMPLETED, FAILED, COMPLETED]
+    assert queue.get(jobs[1].id).returncode == 3
+    assert os.path.exists(os.path.join(pool.log_dir, f"job_{jobs[0].id}.log"))
+
+
+def test_pool_stops_cancelled_jobs_and_splits_rate_limit(queue):
+    pool = WorkerPool(queue, workers=2, requests_per_minute=60, command=_command(
+        "import os, sys, time; print(os.environ['GEN_REQUESTS_PER_MINUTE'], sys.argv[1:], flush=True); time.sleep(30)"))
+    job = queue.submit("long", "fantasy", model="ollama/llama3")
+    pool.poll_once()
+    time.sleep(0.5)
+    queue.cancel(job.id)
+    deadline = time.time() + 5
+    while pool.poll_once() and time.time() < deadline:  # SIGTERM, then reap once it exits
+        time.sleep(0.05)
+
+    assert queue.get(job.id).status == CANCELLED
+    with open(os.path.join(pool.log_dir, f"job_{job.id}.log")) as f:
+        output = f.read()
+    assert output.startswith("30.0")
+    assert f"'--run-id', '{job.run_id}'" in output
+
+
+def test_serve_marks_interrupted_jobs_and_shuts_down(queue):
+    stale = queue.submit("left running by a crashed service", "fantasy")
+    queue.claim_next()
+    pool = WorkerPool(queue, workers=1, poll_interval=0.05, command=_command("import time; time.sleep(30)"))
+    job = queue.submit("next", "fantasy")
+    stop = threading.Event()
+    thread = threading.Thread(target=pool.serve, args=(stop,))
+    thread.start()
+    deadline = time.time() + 5
+    while queue.get(job.id).status != RUNNING and time.time() < deadline:
+        time.sleep(0.05)
+    stop.set()
+    thread.join(timeout=15)
+
+    assert queue.get(stale.id).status == FAILED
+    assert queue.get(job.id).status == CANCELLED
+    assert not queue.service_alive()
+
+
+def test_serve_stops_orphaned_jobs_before_failing_them(queue):
+    """A job process that outlived its worker service is stopped, not left running beside a new one"""
+    import signal
+    import subprocess
+
+    orphan = subprocess.Popen(_command("import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+                                       "print('ready', flush=True); time.sleep(30)"),
+                              stdout=subprocess.PIPE, start_new_session=True)
+    assert orphan.stdout.readline().strip() == b"ready"
+    reaper = threading.Thread(target=orphan.wait)  # Stands in for init, which reaps real orphans
+    reaper.start()
+    job = queue.submit("left running by a crashed service", "fantasy")
+    queue.claim_next()
+    queue.set_pid(job.id, orphan.pid)
+
+    stop = threading.Event()
+    stop.set()
+    WorkerPool(queue, workers=1, stop_grace=0.3, command=_command("pass")).serve(stop)
+    reaper.join(timeout=10)
+
+    assert orphan.returncode == -signal.SIGKILL
+    assert queue.get(job.id).status == FAILED
+
+
+def test_pool_kills_jobs_that_ignore_sigterm_after_grace(queue):
+    pool = WorkerPool(queue, workers=1, stop_grace=0.3, command=_command(
+        "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('ready', flush=True); time.sleep(30)"))
+    job = queue.submit("stubborn", "fantasy")
+    pool.poll_once()
+    log_path = os.path.join(pool.log_dir, f"job_{job.id}.log")
+    deadline = time.time() + 5
+    while "ready" not in open(log_path).read() and time.time() < deadline:
+        time.sleep(0.05)
+    queue.cancel(job.id)
+
+    pool.poll_once()
+    time.sleep(0.2)
+    assert pool.poll_once() == 1  # Still within the grace period
+    deadline = time.time() + 5
+    while pool.poll_once() and time.time() < deadline:
+        time.sleep(0.05)
+    assert queue.get(job.id).status == CANCELLED
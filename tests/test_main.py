@@ -0,0 +1,42 @@
+"""Startup tests for the main.py command line entry point"""
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(args, env_overrides=None, remove=()):
+    env = {k: v for k, v in os.environ.items() if k not in remove}
+    env.update(env_overrides or {})
+    return subprocess.run([sys.executable, *args], cwd=REPO_ROOT, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+
+def test_importing_main_skips_heavy_modules():
+    """Importing main loads neither autogen nor litellm nor the generator modules"""
+    code = ("import sys, main; "
+            "print(sorted(m for m in ('autogen', 'litellm', 'agents', 'book_generator') if m in sys.modules))")
+    result = _run(["-c", code])
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_help():
+    """--help exits cleanly and lists the startup profiling flag"""
+    result = _run(["main.py", "--help"])
+    assert result.returncode == 0
+    assert "--import-time" in result.stdout
+
+
+def test_config_errors_are_reported_before_heavy_imports():
+    """A missing genre or invalid configuration exits with status 2 and a short message"""
+    result = _run(["main.py"], remove=("BOOK_GENRE",))
+    assert result.returncode == 2
+    assert "No genre selected" in result.stderr
+
+    result = _run(["main.py"], env_overrides={"BOOK_GENRE": "fantasy", "LLM__MODEL": "openai/gpt-4"},
+                           remove=("OPENAI_API_KEY", "LLM__OPENAI_API_KEY"))
+    assert result.returncode == 2
+    assert result.stderr.startswith("Configuration error:")
+    assert "Traceback" not in result.stderr
@@ -0,0 +1,334 @@
+"""Tests and fuzzing for the line-oriented outline parser"""
+import glob
+import os
+import random
+import re
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from outline_parser import EXACT, MISSING, TOLERATED, OutlineStreamParser, parse_outline
+from outline_generator import OutlineGenerator
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "outlines")
+FIXTURES = sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.txt")))
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_fixture_outlines_parse_completely(path):
+    """Every recorded LLM output variant yields three complete chapters"""
+    chapters = parse_outline(_read(path))
+    assert [c.chapter_number for c in chapters] == [1, 2, 3]
+    for chapter in chapters:
+        assert chapter.is_complete, chapter.missing_fields
+        assert len(chapter.key_events) == 3
+        assert chapter.title and chapter.tone
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_generator_accepts_fixture_outlines(path):
+    """OutlineGenerator processes the variants without falling back to emergency parsing"""
+    generator = OutlineGenerator({}, {})
+    outline = generator._process_outline_results([{"content": _read(path)}], 3)
+    assert len(outline) == 3
+    assert outline[0]["prompt"].startswith("Key Events:\n- ")
+
+
+def test_confidence_reflects_formatting():
+    """Canonical labels score EXACT, decorated labels TOLERATED, absent fields MISSING"""
+    canonical = parse_outline(_read(os.path.join(FIXTURE_DIR, "canonical.txt")))[0]
+    assert set(canonical.confidence.values()) == {EXACT}
+
+    bold = parse_outline(_read(os.path.join(FIXTURE_DIR, "markdown_bold.txt")))[0]
+    assert bold.confidence["setting"] == TOLERATED
+
+    partial = parse_outline("Chapter 1: Alone\nKey Events:\n- One\n- Two\n")[0]
+    assert partial.confidence["tone"] == MISSING
+    assert partial.confidence["key_events"] < EXACT
+    assert "Tone" in partial.missing_fields
+    assert "Key Events" in partial.missing_fields
+
+
+def test_multiline_values_are_joined():
+    """Continuation lines are appended to the field they follow"""
+    chapter = parse_outline(_read(os.path.join(FIXTURE_DIR, "markdown_bold.txt")))[0]
+    assert chapter.character_developments == (
+        "Ada is introduced as a loyal systems auditor who has never questioned Meridian."
+    )
+
+
+def test_stops_at_end_marker():
+    """Text after END OF OUTLINE is ignored"""
+    text = _read(os.path.join(FIXTURE_DIR, "canonical.txt")) + "\nChapter 4: Stray\nTitle: Stray\n"
+    assert len(parse_outline(text)) == 3
+
+
+def _decorate(line, rng):
+    """Apply one of the formatting deviations seen in model output"""
+    label, sep, rest = line.partition(":")
+    if not sep or label.startswith("- "):
+        if line.startswith("- "):
+            return rng.choice(["- ", "* ", "• ", "+ ", "1. "]) + line[2:]
+        return line
+    style = rng.randrange(5)
+    if style == 0:
+        return f"**{label}:**{rest}"
+    if style == 1:
+        return f"**{label}**:{rest}"
+    if style == 2:
+        return f"- {label}:{rest}"
+    if style == 3:
+        return f"  {label.lower()}:{rest}  "
+    return line
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_fuzzed_formatting_recovers_same_fields(seed):
+    """Randomly decorated copies of a canonical outline parse to the same content"""
+    rng = random.Random(seed)
+    source = _read(os.path.join(FIXTURE_DIR, "canonical.txt"))
+    expected = parse_outline(source)
+
+    fuzzed = "\n".join(_decorate(line, rng) for line in source.splitlines())
+    if seed % 3 == 0:
+        fuzzed = fuzzed.replace("\n", "\r\n")
+    actual = parse_outline(fuzzed)
+
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got.title == want.title
+        assert got.key_events == want.key_events
+        assert got.character_developments == want.character_developments
+        assert got.setting == want.setting
+        assert got.tone == want.tone
+
+
+def test_pathological_input_is_linear():
+    """Inputs that made the old lookahead regexes backtrack parse quickly"""
+    text = "Chapter 1: X\nKey Events:\n" + "-" + " a" * 200000 + "\n" + "Setting: y\n" * 20000
+    start = time.perf_counter()
+    parse_outline(text)
+    assert time.perf_counter() - start < 2.0
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 4096])
+def test_stream_parser_matches_batch_parse(chunk_size):
+    """Feeding any chunking of the text emits the same chapters as a full parse"""
+    text = _read(os.path.join(FIXTURE_DIR, "markdown_bold.txt"))
+    stream = OutlineStreamParser()
+    emitted = []
+    for i in range(0, len(text), chunk_size):
+        emitted.extend(stream.feed(text[i:i + chunk_size]))
+    emitted.extend(stream.close())
+
+    expected = parse_outline(text)
+    assert [position for position, _ in emitted] == [1, 2, 3]
+    assert [c.key_events for _, c in emitted] == [c.key_events for c in expected]
+    assert stream.text == text
+
+
+def test_stream_parser_emits_when_next_chapter_starts():
+    """A chapter is emitted once the next chapter header arrives, with its multi-line Tone whole"""
+    text = _read(os.path.join(FIXTURE_DIR, "canonical.txt"))
+    text = text.replace("quietly ominous.\n", "quietly ominous.\nA hum under every scene.\n", 1)
+    cut = text.index("Chapter 2:")
+
+    stream = OutlineStreamParser()
+    assert stream.feed(text[:cut]) == []
+    emitted = stream.feed(text[cut:text.index("\n", cut) + 1])
+    assert [(position, c.title) for position, c in emitted] == [(1, "The Quiet Grid")]
+    assert emitted[0][1].tone == "Uneasy calm, sterile and quietly ominous. A hum under every scene."
+
+
+def test_stream_parser_positions_repeated_chapters():
+    """Identical chapters each get their own position"""
+    text = _read(os.path.join(FIXTURE_DIR, "canonical.txt"))
+    first = text[text.index("Chapter 1:"):text.index("Chapter 2:")]
+    stream = OutlineStreamParser()
+    emitted = stream.feed(first * 3) + stream.close()
+    assert [position for position, _ in emitted] == [1, 2, 3]
+
+
+def test_generate_outline_reports_chapters_while_streaming():
+    """generate_outline invokes on_chapter for each chapter as the stream progresses"""
+    text = _read(os.path.join(FIXTURE_DIR, "canonical.txt"))
+    chunks = [text[i:i + 50] for i in range(0, len(text), 50)]
+    llm = MagicMock()
+    llm.stream.return_value = iter(chunks)
+    received = []
+    generator = OutlineGenerator({}, {"cache_enabled": False}, llm=llm, on_stream_chunk=None)
+    outline = generator.generate_outline("premise", 3, on_chapter=received.append)
+
+    assert [c["chapter_number"] for c in received] == [1, 2, 3]
+    assert received == outline
+
+
+def test_outline_completions_are_cached_per_model():
+    """Identical prompts to the same outline model are served from the cache once they parsed fully"""
+    text = _read(os.path.join(FIXTURE_DIR, "canonical.txt"))
+    llm = MagicMock()
+    llm.stream.side_effect = lambda prompt: iter([text])
+    config = {"model": "ollama/test-outline-cache", "cache_enabled": True}
+
+    first = OutlineGenerator({}, config, llm=llm, on_stream_chunk=None).generate_outline("premise", 3)
+    second = OutlineGenerator({}, config, llm=llm, on_stream_chunk=None).generate_outline("premise", 3)
+    other_model = {"model": "ollama/other-outline-model", "cache_enabled": True}
+    OutlineGenerator({}, other_model, llm=llm, on_stream_chunk=None).generate_outline("premise", 3)
+
+    assert first == second
+    assert llm.stream.call_count == 2
+
+
+def test_outline_cache_skips_short_completions_and_is_bounded():
+    """A range that came back short is asked again on retry; old entries are evicted"""
+    def stream(prompt):
+        first, last = map(int, re.search(r"outlining chapters (\d+) to (\d+)", prompt).groups())
+        short = llm.stream.call_count == 1  # The first answer is missing its last chapter
+        yield "".join(_fake_chapter(n) for n in range(first, last if short else last + 1))
+
+    llm = MagicMock()
+    llm.stream.side_effect = stream
+    generator = OutlineGenerator({}, {"model": "ollama/test-outline-retry", "cache_enabled": True}, llm=llm)
+    generator.cache_size = 2
+
+    assert len(generator._expand_chapter_range("premise", 20, "", 1, 3, "")) == 2
+    assert len(generator._expand_chapter_range("premise", 20, "", 1, 3, "")) == 3
+    assert len(generator._expand_chapter_range("premise", 20, "", 1, 3, "")) == 3
+    assert llm.stream.call_count == 2
+
+    for first in (4, 7):
+        generator._expand_chapter_range("premise", 20, "", first, first + 2, "")
+    assert len(OutlineGenerator._completion_cache) == 2
+    generator._expand_chapter_range("premise", 20, "", 1, 3, "")
+    assert llm.stream.call_count == 5
+
+
+def test_outline_llm_built_from_agent_config():
+    """The outline client comes from LLMFactory with the outline config, not a hardcoded model"""
+    config = {"model": "ollama/llama2", "base_url": "http://outline-host:11434", "timeout": 30, "cache_enabled": False}
+    with patch("outline_generator.LLMFactory.create_llm") as create_llm:
+        OutlineGenerator({}, config)._get_llm()
+    create_llm.assert_called_once_with({"model": "ollama/llama2", "base_url": "http://outline-host:11434", "timeout": 30})
+
+
+def test_outline_llm_is_built_by_the_real_factory():
+    """_get_llm returns a working client for each provider; bad config raises instead of exiting"""
+    from llm.litellm_implementations import DeepSeekImplementation, GroqImplementation, OllamaImplementation
+
+    ollama = OutlineGenerator({}, {"model": "ollama/deepseek-r1:14b", "api_key": None, "base_url": None,
+                                   "ollama_base_url": "http://outline-host:11434", "timeout": 30,
+                                   "max_tokens": 8000, "cache_enabled": True})._get_llm()
+    assert isinstance(ollama, OllamaImplementation)
+    assert (ollama.model, ollama.base_url, ollama.timeout) == ("ollama/deepseek-r1:14b", "http://outline-host:11434", 30)
+
+    deepseek = OutlineGenerator({}, {"model": "deepseek-chat", "api_key": "sk-" + "d" * 30,
+                                     "base_url": None})._get_llm()
+    assert isinstance(deepseek, DeepSeekImplementation)
+    assert (deepseek.model, deepseek.base_url) == ("deepseek/deepseek-chat", "https://api.deepseek.com")
+
+    groq = OutlineGenerator({}, {"model": "groq/llama2-70b-4096", "api_key": "gsk_" + "g" * 30})._get_llm()
+    assert isinstance(groq, GroqImplementation)
+
+    with pytest.raises(ValueError, match="Missing API key"):
+        OutlineGenerator({}, {"model": "groq/llama2-70b-4096", "api_key": None})._get_llm()
+    with pytest.raises(ValueError, match="not supported"):
+        OutlineGenerator({}, {"model": "unknown-model"})._get_llm()
+
+
+def _fake_chapter(number):
+    return (f"Chapter {number}: Part {number}\nTitle: Part {number}\nKey Events:\n- A{number}\n- B{number}\n- C{number}\n"
+            f"Character Developments: Growth {number}\nSetting: Place {number}\nTone: Mood {number}\n\n")
+
+
+def _fake_stream(acts_text):
+    """Answer act-plan prompts with acts_text and range prompts with the requested chapters"""
+    def stream(prompt):
+        match = re.search(r"outlining chapters (\d+) to (\d+)", prompt)
+        if not match:
+            yield acts_text
+            return
+        first, last = int(match.group(1)), int(match.group(2))
+        yield "".join(_fake_chapter(n) for n in range(first, last + 1)) + "END OF OUTLINE"
+    return stream
+
+
+def test_hierarchical_outline_stitches_ranges():
+    """Large outlines are expanded in bounded ranges and stitched in order"""
+    acts = "Act 1: Setup\nChapters: 1-9\nBeats:\n- Inciting incident\nAct 2: Fall\nChapters: 10-20\nBeats:\n- Collapse\nEND OF ACTS"
+    generator = OutlineGenerator({}, {})
+    received = []
+    with patch.object(OutlineGenerator, "_stream_completion", side_effect=_fake_stream(acts), autospec=False):
+        outline = generator.generate_outline("premise", 20, on_chapter=received.append)
+
+    assert [c["chapter_number"] for c in outline] == list(range(1, 21))
+    assert outline[19]["title"] == "Part 20"
+    assert sorted(c["chapter_number"] for c in received) == list(range(1, 21))
+    assert generator._plan_chapter_ranges(generator._parse_acts(acts, 20), 20) == [
+        (1, 8, "Act 1: Setup\n- Inciting incident"),
+        (9, 9, "Act 1: Setup\n- Inciting incident"),
+        (10, 17, "Act 2: Fall\n- Collapse"),
+        (18, 20, "Act 2: Fall\n- Collapse"),
+    ]
+
+
+def test_hierarchical_outline_falls_back_to_even_ranges():
+    """An act plan with gaps is ignored in favour of even chapter ranges"""
+    generator = OutlineGenerator({}, {})
+    assert generator._parse_acts("Act 1: Only\nChapters: 1-5\n", 20) == []
+    with patch.object(OutlineGenerator, "_stream_completion", side_effect=_fake_stream("Act 1: Only\nChapters: 1-5\n")):
+        outline = generator.generate_outline("premise", 16)
+    assert [c["chapter_number"] for c in outline] == list(range(1, 17))
+
+
+def test_hierarchical_retry_only_adds_missing_chapters():
+    """A retried range reports and merges only the chapters the first attempt lacked"""
+    calls = []
+
+    def stream(prompt):
+        match = re.search(r"outlining chapters (\d+) to (\d+)", prompt)
+        if not match:
+            yield "Act 1: All\nChapters: 1-16\nEND OF ACTS"
+            return
+        first, last = int(match.group(1)), int(match.group(2))
+        calls.append(first)
+        retry = calls.count(first) > 1
+        numbers = range(first, last + 1) if retry or first != 1 else range(first, last)  # Chapter 8 missing at first
+        yield "".join(_fake_chapter(n).replace("Part", "Retry" if retry else "Part") for n in numbers)
+
+    received = []
+    with patch.object(OutlineGenerator, "_stream_completion", side_effect=stream):
+        outline = OutlineGenerator({}, {}).generate_outline("premise", 16, on_chapter=received.append)
+
+    assert sorted(c["chapter_number"] for c in received) == list(range(1, 17))
+    assert [c["title"] for c in outline[:8]] == [f"Part {n}" for n in range(1, 8)] + ["Retry 8"]
+    assert received[-1]["title"] == "Retry 8"
+
+
+@pytest.mark.parametrize("num_chapters", [5, 20])
+def test_cancellation_is_not_turned_into_a_placeholder_outline(num_chapters):
+    """A cancelled or timed-out stream propagates instead of returning the emergency outline"""
+    from llm.cancellation import GenerationCancelled
+    from llm.deadline import DeadlineExceeded
+
+    def cancelled(prompt):
+        if "outlining chapters" in prompt or num_chapters <= 12:
+            raise GenerationCancelled("SIGTERM", partial="Chapter 1: Hal")
+        yield "Act 1: All\nChapters: 1-20\nEND OF ACTS"
+
+    with patch.object(OutlineGenerator, "_stream_completion", side_effect=cancelled):
+        with pytest.raises(GenerationCancelled):
+            OutlineGenerator({}, {}, on_stream_chunk=None).generate_outline("premise", num_chapters)
+
+    def timed_out(prompt):
+        raise DeadlineExceeded("outline", partial="")
+        yield
+
+    with patch.object(OutlineGenerator, "_stream_completion", side_effect=timed_out):
+        with pytest.raises(DeadlineExceeded):
+            OutlineGenerator({}, {}, on_stream_chunk=None).generate_outline("premise", num_chapters)
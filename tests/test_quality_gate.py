@@ -0,0 +1,80 @@
+"""Tests for the local draft quality gate"""
+import pytest
+
+from chapter_pipeline import ChapterPipeline, PipelineStep
+from llm.cancellation import CancellationToken
+from quality_gate import DraftMetrics, QualityGate, dialogue_ratio, leaked_tags, reading_ease, repetition_ratio
+
+VARIED = ("Mara crossed the harbour before dawn. The keeper had left a lantern burning in the boathouse, "
+          "and its light shivered on the black water. \"You came back,\" he said. She did not answer him.")
+LOOP = " ".join(["The tide rolled in over the broken pier."] * 40)
+
+
+def test_metrics():
+    assert repetition_ratio(VARIED) == 0.0
+    assert repetition_ratio(LOOP) > 0.9
+    assert repetition_ratio("too short") == 0.0
+    assert dialogue_ratio('"Go," she said.') == pytest.approx(3 / 15)
+    assert dialogue_ratio("") == 0.0
+    assert reading_ease("The cat sat. The dog ran.") > reading_ease(
+        "Notwithstanding considerable institutional deliberation, administrative reorganization proceeded")
+    assert leaked_tags("She left.\nFEEDBACK: tighten it\n--- PLOT ---\nPLAN: x FEEDBACK: y") == [
+        "FEEDBACK:", "PLAN:", "--- PLOT ---"]
+
+    metrics = DraftMetrics.measure(f"SCENE DRAFT: {VARIED}")
+    assert metrics.words == 34 and not metrics.leaked_tags  # The leading tag is not a leak
+    assert metrics.summary().startswith("words: 34 | repeated trigrams: 0% | dialogue: 8%")
+
+
+def test_precheck_answers_for_the_editor_only_when_the_draft_clearly_fails():
+    gate = QualityGate(min_words=60)
+    feedback, note = gate.precheck(f"SCENE DRAFT: {LOOP}")
+    assert feedback.startswith("FEEDBACK:\nAutomatic quality check") and note == ""
+    assert "three-word phrases repeat" in feedback and "needs at least" not in feedback
+
+    feedback, _ = gate.precheck(f"SCENE DRAFT: {VARIED}\nPLOT: the end")
+    assert "needs at least 60" in feedback and "PLOT:" in feedback
+    assert gate.precheck(VARIED, sections=2)[0] is None  # A section needs only its share of the words
+
+    feedback, note = QualityGate().precheck(VARIED)
+    assert feedback is None
+    assert "--- DRAFT MEASUREMENTS ---\nwords: 34" in note
+
+
+class ScriptedAgent:
+    def __init__(self, reply):
+        self.reply = reply
+        self.received = []
+
+    def generate_reply(self, messages=None, **kwargs):
+        self.received.append(messages[-1]["content"])
+        return self.reply
+
+
+@pytest.mark.parametrize("sections", [1, 2])
+def test_failing_draft_skips_the_editor_call(sections):
+    gate = QualityGate(min_words=10)
+    agents = {"writer": ScriptedAgent(f"SCENE DRAFT: {LOOP}"), "editor": ScriptedAgent("FEEDBACK: fine"),
+              "reviser": ScriptedAgent(f"SCENE FINAL: {VARIED}")}
+    steps = [
+        PipelineStep("scene", "writer", "SCENE DRAFT", "Write it.", depends_on=("context",), sectioned=True),
+        PipelineStep("feedback", "editor", "FEEDBACK", "Review it.", depends_on=("scene",), sectioned=True,
+                     precheck=lambda artifacts, n: gate.precheck(artifacts["scene"], n)),
+        PipelineStep("scene_final", "reviser", "SCENE FINAL", "Revise it.", depends_on=("scene", "feedback"),
+                     sectioned=True),
+    ]
+    run = ChapterPipeline(agents, steps, sections=sections, max_continuations=0,
+                          cancel_token=CancellationToken()).run("brief", {"context": "ctx"})
+
+    assert agents["editor"].received == []
+    assert run.results["feedback"].prechecked
+    assert "Automatic quality check" in run.results["feedback"].content
+    assert "three-word phrases repeat" in agents["reviser"].received[0]
+
+    # A passing draft reaches the editor with its measurements
+    agents["writer"].reply = f"SCENE DRAFT: {VARIED}"
+    run = ChapterPipeline(agents, steps, sections=sections, max_continuations=0,
+                          cancel_token=CancellationToken()).run("brief", {"context": "ctx"})
+    assert len(agents["editor"].received) == sections
+    assert "--- DRAFT MEASUREMENTS ---" in agents["editor"].received[0]
+    assert not run.results["feedback"].prechecked
@@ -0,0 +1,73 @@
+"""Tests for run-scoped output directories"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from run_store import INDEX_FILE, RunDirectory, latest_run, list_runs, new_run_id, run_path
+
+
+def test_run_id_encodes_date_and_label():
+    run_id = new_run_id("My Book!")
+    assert run_id.endswith("-my-book")
+    assert run_path("/out", run_id) == os.path.join(
+        "/out", "runs", run_id[:4], run_id[4:6], run_id[6:8], run_id)
+
+
+def test_invalid_run_id_is_rejected():
+    with pytest.raises(ValueError):
+        run_path("/out", "../escape")
+
+
+def test_create_writes_layout_manifest_and_catalog(tmp_path):
+    run = RunDirectory.create(str(tmp_path), metadata={"prompt": "A heist", "chapters": 3, "tags": ["x"]})
+    for directory in (run.chapters_dir, run.transcripts_dir, run.metrics_dir):
+        assert os.path.isdir(directory)
+    assert run.read_manifest()["status"] == "running"
+
+    entry = json.loads((tmp_path / INDEX_FILE).read_text())
+    assert entry["run_id"] == run.run_id
+    assert entry["prompt"] == "A heist"
+    assert "tags" not in entry  # Only scalar metadata goes into the catalog
+    assert RunDirectory(str(tmp_path), entry["run_id"]).path == run.path
+
+    manifest = run.finish("completed", chapters_written=3)
+    assert (manifest["status"], manifest["chapters_written"], manifest["prompt"]) == ("completed", 3, "A heist")
+    assert RunDirectory.open(str(tmp_path), run.run_id).read_manifest() == manifest
+
+
+def test_existing_run_is_never_reused(tmp_path):
+    run = RunDirectory.create(str(tmp_path))
+    with pytest.raises(FileExistsError):
+        RunDirectory.create(str(tmp_path), run.run_id)
+    with pytest.raises(FileNotFoundError):
+        RunDirectory.open(str(tmp_path), new_run_id())
+
+
+def test_concurrent_runs_get_separate_directories(tmp_path):
+    def create_and_write(i):
+        run = RunDirectory.create(str(tmp_path), metadata={"book": i})
+        with open(run.chapter_path(1), "w") as f:
+            f.write(f"book {i}")
+        run.write_transcript("chapter_01", [{"name": "writer", "role": "user", "content": f"draft {i}"}])
+        run.write_metrics("chapter_01", {"elapsed": i})
+        return run
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        runs = list(executor.map(create_and_write, range(20)))
+
+    assert len({run.path for run in runs}) == 20
+    for i, run in enumerate(runs):
+        with open(run.chapter_files()[0]) as f:
+            assert f.read() == f"book {i}"
+    assert len(list_runs(str(tmp_path))) == 20
+
+
+def test_list_runs_is_newest_first(tmp_path):
+    assert list_runs(str(tmp_path)) == []
+    assert latest_run(str(tmp_path)) is None
+    first = RunDirectory.create(str(tmp_path))
+    second = RunDirectory.create(str(tmp_path))
+    assert [entry["run_id"] for entry in list_runs(str(tmp_path))] == [second.run_id, first.run_id]
+    assert latest_run(str(tmp_path)).path == second.path
@@ -0,0 +1,149 @@
+"""Tests for scene-beat drafting"""
+import threading
+import time
+
+import pytest
+
+from llm.cancellation import CancellationToken, GenerationCancelled
+from scene_beats import (SceneBeatWriter, format_beats, parse_beats, plan_beats, read_beats, split_passages,
+                         words_per_call)
+
+
+class ScriptedAgent:
+    """Agent stub answering through a function of the message"""
+
+    def __init__(self, name, reply, delay=0.0):
+        self.name = name
+        self.reply = reply
+        self.delay = delay
+        self.received = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def generate_reply(self, messages=None, **kwargs):
+        message = messages[-1]["content"]
+        with self.lock:
+            self.received.append(message)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return self.reply(message)
+
+
+def test_parse_beats_from_lists_and_paragraphs():
+    plot = """PLOT:
+1. Mara arrives at the pier
+   as the storm breaks.
+2) She finds the boat gone.
+- The harbourmaster lies to her."""
+    assert parse_beats(plot) == ["Mara arrives at the pier as the storm breaks.", "She finds the boat gone.",
+                                 "The harbourmaster lies to her."]
+    assert parse_beats("PLOT: The tide turns.\n\nMara leaves.") == ["The tide turns.", "Mara leaves."]
+    assert parse_beats("PLOT: The tide turns.") == ["The tide turns."]
+
+
+def test_plan_beats_fits_every_beat_in_one_call():
+    assert words_per_call(4096) == 2150
+    beats = plan_beats(["Arrival", "Discovery"], target_words=5000, max_words=2000)
+    assert [b.description for b in beats] == ["Arrival (part 1 of 2)", "Arrival (part 2 of 2)",
+                                              "Discovery (part 1 of 2)", "Discovery (part 2 of 2)"]
+    assert all(b.target_words <= 2000 for b in beats) and sum(b.target_words for b in beats) >= 5000
+
+    merged = plan_beats([f"beat {i}" for i in range(1, 8)], target_words=3000, max_words=2000, max_beats=3)
+    assert [b.description for b in merged] == ["beat 1; then beat 2; then beat 3", "beat 4; then beat 5; then beat 6",
+                                               "beat 7"]
+    assert read_beats(format_beats(merged)) == merged
+
+
+def test_split_passages_keeps_whole_paragraphs():
+    text = "\n\n".join(["one two three"] * 5)
+    assert split_passages(text, max_words=7) == ["one two three\n\none two three"] * 2 + ["one two three"]
+
+
+def test_beats_are_drafted_concurrently_and_seams_smoothed():
+    def reply(message):
+        if "TRANSITION" in message:
+            return "TRANSITION: Smoothed ending.\n===\nSmoothed opening."
+        number = message.split("Write ONLY scene ")[1].split(" ")[0]
+        return f"SCENE DRAFT: Opening {number}.\n\nMiddle {number}.\n\nEnding {number}."
+
+    writer = ScriptedAgent("writer", reply, delay=0.05)
+    beats = plan_beats(["Arrival", "Discovery", "Escape"], target_words=3000, max_words=2000)
+    scene_writer = SceneBeatWriter(max_workers=3, cancel_token=CancellationToken())
+
+    scenes = scene_writer.draft(writer, beats, "Chapter 1: The Pier")
+    assert writer.peak == 3
+    assert any("Write ONLY scene 1" in m and "The next scene covers: Discovery" in m for m in writer.received)
+    smoothed = scene_writer.smooth(writer, scenes)
+    assert smoothed[0] == "Opening 1.\n\nMiddle 1.\n\nSmoothed ending."
+    assert smoothed[1] == "Smoothed opening.\n\nMiddle 2.\n\nSmoothed ending."
+    assert smoothed[2] == "Smoothed opening.\n\nMiddle 3.\n\nEnding 3."
+
+
+def test_malformed_transition_keeps_the_draft():
+    writer = ScriptedAgent("writer", lambda message: "TRANSITION: one merged paragraph")
+    scenes = ["A.\n\nB.", "C.\n\nD."]
+    assert SceneBeatWriter(cancel_token=CancellationToken()).smooth(writer, scenes) == scenes
+
+
+def test_revision_runs_passage_by_passage_and_stops_when_cancelled():
+    reviser = ScriptedAgent("writer_final", lambda m: "SCENE FINAL: " + m.split("---\n")[-1].split("\n\n")[0].upper())
+    draft = "\n\n".join(f"paragraph {i} " + "word " * 10 for i in range(4))
+    revised = SceneBeatWriter(cancel_token=CancellationToken()).revise(reviser, draft, "FEEDBACK: louder", "ctx", 25)
+    assert len(reviser.received) == 2 and all("FEEDBACK: louder" in m for m in reviser.received)
+    assert revised.startswith("PARAGRAPH 0")
+
+    token = CancellationToken()
+    token.cancel("SIGTERM")
+    with pytest.raises(GenerationCancelled):
+        SceneBeatWriter(cancel_token=token).revise(reviser, draft, "FEEDBACK", "ctx", 25)
+
+
+def test_book_generator_drafts_by_scene_beats(tmp_path, monkeypatch):
+    from book_generator import BookGenerator
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEN_MAX_CHAPTER_LENGTH", "1000")
+    monkeypatch.setenv("GEN_MAX_TOKENS", "512")
+    from config import reload_settings
+    reload_settings()
+
+    def writer(message):
+        if "TRANSITION" in message:
+            return "TRANSITION: The wind rose.\n===\nShe ran."
+        number = message.split("Write ONLY scene ")[1].split(" ")[0]
+        return "SCENE DRAFT: " + "\n\n".join(f"Scene {number} paragraph {i} " + "tide " * 80 for i in range(3))
+
+    replies = {
+        "memory_keeper": lambda m: "MEMORY UPDATE: Nothing yet.",
+        "story_planner": lambda m: "PLAN: Open on the pier.",
+        "setting_builder": lambda m: "SETTING: A broken pier.",
+        "character_agent": lambda m: "CHARACTER: Mara hesitates.",
+        "plot_agent": lambda m: "PLOT:\n1. Mara arrives.\n2. The boat is gone.",
+        "writer": writer,
+        "editor": lambda m: "FEEDBACK: Approved.",
+        "writer_final": lambda m: "SCENE FINAL: " + m.split("---\n")[-1].split("\n\nYour task")[0],
+    }
+    agents = {name: ScriptedAgent(name, reply) for name, reply in replies.items()}
+    agents["user_proxy"] = ScriptedAgent("user_proxy", lambda m: "")
+    outline = [{"chapter_number": 1, "title": "The Pier", "prompt": "Key Events:\n- Arrival"}]
+
+    try:
+        generator = BookGenerator(agents, {}, outline, scene_beats=True)
+        monkeypatch.setattr(generator, "_get_writer_final", lambda: agents["writer_final"])
+        generator.generate_chapter(1, outline[0]["prompt"])
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+    assert "beats" in generator.step_timings[1]
+    scenes = [m for m in agents["writer"].received if "Write ONLY scene" in m]
+    assert len(scenes) == 4 and "Chapter 1: The Pier" in scenes[0]  # 1000 words at 268 words per call
+    assert any("Mara arrives. (part 2 of 2)" in m for m in scenes)
+    assert len(agents["writer_final"].received) > 1  # Revised passage by passage
+    with open(generator.run.chapter_path(1), encoding="utf-8") as f:
+        chapter = f.read()
+    assert "Scene 1 paragraph 0" in chapter and "Scene 4 paragraph 2" in chapter and "She ran." in chapter
@@ -0,0 +1,42 @@
+"""Tests for group chat transcript windowing"""
+from transcript_window import TranscriptWindow
+
+DRAFT = "SCENE DRAFT: " + " ".join(["word"] * 5000)
+EDITED = "EDITED_SCENE: " + " ".join(["edited"] * 5000)
+
+
+def _history():
+    return [
+        {"role": "user", "name": "user_proxy", "content": "Chapter 1: Write it."},
+        {"role": "user", "name": "story_planner", "content": "PLAN: Three beats."},
+        {"role": "user", "name": "writer", "content": DRAFT},
+        {"role": "user", "name": "editor", "content": "FEEDBACK: Tighten.\n" + EDITED},
+    ]
+
+
+def test_superseded_drafts_become_references():
+    """Only the latest draft is sent in full; earlier ones shrink to a reference"""
+    window = TranscriptWindow(summary_words=5)
+    windowed = window.apply("writer_final", _history())
+
+    assert windowed[2]["content"].startswith("[SCENE DRAFT from writer superseded")
+    assert "(5000 words)" in windowed[2]["content"]
+    assert windowed[3]["content"] == _history()[3]["content"]
+    assert window.turns[0].bytes_sent < window.turns[0].bytes_full / 1.5
+
+
+def test_visibility_rules_filter_senders():
+    """Agents with a visibility rule only see the task and allowed senders"""
+    window = TranscriptWindow({"story_planner": {"user_proxy"}})
+    windowed = window.apply("story_planner", _history())
+    assert [m["name"] for m in windowed] == ["user_proxy", "story_planner"]  # Task and its own turn
+    assert len(window.apply("writer", _history())) == 4
+
+
+def test_turns_are_recorded_in_report():
+    """Each applied turn records the bytes sent with and without windowing"""
+    window = TranscriptWindow()
+    window.apply("writer_final", _history())
+    assert len(window.turns) == 1
+    assert window.turns[0].bytes_sent < window.turns[0].bytes_full
+    assert "Total:" in window.report()
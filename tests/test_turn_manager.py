@@ -0,0 +1,42 @@
+"""Tests for the local round-robin turn manager"""
+from unittest.mock import patch
+
+import autogen
+import pytest
+
+from transcript_window import TranscriptWindow
+from turn_manager import LocalTurnManager
+
+
+def _agent(name, text):
+    agent = autogen.ConversableAgent(name, llm_config=False, human_input_mode="NEVER")
+    agent.seen = []
+    agent.register_reply([autogen.Agent, None], lambda self, messages=None, sender=None, config=None:
+                         (agent.seen.append(list(messages)) or True, text))
+    return agent
+
+
+def test_round_robin_transcript():
+    """Speakers reply in order and the transcript uses group-chat message format"""
+    agents = [_agent("user_proxy", ""), _agent("story_planner", "PLAN: beats"), _agent("writer", "SCENE FINAL: text")]
+    messages = LocalTurnManager(agents, max_round=3).run("Chapter 2: Retry")
+
+    assert [(m["name"], m["content"]) for m in messages] == [
+        ("user_proxy", "Chapter 2: Retry"), ("story_planner", "PLAN: beats"), ("writer", "SCENE FINAL: text")]
+    assert agents[2].seen[0][-1] == {"role": "user", "name": "story_planner", "content": "PLAN: beats"}
+
+
+def test_no_llm_orchestration_and_window_applied():
+    """No GroupChatManager is built, and the window filters each speaker's view"""
+    agents = [_agent("user_proxy", ""), _agent("story_planner", "PLAN: beats"), _agent("writer", "SCENE FINAL: text")]
+    window = TranscriptWindow({"writer": {"user_proxy"}})
+    with patch("autogen.GroupChatManager") as manager_cls:
+        LocalTurnManager(agents, max_round=3, window=window).run("Chapter 2: Retry")
+    manager_cls.assert_not_called()
+    assert [m["name"] for m in agents[2].seen[0]] == ["user_proxy"]
+    assert len(window.turns) == 2
+
+
+def test_requires_a_speaker():
+    with pytest.raises(ValueError):
+        LocalTurnManager([_agent("user_proxy", "")], max_round=3)
@@ -0,0 +1,94 @@
+"""Bounded transcript windows for group chat turns
+
+Each agent in a GroupChat is sent the whole accumulated history on every
+turn. A TranscriptWindow rewrites that history just before an agent replies:
+drafts superseded by a later draft collapse to a short reference, agents only
+see the senders they are allowed to, and the bytes sent per turn are recorded.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Tags marking full chapter text; only the most recent one is sent in full
+DRAFT_TAGS = ("SCENE DRAFT:", "EDITED_SCENE:", "SCENE FINAL:")
+
+
+@dataclass
+class TurnStats:
+    """Size of one agent turn before and after windowing"""
+    agent: str
+    messages: int
+    bytes_full: int
+    bytes_sent: int
+
+
+def _content_bytes(messages: List[Dict]) -> int:
+    return sum(len(m["content"].encode("utf-8")) for m in messages if isinstance(m.get("content"), str))
+
+
+def _draft_tag(content: str) -> Optional[str]:
+    """The draft tag in a message, if it carries chapter text"""
+    for tag in DRAFT_TAGS:
+        if tag in content:
+            return tag
+    return None
+
+
+class TranscriptWindow:
+    """Message-windowing policy applied to every agent turn
+
+    Args:
+        visibility: Agent name -> senders whose messages it may see. Agents not
+            listed see every sender. The opening task message is always kept.
+        summary_words: Words of a superseded draft kept as its summary
+    """
+
+    def __init__(self, visibility: Optional[Dict[str, Set[str]]] = None, summary_words: int = 40):
+        self.visibility = visibility or {}
+        self.summary_words = summary_words
+        self.turns: List[TurnStats] = []
+
+    def _supersede(self, message: Dict, tag: str) -> Dict:
+        """Replace a superseded draft with a reference and a short summary"""
+        content = message["content"]
+        text = content.split(tag, 1)[1].split()
+        sender = message.get("name", "unknown")
+        summary = " ".join(text[:self.summary_words])
+        reference = f"[{tag.rstrip(':')} from {sender} superseded by a later draft ({len(text)} words). Opening: {summary}...]"
+        return {**message, "content": reference}
+
+    def apply(self, agent_name: str, messages: List[Dict]) -> List[Dict]:
+        """Window the history an agent is about to reply to"""
+        allowed = self.visibility.get(agent_name)
+        visible = [
+            m for i, m in enumerate(messages)
+            if i == 0 or allowed is None or m.get("name") in allowed
+            or m.get("name") == agent_name or m.get("role") == "assistant"  # The agent's own turns
+        ]
+
+        latest_draft = max(
+            (i for i, m in enumerate(visible) if isinstance(m.get("content"), str) and _draft_tag(m["content"])),
+            default=None
+        )
+        windowed = []
+        for i, message in enumerate(visible):
+            content = message.get("content")
+            tag = _draft_tag(content) if isinstance(content, str) else None
+            windowed.append(self._supersede(message, tag) if tag and i != latest_draft else message)
+
+        stats = TurnStats(agent_name, len(windowed), _content_bytes(messages), _content_bytes(windowed))
+        self.turns.append(stats)
+        logger.info(f"Turn {len(self.turns)} -> {agent_name}: sent {stats.bytes_sent} bytes "
+                    f"({stats.bytes_full} without windowing)")
+        return windowed
+
+    def report(self) -> str:
+        """Bytes sent per turn, for logs and benchmarks"""
+        lines = [f"{i}. {t.agent}: {t.bytes_sent} bytes sent ({t.bytes_full} unwindowed, {t.messages} messages)"
+                 for i, t in enumerate(self.turns, 1)]
+        total_sent = sum(t.bytes_sent for t in self.turns)
+        total_full = sum(t.bytes_full for t in self.turns)
+        lines.append(f"Total: {total_sent} bytes sent ({total_full} unwindowed)")
+        return "\n".join(lines)
@@ -0,0 +1,74 @@
+"""Round-robin turn taking without an LLM-backed GroupChatManager
+
+GroupChatManager carries its own model client even when speakers are chosen
+round-robin. LocalTurnManager cycles through the agents in order, builds each
+agent's view of the conversation and asks it for a reply; orchestration never
+calls an LLM.
+"""
+import logging
+import time
+from typing import Dict, List, Optional
+
+from llm.reasoning import split_reasoning
+from transcript_window import TranscriptWindow
+
+logger = logging.getLogger(__name__)
+
+
+class LocalTurnManager:
+    """Drive a fixed-order conversation between agents
+
+    Args:
+        agents: Speakers in turn order; the first agent opens the conversation
+        max_round: Total messages including the opening one, as in GroupChat
+        window: Optional transcript window applied to every turn
+    """
+
+    def __init__(self, agents: List, max_round: int, window: Optional[TranscriptWindow] = None):
+        if len(agents) < 2:
+            raise ValueError("LocalTurnManager needs an initiator and at least one speaker")
+        self.agents = agents
+        self.max_round = max_round
+        self.window = window
+        self.messages: List[Dict] = []
+        self.orchestration_time = 0.0  # Time spent outside agent replies
+
+    def _view_for(self, agent) -> List[Dict]:
+        """The conversation as the agent sees it: its own turns as assistant messages"""
+        view = [
+            {"role": "assistant" if m["name"] == agent.name else "user", "name": m["name"], "content": m["content"]}
+            for m in self.messages
+        ]
+        return self.window.apply(agent.name, view) if self.window else view
+
+    def run(self, message: str) -> List[Dict]:
+        """Send the opening message and let each speaker reply in turn
+
+        Returns:
+            List[Dict]: The transcript in group-chat message format
+        """
+        start = time.perf_counter()
+        reply_time = 0.0
+        initiator, speakers = self.agents[0], self.agents[1:]
+        self.messages = [{"role": "user", "name": initiator.name, "content": message}]
+
+        for turn in range(self.max_round - 1):
+            speaker = speakers[turn % len(speakers)]
+            view = self._view_for(speaker)
+
+            reply_start = time.perf_counter()
+            reply = speaker.generate_reply(messages=view)
+            reply_time += time.perf_counter() - reply_start
+
+            if isinstance(reply, dict):
+                reply = reply.get("content")
+            reply = split_reasoning(str(reply or ""))[0]  # Reasoning traces are not re-sent to later speakers
+            if not reply:
+                logger.warning(f"{speaker.name} returned no reply; ending conversation")
+                break
+            self.messages.append({"role": "user", "name": speaker.name, "content": reply})
+
+        self.orchestration_time = time.perf_counter() - start - reply_time
+        logger.debug(f"Local turn manager: {len(self.messages)} messages, "
+                     f"{self.orchestration_time * 1000:.2f} ms orchestration overhead")
+        return self.messages